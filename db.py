@@ -1,4 +1,5 @@
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 import os
 from dotenv import load_dotenv
 from typing import Union
@@ -10,7 +11,7 @@ MONGO_URI = os.getenv("MONGO_URL")
 
 # Connect to MongoDB
 client = MongoClient(MONGO_URI)
-db = client["service_app"]
+db = client[os.getenv("MONGO_DB_NAME", "service_app")]
 
 
 class RoleFilteredCollection:
@@ -56,7 +57,76 @@ support_tickets_collection = db["support_tickets"]
 # admins_collection = db["admins"]
 notifications_collection = db["notifications"]
 messages_collection = db["messages"]
+ledger_collection = db["ledger_entries"]
+wallet_snapshots_collection = db["wallet_snapshots"]
+jobs_collection = db["jobs"]
+payout_batches_collection = db["payout_batches"]
+reconciliation_reports_collection = db["reconciliation_reports"]
+earnings_daily_collection = db["earnings_daily"]
+migration_runs_collection = db["migration_runs"]
+cache_versions_collection = db["cache_versions"]
+upload_intents_collection = db["upload_intents"]
+image_assets_collection = db["image_assets"]
+
+# Unique over services' lower-cased names; bulk imports upsert by name_lower and rely on it
+SERVICE_NAME_UNIQUE_INDEX = "name_lower_unique"
 
 # Function to get database
 def get_db():
     return db
+
+
+def ensure_indexes():
+    """Create the indexes the handlers rely on (safe to call on every startup)"""
+    wallets_collection.create_index("user_id", unique=True)
+    wallets_collection.create_index("pending_entries")
+    ledger_collection.create_index([("account", 1), ("seq", 1)], unique=True)
+    ledger_collection.create_index([("journal_id", 1), ("account", 1)], unique=True)
+    wallet_snapshots_collection.create_index([("account", 1), ("seq", -1)], unique=True)
+    # audit_snapshots reads pending snapshots in seq order; this replaces the audit_status-only index
+    wallet_snapshots_collection.create_index([("audit_status", 1), ("seq", 1)])
+    if "audit_status_1" in wallet_snapshots_collection.index_information():
+        wallet_snapshots_collection.drop_index("audit_status_1")
+    transactions_collection.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+    transactions_collection.create_index([("user_id", 1), ("transaction_type", 1), ("created_at", -1), ("_id", -1)])
+    transactions_collection.create_index([("transaction_type", 1), ("status", 1), ("created_at", 1)])
+    transactions_collection.create_index("payout_batch", sparse=True)
+    transactions_collection.create_index([("transaction_type", 1), ("status", 1), ("reconcile_after", 1)])
+    transactions_collection.create_index("reference")
+    reconciliation_reports_collection.create_index("started_at")
+    payout_batches_collection.create_index("batch_reference", unique=True)
+    payout_batches_collection.create_index("status")
+    bookings_collection.create_index([("provider_id", 1), ("created_at", 1), ("status", 1)])
+    earnings_daily_collection.create_index([("provider_id", 1), ("day", 1)], unique=True)
+    earnings_daily_collection.create_index("day")
+    reviews_collection.create_index([("provider_id", 1), ("created_at", 1), ("_id", 1), ("rating", 1)])
+    reviews_collection.create_index([("provider_id", 1), ("rating", 1), ("created_at", 1), ("_id", 1)])
+    # Multikey (services_offered is an array): it selects and orders providers by
+    # service, but MongoDB still fetches each matched document
+    users_collection.create_index([("services_offered", 1), ("role", 1), ("_id", 1)])
+    users_collection.create_index("email", unique=True)
+    # Admin lists filter on these and page newest first by _id
+    users_collection.create_index([("role", 1), ("_id", -1)])
+    # Anchored-prefix admin search on normalized copies of email, name and phone
+    users_collection.create_index([("email_lower", 1), ("_id", 1)])
+    users_collection.create_index([("name_lower", 1), ("_id", 1)])
+    users_collection.create_index([("phone_digits", 1), ("_id", 1)])
+    bookings_collection.create_index([("status", 1), ("_id", -1)])
+    transactions_collection.create_index([("status", 1), ("_id", -1)])
+    services_collection.create_index([("name_lower", 1), ("_id", 1)])
+    try:
+        # Partial, so services not yet backfilled by the service_name_lower migration are left out
+        services_collection.create_index("name_lower", unique=True, name=SERVICE_NAME_UNIQUE_INDEX,
+                                         partialFilterExpression={"name_lower": {"$type": "string"}})
+    except OperationFailure as e:
+        # Existing services share a name; bulk imports stay disabled until they are merged
+        print(f"Unique service name index not created: {str(e)}")
+    services_collection.create_index([("price", 1), ("_id", 1)])
+    services_collection.create_index([("name", "text"), ("description", "text")],
+                                     weights={"name": 10, "description": 1}, name="service_text")
+    # Intents are useless once expired; let Mongo remove them a day later
+    upload_intents_collection.create_index("expires_at", expireAfterSeconds=86400)
+    image_assets_collection.create_index("public_id", unique=True)
+    migration_runs_collection.create_index([("migration", 1), ("created_at", -1)])
+    jobs_collection.create_index([("status", 1), ("run_at", 1)])
+    jobs_collection.create_index([("status", 1), ("locked_until", 1)])
@@ -1,51 +1,190 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
 from db import users_collection, providers_collection, bookings_collection, transactions_collection
 from bson import ObjectId
+from services.pagination import keyset_page
+from handlers.wallet_handler import approve_withdrawal
 
 def serialize_document(document):
     """Convert MongoDB document ObjectId to string."""
     document["_id"] = str(document["_id"])
     return document
 
-def get_all_users():
-    """Retrieve all users (Admin only)"""
-    users = users_collection.find({}, {"password": 0})  # Exclude password field
-    return [serialize_document(user) for user in users]
+# Admin list endpoints page through these collections newest first by _id, so
+# every page is an index seek; csv/ndjson exports stream the same query.
+ADMIN_LIST_PAGE_SIZE = 50
+ADMIN_LIST_BATCH_SIZE = 500
+ADMIN_LIST_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+# Never returned, whatever fields are asked for
+ADMIN_HIDDEN_FIELDS = ["password", "gallery"]
+ADMIN_LISTS = {
+    "users": {
+        "collection": users_collection,
+        "query": {},
+        "filters": ["role", "is_available"],
+        "columns": ["_id", "full_name", "email", "role", "phone_number", "address", "is_available", "created_at"]
+    },
+    "providers": {
+        "collection": users_collection,
+        "query": {"role": "provider"},
+        "filters": ["is_available"],
+        "columns": ["_id", "full_name", "email", "phone_number", "address", "is_available", "rating",
+                    "base_price", "created_at"]
+    },
+    "bookings": {
+        "collection": bookings_collection,
+        "query": {},
+        "filters": ["status", "user_id", "provider_id"],
+        "columns": ["_id", "user_id", "provider_id", "service_id", "status", "price", "scheduled_date", "created_at"]
+    },
+    "transactions": {
+        "collection": transactions_collection,
+        "query": {},
+        "filters": ["transaction_type", "status", "user_id"],
+        "columns": ["_id", "user_id", "amount", "transaction_type", "status", "reference", "description",
+                    "created_at"]
+    }
+}
 
-def get_all_providers():
-    """Retrieve all service providers"""
-    providers = providers_collection.find({}, {"password": 0})
-    return [serialize_document(provider) for provider in providers]
 
-def get_all_bookings():
-    """Retrieve all bookings"""
-    bookings = bookings_collection.find()
-    return [serialize_document(booking) for booking in bookings]
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
 
-def get_all_wallet_transactions():
-    """Retrieve all wallet transactions"""
-    transactions = transactions_collection.find()
-    return [serialize_document(transaction) for transaction in transactions]
 
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, (datetime, ObjectId)):
+        return _json_default(value)
+    return value
 
-def approve_withdrawal(withdrawal_id: str):
-    """Approve provider withdrawal request"""
-    try:
-        withdrawal_obj_id = ObjectId(withdrawal_id)
-    except Exception:
-        return {"error": "Invalid withdrawal ID format"}
 
-    transaction = transactions_collection.find_one({"_id": withdrawal_obj_id})
-    if not transaction:
-        return {"error": "Transaction not found"}
+def _admin_list_query(name: str, filters: dict, created_from: Optional[datetime],
+                      created_to: Optional[datetime]) -> dict:
+    spec = ADMIN_LISTS[name]
+    query = dict(spec["query"])
+    query.update({field: value for field, value in filters.items() if field in spec["filters"] and value is not None})
+    # _id embeds the creation time, which every document has (created_at is missing on older users)
+    if created_from or created_to:
+        query["_id"] = {}
+        if created_from:
+            query["_id"]["$gte"] = ObjectId.from_datetime(created_from)
+        if created_to:
+            # ObjectIds only carry whole seconds, so include all of created_to's second
+            query["_id"]["$lt"] = ObjectId.from_datetime(created_to + timedelta(seconds=1))
+    return query
 
-    if transaction.get("status") != "pending":
-        return {"error": "Transaction is not pending"}
 
-    result = transactions_collection.update_one(
-        {"_id": withdrawal_obj_id, "status": "pending"},
-        {"$set": {"status": "approved"}}
+def _is_hidden(field: str) -> bool:
+    # A dotted path such as gallery.url reads inside the hidden field
+    return field.split(".")[0] in ADMIN_HIDDEN_FIELDS
+
+
+def _admin_list_projection(fields: Optional[List[str]]) -> dict:
+    if not fields:
+        return dict.fromkeys(ADMIN_HIDDEN_FIELDS, 0)
+    projection = {field: 1 for field in fields if not _is_hidden(field) and not field.startswith("$")}
+    # An empty projection would return whole documents, hidden fields included
+    return projection or {"_id": 1}
+
+
+def get_admin_page(name: str, filters: dict, fields: Optional[List[str]] = None,
+                   created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                   limit: int = ADMIN_LIST_PAGE_SIZE, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """One page of an admin list, newest first, and the cursor of the next page.
+
+    Raises ValueError if the cursor is invalid.
+    """
+    documents, next_cursor = keyset_page(
+        ADMIN_LISTS[name]["collection"],
+        _admin_list_query(name, filters, created_from, created_to),
+        [],
+        limit,
+        cursor=cursor,
+        direction=-1,
+        projection=_admin_list_projection(fields)
+    )
+    return [serialize_document(document) for document in documents], next_cursor
+
+
+def stream_admin_list(name: str, fmt: str, filters: dict, fields: Optional[List[str]] = None,
+                      created_from: Optional[datetime] = None, created_to: Optional[datetime] = None) -> Iterator[str]:
+    """Yield a whole admin list as csv or ndjson, one row at a time straight from the Mongo cursor"""
+    columns = fields or ADMIN_LISTS[name]["columns"]
+    columns = [column for column in columns if not _is_hidden(column)]
+    cursor = ADMIN_LISTS[name]["collection"].find(
+        _admin_list_query(name, filters, created_from, created_to),
+        # csv rows only hold the columns, so only those are read
+        _admin_list_projection(columns if fmt == "csv" else fields)
+    ).sort("_id", -1).batch_size(ADMIN_LIST_BATCH_SIZE)
+
+    if fmt == "ndjson":
+        for document in cursor:
+            yield json.dumps(document, default=_json_default) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+
+    def drain() -> str:
+        row = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return row
+
+    writer.writeheader()
+    yield drain()
+    for document in cursor:
+        writer.writerow({key: _csv_value(value) for key, value in document.items()})
+        yield drain()
+
+
+USER_SEARCH_FIELDS = {
+    "email": "email_lower",
+    "name": "name_lower",
+    "phone": "phone_digits"
+}
+PHONE_QUERY_PATTERN = re.compile(r"^\+?[\d\s()-]+$")
+
+
+def search_users(q: str, by: str = "auto", role: Optional[str] = None, is_available: Optional[bool] = None,
+                 created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                 fields: Optional[List[str]] = None, limit: int = 20,
+                 cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Users whose email, name or phone starts with `q`, in that field's order.
+
+    `by` picks the field; "auto" uses email when q contains @, phone when q looks
+    like a number and name otherwise. The match is an anchored prefix on the
+    normalized field, so it is a range scan of that field's index. Raises
+    ValueError for an unusable query or cursor.
+    """
+    if by == "auto":
+        by = "email" if "@" in q else "phone" if PHONE_QUERY_PATTERN.match(q) else "name"
+    if by not in USER_SEARCH_FIELDS:
+        raise ValueError(f"by must be auto or one of: {', '.join(USER_SEARCH_FIELDS)}")
+    prefix = re.sub(r"\D", "", q) if by == "phone" else q.strip().lower()
+    if not prefix:
+        raise ValueError("Search text is empty")
+
+    field = USER_SEARCH_FIELDS[by]
+    query = _admin_list_query("users", {"role": role, "is_available": is_available}, created_from, created_to)
+    # re.escape only backslashes punctuation, which Mongo still takes as literal
+    # prefix characters, so the index bounds stay tight (tests/test_user_search.py)
+    query[field] = {"$regex": "^" + re.escape(prefix)}
+    documents, next_cursor = keyset_page(
+        users_collection, query, [field], limit, cursor=cursor, direction=1,
+        # The cursor is built from the sort field, so it is always read
+        projection=_admin_list_projection(fields and [*fields, field])
     )
-    return {"success": result.modified_count > 0}
+    return [serialize_document(document) for document in documents], next_cursor
+
 
 def reject_withdrawal(withdrawal_id: str):
     """Reject provider withdrawal request"""
@@ -1,11 +1,25 @@
+import re
 from datetime import timedelta
 from db import users_collection
 from services.auth_service import hash_password, verify_password, create_access_token, authenticate_user
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from services.email_service import EmailService
 
 email_service = EmailService()
 
+def search_fields(data: dict) -> dict:
+    """Normalized copies of email, name and phone that admin user search matches prefixes against"""
+    fields = {}
+    if data.get("email"):
+        fields["email_lower"] = data["email"].strip().lower()
+    if data.get("full_name"):
+        fields["name_lower"] = data["full_name"].strip().lower()
+    if data.get("phone_number"):
+        fields["phone_digits"] = re.sub(r"\D", "", data["phone_number"])
+    return fields
+
+
 # Register user or provider
 def register_user(data: dict):
     existing_user = users_collection.find_one({"email": data["email"]})
@@ -15,7 +29,12 @@ def register_user(data: dict):
     data["password"] = hash_password(data["password"])
     data["role"] = data.get("role", "user")
     data["created_at"] = data.get("created_at")
-    result = users_collection.insert_one(data)
+    data.update(search_fields(data))
+    try:
+        result = users_collection.insert_one(data)
+    except DuplicateKeyError:
+        # Registered concurrently since the check above
+        return {"error": "Email already registered"}
     return {"message": "User registered successfully", "user_id": str(result.inserted_id)}
 
 # with email
@@ -67,7 +86,11 @@ def get_current_user(user_id: str):
 
 # Update user profile
 def update_profile(user_id: str, update_data: dict):
-    users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
+    # Fields left out of the request stay as they are
+    update_data = {field: value for field, value in update_data.items() if value is not None}
+    update_data.update(search_fields(update_data))
+    if update_data:
+        users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": update_data})
     return {"message": "Profile updated successfully"}
 
 
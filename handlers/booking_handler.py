@@ -1,13 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
-from db import bookings_collection, services_collection
+from db import bookings_collection
 from models.booking import BookingStatus
 from bson import ObjectId
+from pymongo import ReturnDocument
+from handlers.earnings_handler import EARNING_STATUSES, record_booking_transition
+from services.catalog_cache import service_catalog
+
+EARNINGS_WINDOWS = {"week": 7, "month": 30, "year": 365}
 
 # Create a new booking
 def create_booking(booking_data: dict) -> Optional[dict]:
     # Get the service to get the price
-    service = services_collection.find_one({"_id": ObjectId(booking_data["service_id"])})
+    service = service_catalog.get(booking_data["service_id"])
     if not service:
         return None
 
@@ -19,6 +24,7 @@ def create_booking(booking_data: dict) -> Optional[dict]:
 
     result = bookings_collection.insert_one(booking_data)
     if result.inserted_id:
+        record_booking_transition({**booking_data, "status": None}, booking_data["status"])
         booking_data["_id"] = str(result.inserted_id)
         return booking_data
     return None
@@ -47,11 +53,13 @@ def get_provider_bookings(provider_id: str) -> list:
 # Update booking status
 def update_booking_status(booking_id: str, status: BookingStatus) -> Optional[dict]:
     try:
-        result = bookings_collection.update_one(
+        previous = bookings_collection.find_one_and_update(
             {"_id": ObjectId(booking_id)},
-            {"$set": {"status": status.value}}
+            {"$set": {"status": status.value}},
+            return_document=ReturnDocument.BEFORE
         )
-        if result.modified_count:
+        if previous and previous.get("status") != status.value:
+            record_booking_transition(previous, status.value)
             return get_booking_by_id(booking_id)
         return None
     except Exception:
@@ -64,7 +72,58 @@ def cancel_booking(booking_id: str) -> Optional[dict]:
 # Delete a booking
 def delete_booking(booking_id: str) -> bool:
     try:
-        result = bookings_collection.delete_one({"_id": ObjectId(booking_id)})
-        return result.deleted_count > 0
+        deleted = bookings_collection.find_one_and_delete({"_id": ObjectId(booking_id)})
+        if not deleted:
+            return False
+        record_booking_transition(deleted, None)
+        return True
     except Exception:
-        return False
\ No newline at end of file
+        return False
+
+# Dashboard numbers for a provider in one round trip
+def get_provider_booking_summary(provider_id: str, now: Optional[datetime] = None) -> dict:
+    """Booking counts per status and earnings for each window in EARNINGS_WINDOWS.
+
+    The outer $match is served by the (provider_id, created_at, status) index and
+    every figure is computed by a single $facet pass over the matched bookings.
+    """
+    now = now or datetime.utcnow()
+    starts = {period: now - timedelta(days=days) for period, days in EARNINGS_WINDOWS.items()}
+
+    earnings_group = {"_id": None}
+    for period, start in starts.items():
+        in_window = {"$gte": ["$created_at", start]}
+        earnings_group[f"{period}_earnings"] = {"$sum": {"$cond": [in_window, "$price", 0]}}
+        earnings_group[f"{period}_bookings"] = {"$sum": {"$cond": [in_window, 1, 0]}}
+
+    result = list(bookings_collection.aggregate([
+        {"$match": {"provider_id": provider_id}},
+        {"$project": {"status": 1, "created_at": 1, "price": 1}},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "earnings": [
+                {"$match": {
+                    "status": {"$in": EARNING_STATUSES},
+                    "created_at": {"$gte": min(starts.values())}
+                }},
+                {"$group": earnings_group}
+            ]
+        }}
+    ]))
+    facets = result[0] if result else {"by_status": [], "earnings": []}
+
+    status_counts = {row["_id"]: row["count"] for row in facets["by_status"] if row["_id"] is not None}
+    totals = facets["earnings"][0] if facets["earnings"] else {}
+    return {
+        "total_bookings": sum(row["count"] for row in facets["by_status"]),
+        "status_counts": status_counts,
+        "earnings": {
+            period: {
+                "total_earnings": totals.get(f"{period}_earnings", 0),
+                "total_bookings": totals.get(f"{period}_bookings", 0),
+                "start_date": start
+            }
+            for period, start in starts.items()
+        },
+        "as_of": now
+    }
@@ -0,0 +1,112 @@
+import time
+import cloudinary
+import cloudinary.utils
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from db import upload_intents_collection, users_collection, services_collection
+from services.catalog_cache import service_catalog
+from services.cloudinary_service import (
+    CLOUDINARY_UPLOAD_URL,
+    EAGER_VARIANTS,
+    sign_upload_params,
+    verify_upload_signature,
+    get_image_resource,
+    delete_image
+)
+from services.upload_service import MAX_IMAGE_BYTES
+
+# Clients upload straight to Cloudinary with parameters we sign. Each signature
+# pins the exact public_id, so the completion call can only attach the asset
+# that was uploaded for that intent.
+DIRECT_UPLOAD_TTL_SECONDS = 600
+DIRECT_UPLOAD_FORMATS = ["jpg", "png", "webp", "gif", "avif", "heic"]
+DIRECT_UPLOAD_TARGETS = {
+    "profile": "profile_images",
+    "service": "services"
+}
+
+
+def create_upload_intent(user: dict, target: str, target_id: Optional[str] = None,
+                         api_secret: Optional[str] = None, api_key: Optional[str] = None) -> dict:
+    """Issue short-lived signed parameters for one direct upload"""
+    if target not in DIRECT_UPLOAD_TARGETS:
+        return {"error": f"target must be one of: {', '.join(DIRECT_UPLOAD_TARGETS)}"}
+    if target == "service":
+        if user.get("role") != "admin":
+            return {"error": "Only admins can upload service images"}
+        if not target_id or not service_catalog.get(target_id):
+            return {"error": "Service not found"}
+
+    intent_id = ObjectId()
+    now = datetime.utcnow()
+    params = {
+        "public_id": f"{DIRECT_UPLOAD_TARGETS[target]}/{intent_id}",
+        "timestamp": int(time.time()),
+        "allowed_formats": ",".join(DIRECT_UPLOAD_FORMATS),
+        "eager": cloudinary.utils.build_eager(EAGER_VARIANTS),
+        "eager_async": "true"
+    }
+    upload_intents_collection.insert_one({
+        "_id": intent_id,
+        "user_id": str(user["_id"]),
+        "target": target,
+        "target_id": target_id,
+        "public_id": params["public_id"],
+        "status": "issued",
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=DIRECT_UPLOAD_TTL_SECONDS)
+    })
+
+    return {
+        "intent_id": str(intent_id),
+        "upload_url": CLOUDINARY_UPLOAD_URL,
+        "fields": {
+            **params,
+            "api_key": api_key or cloudinary.config().api_key,
+            "signature": sign_upload_params(params, api_secret)
+        },
+        "max_bytes": MAX_IMAGE_BYTES,
+        "expires_at": now + timedelta(seconds=DIRECT_UPLOAD_TTL_SECONDS)
+    }
+
+
+def complete_upload(user_id: str, intent_id: str, public_id: str, version, signature: str,
+                    api_secret: Optional[str] = None) -> dict:
+    """Verify a finished direct upload and attach its URL to the intent's target"""
+    if not ObjectId.is_valid(intent_id):
+        return {"error": "Upload not found"}
+    intent = upload_intents_collection.find_one({"_id": ObjectId(intent_id), "user_id": user_id})
+    if not intent or intent["status"] != "issued":
+        return {"error": "Upload not found"}
+    if intent["expires_at"] < datetime.utcnow():
+        return {"error": "Upload expired"}
+    if public_id != intent["public_id"] or not verify_upload_signature(public_id, version, signature, api_secret):
+        return {"error": "Invalid upload signature"}
+
+    # The upload response only signs public_id and version, so size and format
+    # are read back from Cloudinary rather than taken from the client
+    resource = get_image_resource(public_id)
+    if "error" in resource:
+        return {"error": resource["error"]}
+    if resource.get("bytes", 0) > MAX_IMAGE_BYTES or resource.get("format") not in DIRECT_UPLOAD_FORMATS:
+        delete_image(public_id)
+        upload_intents_collection.update_one({"_id": intent["_id"]}, {"$set": {"status": "rejected"}})
+        return {"error": "Image is too large or of an unsupported type"}
+
+    claimed = upload_intents_collection.find_one_and_update(
+        {"_id": intent["_id"], "status": "issued"},
+        {"$set": {"status": "completed", "completed_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not claimed:
+        return {"error": "Upload already completed"}
+
+    url = resource["secure_url"]
+    if intent["target"] == "profile":
+        users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": {"profile_image": url}})
+    else:
+        services_collection.update_one({"_id": ObjectId(intent["target_id"])}, {"$set": {"image": url}})
+        service_catalog.bump()
+    return {"url": url, "public_id": public_id}
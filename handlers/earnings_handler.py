@@ -0,0 +1,159 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from db import bookings_collection, earnings_daily_collection
+from models.booking import BookingStatus
+from services.job_queue import job_handler, enqueue_job
+
+# Bookings that count towards a provider's earnings
+EARNING_STATUSES = [BookingStatus.ACCEPTED.value, BookingStatus.COMPLETED.value]
+ROLLUP_FIELDS = ["earnings", "bookings", "completed", "cancelled"]
+SERIES_INTERVALS = ["day", "week", "month"]
+# One rollup row per provider per day, so this bounds a series read
+MAX_SERIES_DAYS = 366
+
+
+def _day(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def _contribution(status: Optional[str], price: float) -> Dict[str, float]:
+    """What one booking in `status` adds to its day's rollup (nothing once deleted)"""
+    if status is None:
+        return dict.fromkeys(ROLLUP_FIELDS, 0)
+    return {
+        "earnings": price if status in EARNING_STATUSES else 0,
+        "bookings": 1,
+        "completed": int(status == BookingStatus.COMPLETED.value),
+        "cancelled": int(status == BookingStatus.CANCELLED.value)
+    }
+
+
+def record_booking_transition(booking: dict, new_status: Optional[str]):
+    """Apply a booking's status change to its daily rollup.
+
+    `booking` is the document as it was before the change (None status for a new
+    booking); `new_status` is None when the booking is deleted. Rollups are keyed
+    by the day the booking was created, matching the dashboard earnings windows.
+    """
+    if not booking.get("provider_id") or not booking.get("created_at"):
+        return
+    price = booking.get("price") or 0
+    before = _contribution(booking.get("status"), price)
+    after = _contribution(new_status, price)
+    delta = {field: after[field] - before[field] for field in ROLLUP_FIELDS if after[field] != before[field]}
+    if not delta:
+        return
+
+    earnings_daily_collection.update_one(
+        {"provider_id": booking["provider_id"], "day": _day(booking["created_at"])},
+        {"$inc": delta, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def request_rollup_backfill(start_date: date, end_date: date, provider_id: Optional[str] = None) -> str:
+    return enqueue_job("earnings_rollup_backfill", {
+        "provider_id": provider_id,
+        "start": datetime.combine(start_date, datetime.min.time()),
+        "end": datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    })
+
+
+@job_handler("earnings_rollup_backfill")
+def run_rollup_backfill(job: dict) -> dict:
+    """Rebuild the rollup rows of [start, end) from the bookings themselves"""
+    payload = job["payload"]
+    # Taken before reading the bookings: a row the live transitions touch from here
+    # on carries a later updated_at and must outlive this rebuild's cleanup
+    rebuilt_at = datetime.utcnow()
+    match = {"created_at": {"$gte": payload["start"], "$lt": payload["end"]}}
+    if payload.get("provider_id"):
+        match["provider_id"] = payload["provider_id"]
+
+    rows = bookings_collection.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "provider_id": "$provider_id",
+                "year": {"$year": "$created_at"},
+                "month": {"$month": "$created_at"},
+                "day": {"$dayOfMonth": "$created_at"}
+            },
+            "earnings": {"$sum": {"$cond": [{"$in": ["$status", EARNING_STATUSES]}, "$price", 0]}},
+            "bookings": {"$sum": 1},
+            "completed": {"$sum": {"$cond": [{"$eq": ["$status", BookingStatus.COMPLETED.value]}, 1, 0]}},
+            "cancelled": {"$sum": {"$cond": [{"$eq": ["$status", BookingStatus.CANCELLED.value]}, 1, 0]}}
+        }}
+    ], allowDiskUse=True)
+
+    operations = []
+    for row in rows:
+        key = row.pop("_id")
+        if not key["provider_id"]:
+            continue
+        operations.append(UpdateOne(
+            {"provider_id": key["provider_id"], "day": datetime(key["year"], key["month"], key["day"])},
+            {"$set": {**row, "updated_at": rebuilt_at, "rebuilt_at": rebuilt_at}},
+            upsert=True
+        ))
+    if operations:
+        earnings_daily_collection.bulk_write(operations, ordered=False)
+
+    # Rows neither this rebuild nor a live transition since it started wrote to
+    # have no bookings behind them any more
+    stale = {"day": {"$gte": payload["start"], "$lt": payload["end"]}, "updated_at": {"$lt": rebuilt_at}}
+    if payload.get("provider_id"):
+        stale["provider_id"] = payload["provider_id"]
+    removed = earnings_daily_collection.delete_many(stale).deleted_count
+
+    return {"rows": len(operations), "removed": removed}
+
+
+def _bucket_start(day: date, interval: str) -> date:
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+def get_earnings_series(provider_id: str, start_date: date, end_date: date, interval: str = "day") -> dict:
+    """Earnings and booking counts per day, week (from Monday) or month between two dates inclusive"""
+    if interval not in SERIES_INTERVALS:
+        return {"error": f"Interval must be one of: {', '.join(SERIES_INTERVALS)}"}
+    if end_date < start_date:
+        return {"error": "end_date must not be before start_date"}
+    if (end_date - start_date).days >= MAX_SERIES_DAYS:
+        return {"error": f"Range cannot exceed {MAX_SERIES_DAYS} days"}
+
+    buckets: Dict[date, dict] = {}
+    day = start_date
+    while day <= end_date:
+        buckets.setdefault(_bucket_start(day, interval), dict.fromkeys(ROLLUP_FIELDS, 0))
+        day += timedelta(days=1)
+
+    rows = earnings_daily_collection.find(
+        {
+            "provider_id": provider_id,
+            "day": {
+                "$gte": datetime.combine(start_date, datetime.min.time()),
+                "$lte": datetime.combine(end_date, datetime.min.time())
+            }
+        },
+        {"_id": 0, "day": 1, **dict.fromkeys(ROLLUP_FIELDS, 1)}
+    )
+    for row in rows:
+        bucket = buckets[_bucket_start(row["day"].date(), interval)]
+        for field in ROLLUP_FIELDS:
+            bucket[field] += row.get(field, 0)
+
+    points: List[dict] = [{"period_start": start.isoformat(), **values} for start, values in sorted(buckets.items())]
+    return {
+        "interval": interval,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "total_earnings": sum(point["earnings"] for point in points),
+        "total_bookings": sum(point["bookings"] for point in points),
+        "points": points
+    }
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime
+from typing import BinaryIO, List, Optional
+from bson import ObjectId
+from starlette.concurrency import run_in_threadpool
+from db import users_collection
+from services.cloudinary_service import with_image_variants, DEFAULT_VARIANT_FORMAT
+from services.image_store import store_image_asset, release_image
+from services.upload_service import IMAGE_UPLOAD_MAX_BYTES, MULTIPART_OVERHEAD_BYTES
+
+# A provider's portfolio is an ordered `gallery` array on their user document,
+# kept out of every provider listing projection and read a slice at a time.
+GALLERY_MAX_IMAGES = 50
+GALLERY_MAX_FILES_PER_UPLOAD = 10
+# Largest Content-Length accepted for one gallery upload request
+GALLERY_UPLOAD_MAX_BYTES = GALLERY_MAX_FILES_PER_UPLOAD * IMAGE_UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES
+# Uploads of one request run in parallel, but never more than this many at once
+GALLERY_UPLOAD_CONCURRENCY = 4
+GALLERY_FOLDER = "provider_galleries"
+
+
+def serialize_gallery_image(entry: dict, image_size: Optional[str] = None,
+                            image_format: str = DEFAULT_VARIANT_FORMAT) -> dict:
+    return with_image_variants({
+        "id": entry["id"],
+        "url": entry["url"],
+        "caption": entry.get("caption"),
+        "created_at": entry["created_at"]
+    }, "url", image_size, image_format)
+
+
+async def _upload_all(images: List[BinaryIO]) -> List[dict]:
+    semaphore = asyncio.Semaphore(GALLERY_UPLOAD_CONCURRENCY)
+
+    async def upload(image: BinaryIO) -> dict:
+        async with semaphore:
+            return await run_in_threadpool(store_image_asset, image, GALLERY_FOLDER)
+
+    # gather keeps the results in upload order
+    return await asyncio.gather(*(upload(image) for image in images))
+
+
+async def add_gallery_images(provider_id: str, images: List[BinaryIO],
+                             captions: Optional[List[str]] = None) -> dict:
+    """Upload images concurrently and append them, in the given order, to the gallery"""
+    if not images:
+        return {"error": "No images provided"}
+    if len(images) > GALLERY_MAX_FILES_PER_UPLOAD:
+        return {"error": f"At most {GALLERY_MAX_FILES_PER_UPLOAD} images can be uploaded at once"}
+    provider = users_collection.find_one({"_id": ObjectId(provider_id)}, {"gallery_count": 1})
+    if provider.get("gallery_count", 0) + len(images) > GALLERY_MAX_IMAGES:
+        return {"error": f"A gallery holds at most {GALLERY_MAX_IMAGES} images"}
+
+    captions = captions or []
+    entries, errors = [], []
+    now = datetime.utcnow()
+    for index, result in enumerate(await _upload_all(images)):
+        if "error" in result:
+            errors.append({"index": index, "error": result["error"]})
+            continue
+        entries.append({
+            "id": str(ObjectId()),
+            "url": result["url"],
+            "public_id": result["public_id"],
+            "caption": captions[index] if index < len(captions) else None,
+            "created_at": now
+        })
+    if not entries:
+        return {"images": [], "errors": errors}
+
+    # The size check is part of the filter, so concurrent uploads cannot push past the limit
+    result = users_collection.update_one(
+        {
+            "_id": ObjectId(provider_id),
+            f"gallery.{GALLERY_MAX_IMAGES - len(entries)}": {"$exists": False}
+        },
+        {"$push": {"gallery": {"$each": entries}}, "$inc": {"gallery_count": len(entries)}}
+    )
+    if result.matched_count == 0:
+        for entry in entries:
+            await run_in_threadpool(release_image, entry["public_id"])
+        return {"error": f"A gallery holds at most {GALLERY_MAX_IMAGES} images"}
+
+    return {"images": [serialize_gallery_image(entry) for entry in entries], "errors": errors}
+
+
+def get_gallery_page(provider_id: str, offset: int = 0, limit: int = 20, image_size: Optional[str] = None,
+                     image_format: str = DEFAULT_VARIANT_FORMAT) -> Optional[dict]:
+    """One slice of a provider's gallery, in display order; None if there is no such provider"""
+    provider = users_collection.find_one(
+        {"_id": ObjectId(provider_id), "role": "provider"},
+        {"gallery": {"$slice": [offset, limit]}, "gallery_count": 1}
+    )
+    if not provider:
+        return None
+    gallery = provider.get("gallery", [])
+    total = provider.get("gallery_count", 0)
+    return {
+        "images": [serialize_gallery_image(entry, image_size, image_format) for entry in gallery],
+        "total": total,
+        "next_offset": offset + len(gallery) if offset + len(gallery) < total else None
+    }
+
+
+def reorder_gallery(provider_id: str, image_ids: List[str]) -> dict:
+    """Put the gallery in the order of `image_ids`, which must list every image exactly once"""
+    if len(set(image_ids)) != len(image_ids):
+        return {"error": "Image IDs must not repeat"}
+    provider = users_collection.find_one({"_id": ObjectId(provider_id)}, {"gallery": 1})
+    entries = {entry["id"]: entry for entry in provider.get("gallery", [])}
+    if set(image_ids) != set(entries):
+        return {"error": "image_ids must list every gallery image exactly once"}
+    if not image_ids:
+        return {"message": "Gallery reordered"}
+
+    # Only applies if the gallery still holds exactly these images
+    result = users_collection.update_one(
+        {"_id": ObjectId(provider_id), "gallery": {"$size": len(image_ids)}, "gallery.id": {"$all": image_ids}},
+        {"$set": {"gallery": [entries[image_id] for image_id in image_ids]}}
+    )
+    if result.matched_count == 0:
+        return {"error": "Gallery changed while reordering; reload it and try again"}
+    return {"message": "Gallery reordered"}
+
+
+def delete_gallery_image(provider_id: str, image_id: str) -> dict:
+    provider = users_collection.find_one_and_update(
+        {"_id": ObjectId(provider_id), "gallery.id": image_id},
+        {"$pull": {"gallery": {"id": image_id}}, "$inc": {"gallery_count": -1}},
+        projection={"gallery": {"$elemMatch": {"id": image_id}}}
+    )
+    if not provider:
+        return {"error": "Gallery image not found"}
+    release_image(provider["gallery"][0]["public_id"])
+    return {"message": "Gallery image deleted"}
+
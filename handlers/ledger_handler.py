@@ -0,0 +1,317 @@
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from db import client, wallets_collection, ledger_collection, wallet_snapshots_collection
+
+# System accounts are stored next to user wallets (keyed by user_id) and may go negative.
+FUNDING_ACCOUNT = "system:monnify_funding"
+PAYOUTS_ACCOUNT = "system:payouts"
+PAYOUTS_PENDING_ACCOUNT = "system:payouts_pending"
+SERVICE_PAYMENTS_ACCOUNT = "system:service_payments"
+OPENING_BALANCE_ACCOUNT = "system:opening_balances"
+SYSTEM_ACCOUNTS = (FUNDING_ACCOUNT, PAYOUTS_ACCOUNT, PAYOUTS_PENDING_ACCOUNT, SERVICE_PAYMENTS_ACCOUNT,
+                   OPENING_BALANCE_ACCOUNT)
+# Nearly every journal has a system leg, so each system account is spread over this many
+# wallet documents ("buckets") to keep concurrent postings from contending on one
+# counter. A journal always lands in the same bucket, so a repost still hits the unique
+# (journal_id, account) index. The account's balance is the sum of its buckets.
+SYSTEM_ACCOUNT_BUCKETS = 16
+
+# Re-snapshot a wallet once this many entries have been posted since its last snapshot
+SNAPSHOT_THRESHOLD = 100
+SNAPSHOT_BATCH_SIZE = 500
+AUDIT_BATCH_SIZE = 500
+
+
+def _in_transaction(callback):
+    """Run `callback(session)` in a Mongo transaction, retried on transient errors.
+
+    Counters and entries are always written together, so the cached wallet
+    balance never runs ahead of the ledger and no sequence is left unwritten.
+    """
+    with client.start_session() as session:
+        return session.with_transaction(callback)
+
+
+def _posting_account(account: str, journal_id: str) -> str:
+    """The wallet document a leg is posted to: a system account's bucket for this journal"""
+    if account in SYSTEM_ACCOUNTS:
+        return f"{account}:{zlib.crc32(journal_id.encode()) % SYSTEM_ACCOUNT_BUCKETS}"
+    return account
+
+
+def _ledger_accounts(account: str) -> List[str]:
+    """Every wallet document holding entries of `account`; for a system account that is
+    its buckets plus the unbucketed document used before buckets existed"""
+    if account in SYSTEM_ACCOUNTS:
+        return [account] + [f"{account}:{bucket}" for bucket in range(SYSTEM_ACCOUNT_BUCKETS)]
+    return [account]
+
+
+def _reserve_seq(account: str, amount: float, session, require_funds: bool = False) -> Optional[dict]:
+    """Apply a leg to the cached wallet balance and claim the next ledger sequence.
+
+    Returns the wallet document as it was *before* the update, or None when
+    `require_funds` is set and the balance cannot cover the debit.
+    """
+    query = {"user_id": account}
+    if require_funds:
+        query["balance"] = {"$gte": -amount}
+
+    before = wallets_collection.find_one_and_update(
+        query,
+        {
+            "$inc": {"balance": amount, "ledger_seq": 1, "pending_entries": 1},
+            "$set": {"last_updated": datetime.utcnow()}
+        },
+        upsert=not require_funds,
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is None and require_funds:
+        return None
+    return before or {}
+
+
+def _entry(journal_id: str, account: str, amount: float, seq: int, balance_after: float,
+           description: Optional[str], created_at: datetime) -> dict:
+    return {
+        "journal_id": journal_id,
+        "account": account,
+        "amount": amount,
+        "seq": seq,
+        "balance_after": balance_after,
+        "description": description,
+        "created_at": created_at
+    }
+
+
+def _opening_entries(account: str, balance: float, created_at: datetime, session) -> List[dict]:
+    """Bring a pre-ledger wallet balance into the ledger as a seq-0 opening journal"""
+    journal_id = f"opening:{account}"
+    opening_account = _posting_account(OPENING_BALANCE_ACCOUNT, journal_id)
+    counter = _reserve_seq(opening_account, -balance, session)
+    return [
+        _entry(journal_id, account, balance, 0, balance, "Opening balance", created_at),
+        _entry(journal_id, opening_account, -balance, counter.get("ledger_seq", 0) + 1,
+               counter.get("balance", 0.0) - balance, "Opening balance", created_at)
+    ]
+
+
+def post_journal(journal_id: str, legs: List[Tuple[str, float]], description: Optional[str] = None,
+                 debit_account: Optional[str] = None) -> Optional[List[dict]]:
+    """Post a balanced set of legs to the ledger.
+
+    Positive amounts credit an account, negative amounts debit it, and the legs
+    must sum to zero. When `debit_account` is given its leg is applied first
+    and only if the wallet holds enough funds; None is returned otherwise and
+    nothing is posted. Posting a journal_id that is already in the ledger
+    changes nothing and returns the entries posted the first time.
+    """
+    if round(sum(amount for _, amount in legs), 2) != 0:
+        raise ValueError(f"Journal {journal_id} is unbalanced")
+
+    existing = list(ledger_collection.find({"journal_id": journal_id}))
+    if existing:
+        return existing
+    legs = sorted(
+        [(_posting_account(account, journal_id), amount) for account, amount in legs],
+        key=lambda leg: leg[0] != debit_account
+    )
+
+    def post(session) -> Optional[List[dict]]:
+        now = datetime.utcnow()
+        entries = []
+        for account, amount in legs:
+            before = _reserve_seq(account, amount, session, require_funds=account == debit_account)
+            if before is None:
+                # Only the first leg can be refused, so nothing has been written yet
+                return None
+
+            previous_balance = before.get("balance", 0.0)
+            if before and "ledger_seq" not in before and previous_balance:
+                entries.extend(_opening_entries(account, previous_balance, now, session))
+                # The opening entry is one more entry to snapshot
+                wallets_collection.update_one({"user_id": account}, {"$inc": {"pending_entries": 1}},
+                                              session=session)
+
+            entries.append(_entry(journal_id, account, amount, before.get("ledger_seq", 0) + 1,
+                                  previous_balance + amount, description, now))
+
+        ledger_collection.insert_many(entries, ordered=False, session=session)
+        return entries
+
+    try:
+        return _in_transaction(post)
+    except BulkWriteError:
+        # A concurrent repost won; the unique (journal_id, account) index rolled this one back
+        existing = list(ledger_collection.find({"journal_id": journal_id}))
+        if not existing:
+            raise
+        return existing
+
+
+def _open_wallet(wallet_id, session) -> bool:
+    before = wallets_collection.find_one_and_update(
+        {"_id": wallet_id, "ledger_seq": {"$exists": False}},
+        {"$set": {"ledger_seq": 0, "pending_entries": 1}},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if not before:
+        return False
+    ledger_collection.insert_many(
+        _opening_entries(before["user_id"], before.get("balance", 0.0), datetime.utcnow(), session),
+        ordered=False,
+        session=session
+    )
+    return True
+
+
+def open_legacy_wallets(batch_size: int = SNAPSHOT_BATCH_SIZE) -> int:
+    """One-off job: write opening entries for wallets funded before the ledger existed"""
+    opened = 0
+    while True:
+        wallets = list(wallets_collection.find(
+            {"ledger_seq": {"$exists": False}},
+            {"user_id": 1}
+        ).limit(batch_size))
+        if not wallets:
+            return opened
+
+        for wallet in wallets:
+            if _in_transaction(lambda session: _open_wallet(wallet["_id"], session)):
+                opened += 1
+
+
+def _latest_snapshot(account: str) -> Optional[dict]:
+    return wallet_snapshots_collection.find_one({"account": account}, sort=[("seq", -1)])
+
+
+def get_account_balance(account: str) -> float:
+    """Ledger balance of an account, summed over its buckets for a system account"""
+    return round(sum(_ledger_balance(ledger_account) for ledger_account in _ledger_accounts(account)), 2)
+
+
+def _ledger_balance(account: str) -> float:
+    """Ledger balance of one wallet document: latest snapshot plus the entries posted after it"""
+    snapshot = _latest_snapshot(account)
+    base_seq = snapshot["seq"] if snapshot else -1
+    base_balance = snapshot["balance"] if snapshot else 0.0
+
+    tail = list(ledger_collection.aggregate([
+        {"$match": {"account": account, "seq": {"$gt": base_seq}}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+    ]))
+    if not snapshot and not (tail and tail[0]["count"]):
+        # Wallet not opened in the ledger yet; its cached balance is still authoritative
+        wallet = wallets_collection.find_one({"user_id": account, "ledger_seq": {"$exists": False}})
+        return wallet["balance"] if wallet else 0.0
+
+    return round(base_balance + (tail[0]["total"] if tail else 0.0), 2)
+
+
+def take_snapshot(account: str) -> Optional[dict]:
+    """Fold the contiguous run of entries after the latest snapshot into a new snapshot"""
+    previous = _latest_snapshot(account)
+    prev_seq = previous["seq"] if previous else -1
+    prev_balance = previous["balance"] if previous else 0.0
+
+    tail = ledger_collection.find(
+        {"account": account, "seq": {"$gt": prev_seq}},
+        {"seq": 1, "amount": 1}
+    ).sort("seq", 1)
+
+    # Postings commit their counters and entries together, so a gap means the ledger
+    # was edited outside post_journal; stop there and leave it to the audit.
+    # Seq 0 only exists for wallets carried over with an opening balance.
+    seq, balance, count = prev_seq, prev_balance, 0
+    for entry in tail:
+        if entry["seq"] != seq + 1 and not (seq == -1 and entry["seq"] == 1):
+            break
+        seq, balance, count = entry["seq"], balance + entry["amount"], count + 1
+
+    if not count:
+        return None
+
+    snapshot = {
+        "account": account,
+        "seq": seq,
+        "balance": round(balance, 2),
+        "prev_seq": prev_seq,
+        "prev_balance": prev_balance,
+        "entry_count": count,
+        "audit_status": "pending",
+        "created_at": datetime.utcnow()
+    }
+    try:
+        wallet_snapshots_collection.insert_one(snapshot)
+    except DuplicateKeyError:
+        # Another worker snapshotted the same range
+        return None
+
+    wallets_collection.update_one({"user_id": account}, {"$inc": {"pending_entries": -count}})
+    return snapshot
+
+
+def snapshot_wallets(threshold: int = SNAPSHOT_THRESHOLD, limit: int = SNAPSHOT_BATCH_SIZE) -> int:
+    """Periodic job: snapshot every wallet with at least `threshold` unsnapshotted entries"""
+    wallets = wallets_collection.find(
+        {"pending_entries": {"$gte": threshold}},
+        {"user_id": 1}
+    ).limit(limit)
+    return sum(1 for wallet in wallets if take_snapshot(wallet["user_id"]))
+
+
+def audit_snapshots(batch_size: int = AUDIT_BATCH_SIZE, max_batches: int = 20) -> Dict:
+    """Verify pending snapshots against the ledger entries they cover.
+
+    Each batch holds at most one snapshot per account and is checked with a
+    single aggregation over the (account, seq) index, so the cost is
+    proportional to the entries written since the last audit, not to the
+    size of the ledger.
+    """
+    audited, mismatches = 0, []
+
+    for _ in range(max_batches):
+        batch = {}
+        for snapshot in wallet_snapshots_collection.find(
+                {"audit_status": "pending"}).sort("seq", 1).limit(batch_size):
+            batch.setdefault(snapshot["account"], snapshot)
+        if not batch:
+            break
+
+        totals = {
+            row["_id"]: row
+            for row in ledger_collection.aggregate([
+                {"$match": {"$or": [
+                    {"account": account, "seq": {"$gt": s["prev_seq"], "$lte": s["seq"]}}
+                    for account, s in batch.items()
+                ]}},
+                {"$group": {"_id": "$account", "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+            ])
+        }
+
+        updates = []
+        now = datetime.utcnow()
+        for account, snapshot in batch.items():
+            row = totals.get(account, {"total": 0.0, "count": 0})
+            expected = round(snapshot["prev_balance"] + row["total"], 2)
+            ok = expected == round(snapshot["balance"], 2) and row["count"] == snapshot["entry_count"]
+            update = {"audit_status": "ok" if ok else "mismatch", "audited_at": now}
+            if not ok:
+                update["ledger_balance"] = expected
+                mismatches.append({
+                    "account": account,
+                    "seq": snapshot["seq"],
+                    "snapshot_balance": snapshot["balance"],
+                    "ledger_balance": expected
+                })
+            updates.append(UpdateOne({"_id": snapshot["_id"]}, {"$set": update}))
+
+        wallet_snapshots_collection.bulk_write(updates, ordered=False)
+        audited += len(updates)
+
+    return {"audited": audited, "mismatches": mismatches}
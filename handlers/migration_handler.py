@@ -0,0 +1,275 @@
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from db import migration_runs_collection, bookings_collection, services_collection, users_collection
+from services.job_queue import job_handler, enqueue_job, update_job_progress
+from handlers.auth_handler import search_fields
+from handlers.earnings_handler import request_rollup_backfill
+
+# Data migrations run as background jobs over one collection in _id order. After
+# every batch the run records the last _id it reached, so a run whose worker died
+# picks up from there instead of starting again.
+MIGRATION_BATCH_SIZE = 500
+MIGRATION_MAX_BATCH_SIZE = 5000
+MIGRATION_THROTTLE_MS = 100
+
+MIGRATIONS: Dict[str, dict] = {}
+
+
+def migration(name: str, collection, query: dict, projection: Optional[dict] = None, description: str = "",
+              track: Optional[Callable[[List[dict]], dict]] = None,
+              on_complete: Optional[Callable[[dict], dict]] = None):
+    """Register a migration.
+
+    The decorated function receives a batch of documents matching `query` and
+    returns the UpdateOne operations for them; it should prefetch whatever it
+    needs for the whole batch rather than querying per document.
+
+    `track`, given each batch that was written, returns extra update operators
+    ($min, $max, ...) applied to the run document with that batch's checkpoint.
+    `on_complete` receives the finished run and does any follow-up work, such
+    as queueing jobs; it is skipped on dry runs.
+    """
+    def decorator(func: Callable[[List[dict]], List[UpdateOne]]):
+        MIGRATIONS[name] = {
+            "collection": collection,
+            "query": query,
+            "projection": projection,
+            "description": description,
+            "build_operations": func,
+            "track": track,
+            "on_complete": on_complete
+        }
+        return func
+    return decorator
+
+
+def serialize_run(run: dict) -> dict:
+    return {
+        "id": str(run["_id"]),
+        "migration": run["migration"],
+        "status": run["status"],
+        "dry_run": run["dry_run"],
+        "batch_size": run["batch_size"],
+        "throttle_ms": run["throttle_ms"],
+        "scanned": run.get("scanned", 0),
+        "operations": run.get("operations", 0),
+        "modified": run.get("modified", 0),
+        "last_id": str(run["last_id"]) if run.get("last_id") else None,
+        "error": run.get("error"),
+        "follow_up": run.get("follow_up"),
+        "created_at": run["created_at"],
+        "finished_at": run.get("finished_at")
+    }
+
+
+def list_migrations() -> List[dict]:
+    return [{"name": name, "description": spec["description"]} for name, spec in MIGRATIONS.items()]
+
+
+def start_migration(name: str, dry_run: bool = False, batch_size: int = MIGRATION_BATCH_SIZE,
+                    throttle_ms: int = MIGRATION_THROTTLE_MS) -> dict:
+    if name not in MIGRATIONS:
+        return {"error": f"Unknown migration: {name}"}
+    if not 0 < batch_size <= MIGRATION_MAX_BATCH_SIZE:
+        return {"error": f"batch_size must be between 1 and {MIGRATION_MAX_BATCH_SIZE}"}
+    if throttle_ms < 0:
+        return {"error": "throttle_ms cannot be negative"}
+    if not dry_run and migration_runs_collection.find_one(
+            {"migration": name, "dry_run": False, "status": {"$in": ["queued", "running"]}}):
+        return {"error": f"Migration {name} is already running"}
+
+    run = {
+        "migration": name,
+        "status": "queued",
+        "dry_run": dry_run,
+        "batch_size": batch_size,
+        "throttle_ms": throttle_ms,
+        "last_id": None,
+        "scanned": 0,
+        "operations": 0,
+        "modified": 0,
+        "created_at": datetime.utcnow()
+    }
+    run["_id"] = migration_runs_collection.insert_one(run).inserted_id
+    run["job_id"] = enqueue_job("migration", {"run_id": str(run["_id"])})
+    migration_runs_collection.update_one({"_id": run["_id"]}, {"$set": {"job_id": run["job_id"]}})
+    return serialize_run(run)
+
+
+@job_handler("migration")
+def run_migration(job: dict) -> dict:
+    run_id = ObjectId(job["payload"]["run_id"])
+    run = migration_runs_collection.find_one_and_update(
+        {"_id": run_id},
+        {"$set": {"status": "running", "started_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    spec = MIGRATIONS[run["migration"]]
+    collection = spec["collection"]
+
+    try:
+        while True:
+            query = dict(spec["query"])
+            if run.get("last_id"):
+                query["_id"] = {"$gt": run["last_id"]}
+            docs = list(collection.find(query, spec["projection"]).sort("_id", 1).limit(run["batch_size"]))
+            if not docs:
+                break
+
+            operations = spec["build_operations"](docs)
+            modified = 0
+            checkpoint = {
+                "$set": {"last_id": docs[-1]["_id"], "updated_at": datetime.utcnow()},
+                "$inc": {"scanned": len(docs), "operations": len(operations)}
+            }
+            if operations and not run["dry_run"]:
+                modified = collection.bulk_write(operations, ordered=False).modified_count
+                checkpoint["$inc"]["modified"] = modified
+                if spec["track"]:
+                    checkpoint.update(spec["track"](docs))
+
+            # Checkpoint before moving on so a restarted job resumes after this batch
+            run = migration_runs_collection.find_one_and_update(
+                {"_id": run_id}, checkpoint, return_document=ReturnDocument.AFTER
+            )
+            update_job_progress(job["_id"], {"scanned": run["scanned"], "modified": run["modified"]})
+            if run["throttle_ms"]:
+                time.sleep(run["throttle_ms"] / 1000)
+    except Exception as e:
+        migration_runs_collection.update_one({"_id": run_id}, {"$set": {"status": "failed", "error": str(e)}})
+        raise
+
+    # Runs before the run is marked completed, so a retried job repeats it rather than skipping it
+    follow_up = spec["on_complete"](run) if spec["on_complete"] and not run["dry_run"] else None
+    migration_runs_collection.update_one(
+        {"_id": run_id},
+        {"$set": {"status": "completed", "error": None, "follow_up": follow_up, "finished_at": datetime.utcnow()}}
+    )
+    return {"scanned": run["scanned"], "operations": run["operations"], "modified": run["modified"],
+            "follow_up": follow_up}
+
+
+def get_migration_run(run_id: str) -> Optional[dict]:
+    if not ObjectId.is_valid(run_id):
+        return None
+    run = migration_runs_collection.find_one({"_id": ObjectId(run_id)})
+    return serialize_run(run) if run else None
+
+
+def get_migration_runs(name: Optional[str] = None, limit: int = 20) -> List[dict]:
+    query = {"migration": name} if name else {}
+    runs = migration_runs_collection.find(query).sort("created_at", -1).limit(limit)
+    return [serialize_run(run) for run in runs]
+
+
+# --------------------------
+# Migrations
+# --------------------------
+
+def _track_rollup_days(bookings: List[dict]) -> dict:
+    """Widen each provider's range of booking days whose rollups the new prices change"""
+    update = {"$min": {}, "$max": {}}
+    for booking in bookings:
+        if booking.get("provider_id") and booking.get("created_at"):
+            day = datetime(booking["created_at"].year, booking["created_at"].month, booking["created_at"].day)
+            key = f"rollup_days.{booking['provider_id']}"
+            update["$min"][f"{key}.start"] = min(day, update["$min"].get(f"{key}.start", day))
+            update["$max"][f"{key}.end"] = max(day, update["$max"].get(f"{key}.end", day))
+    return {operator: fields for operator, fields in update.items() if fields}
+
+
+def _rebuild_rollups(run: dict) -> dict:
+    """Earnings rollups counted these bookings at price 0; rebuild the days they fall on"""
+    days = run.get("rollup_days") or {}
+    jobs = [
+        request_rollup_backfill(span["start"].date(), span["end"].date(), provider_id)
+        for provider_id, span in days.items()
+    ]
+    return {"rollup_backfill_jobs": jobs}
+
+
+@migration(
+    "booking_prices",
+    bookings_collection,
+    {"price": {"$exists": False}},
+    {"service_id": 1, "provider_id": 1, "created_at": 1},
+    description="Copy the service price onto bookings created without one, then rebuild their earnings rollups",
+    track=_track_rollup_days,
+    on_complete=_rebuild_rollups
+)
+def migrate_booking_prices(bookings: List[dict]) -> List[UpdateOne]:
+    service_ids = set()
+    for booking in bookings:
+        service_id = booking.get("service_id")
+        if isinstance(service_id, ObjectId):
+            service_ids.add(service_id)
+        elif ObjectId.is_valid(service_id or ""):
+            service_ids.add(ObjectId(service_id))
+
+    prices = {
+        str(service["_id"]): service["price"]
+        for service in services_collection.find({"_id": {"$in": list(service_ids)}}, {"price": 1})
+        if "price" in service
+    }
+
+    return [
+        UpdateOne(
+            {"_id": booking["_id"], "price": {"$exists": False}},
+            {"$set": {"price": prices[str(booking.get("service_id"))]}}
+        )
+        for booking in bookings
+        if str(booking.get("service_id")) in prices
+    ]
+
+
+
+@migration(
+    "service_name_lower",
+    services_collection,
+    {"name_lower": {"$exists": False}},
+    {"name": 1},
+    description="Add the lower-cased name used by catalog prefix search and sorting"
+)
+def migrate_service_name_lower(services: List[dict]) -> List[UpdateOne]:
+    return [
+        UpdateOne({"_id": service["_id"]}, {"$set": {"name_lower": service["name"].lower()}})
+        for service in services
+        if isinstance(service.get("name"), str)
+    ]
+
+
+@migration(
+    "services_offered_refs",
+    users_collection,
+    {"services_offered": {"$type": "objectId"}},
+    {"services_offered": 1},
+    description="Store every services_offered entry as a hex string ID"
+)
+def migrate_services_offered_refs(providers: List[dict]) -> List[UpdateOne]:
+    operations = []
+    for provider in providers:
+        refs = []
+        for service_id in provider.get("services_offered", []):
+            ref = str(service_id)
+            if ref not in refs:
+                refs.append(ref)
+        operations.append(UpdateOne({"_id": provider["_id"]}, {"$set": {"services_offered": refs}}))
+    return operations
+
+
+@migration(
+    "user_search_fields",
+    users_collection,
+    {"email_lower": {"$exists": False}},
+    {"email": 1, "full_name": 1, "phone_number": 1},
+    description="Add the normalized email, name and phone fields admin user search matches on"
+)
+def migrate_user_search_fields(users: List[dict]) -> List[UpdateOne]:
+    # Users without an email would match this query forever, so mark them with an empty value
+    return [
+        UpdateOne({"_id": user["_id"]}, {"$set": {"email_lower": "", **search_fields(user)}})
+        for user in users
+    ]
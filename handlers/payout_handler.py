@@ -0,0 +1,287 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from db import transactions_collection, users_collection, payout_batches_collection
+from handlers.ledger_handler import post_journal, PAYOUTS_ACCOUNT, PAYOUTS_PENDING_ACCOUNT
+from handlers.wallet_handler import reserve_withdrawal
+from services.monnify_service import initiate_bulk_disbursement, get_bulk_disbursement_transactions
+
+# Approved withdrawals already have their funds reserved in PAYOUTS_PENDING_ACCOUNT.
+# The pipeline moves them approved -> processing (claimed into a batch) -> settling ->
+# completed, or -> releasing -> failed with the reservation returned to the provider's
+# wallet. Each run first finishes reservations, batch claims, settlements and releases
+# that a crash left half done.
+PAYOUT_BATCH_SIZE = 100
+PAYOUT_CONCURRENCY = 4
+PAYOUT_MAX_BATCHES_PER_RUN = 20
+PAYOUT_NARRATION = "Fixa provider payout"
+# Work in progress younger than this may still belong to a live request or run
+PAYOUT_STALE_AFTER_MINUTES = 10
+
+SUCCESS_STATUSES = {"SUCCESS", "COMPLETED"}
+FAILED_STATUSES = {"FAILED", "REVERSED", "EXPIRED", "REJECTED"}
+
+
+def _destination(withdrawal: dict, payout_accounts: Dict[str, dict]) -> Optional[dict]:
+    account = withdrawal.get("destination") or payout_accounts.get(withdrawal["user_id"])
+    if not account or not account.get("bank_code") or not account.get("account_number"):
+        return None
+    return account
+
+
+def claim_payout_batch(batch_size: int = PAYOUT_BATCH_SIZE) -> Optional[dict]:
+    """Move up to `batch_size` approved withdrawals into a new payout batch"""
+    candidate_ids = [w["_id"] for w in transactions_collection.find(
+        {"transaction_type": "withdrawal", "status": "approved", "funds_reserved": True},
+        {"_id": 1}
+    ).sort("created_at", 1).limit(batch_size)]
+    if not candidate_ids:
+        return None
+
+    # The batch document exists before any withdrawal points at it, so a claim cut
+    # short by a crash is found and finished by sweep_stale_payouts
+    batch = {
+        "batch_reference": f"PAYOUT_{ObjectId()}",
+        "withdrawal_ids": [],
+        "total_amount": 0,
+        "status": "claiming",
+        "created_at": datetime.utcnow()
+    }
+    batch["_id"] = payout_batches_collection.insert_one(batch).inserted_id
+    # Only withdrawals still approved are taken, so concurrent runs never share one
+    transactions_collection.update_many(
+        {"_id": {"$in": candidate_ids}, "status": "approved"},
+        {"$set": {"status": "processing", "payout_batch": batch["batch_reference"]}}
+    )
+    return _finish_claim(batch)
+
+
+def _finish_claim(batch: dict) -> Optional[dict]:
+    """Record the withdrawals a claiming batch ended up with; an empty batch is dropped"""
+    withdrawals = list(transactions_collection.find(
+        {"payout_batch": batch["batch_reference"], "status": "processing"},
+        {"amount": 1}
+    ))
+    if not withdrawals:
+        payout_batches_collection.delete_one({"_id": batch["_id"], "status": "claiming"})
+        return None
+
+    batch.update(
+        withdrawal_ids=[w["_id"] for w in withdrawals],
+        total_amount=sum(w["amount"] for w in withdrawals),
+        status="claimed"
+    )
+    payout_batches_collection.update_one(
+        {"_id": batch["_id"]},
+        {"$set": {key: batch[key] for key in ("withdrawal_ids", "total_amount", "status")}}
+    )
+    return batch
+
+
+def sweep_stale_payouts() -> List[dict]:
+    """Finish reservations, settlements, releases and batch claims interrupted by a crash;
+    returns the recovered batches"""
+    stale_before = datetime.utcnow() - timedelta(minutes=PAYOUT_STALE_AFTER_MINUTES)
+    for withdrawal in transactions_collection.find(
+            {"transaction_type": "withdrawal", "status": "reserving", "reserving_at": {"$lt": stale_before}}):
+        reserve_withdrawal(withdrawal)
+    for status, finish in (("settling", _finish_settle), ("releasing", _finish_release)):
+        for withdrawal in transactions_collection.find(
+                {"transaction_type": "withdrawal", "status": status, f"{status}_at": {"$lt": stale_before}}):
+            finish(withdrawal)
+
+    recovered = []
+    for batch in payout_batches_collection.find(
+            {"status": {"$in": ["claiming", "claimed"]}, "created_at": {"$lt": stale_before}}):
+        if batch["status"] == "claiming":
+            batch = _finish_claim(batch)
+        if batch:
+            # The run that claimed it may have reached Monnify before it died
+            batch["recovered"] = True
+            recovered.append(batch)
+    return recovered
+
+
+def _settle(withdrawal: dict, provider_reference: Optional[str] = None) -> bool:
+    claimed = transactions_collection.find_one_and_update(
+        {"_id": withdrawal["_id"], "status": "processing"},
+        {"$set": {"status": "settling", "settling_at": datetime.utcnow(), "payout_reference": provider_reference}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not claimed:
+        return False
+    _finish_settle(claimed)
+    return True
+
+
+def _finish_settle(withdrawal: dict):
+    # The journal is keyed by the withdrawal, so a sweep repeating this after a crash posts it once
+    post_journal(
+        f"{withdrawal['_id']}:settle",
+        [(PAYOUTS_PENDING_ACCOUNT, -withdrawal["amount"]), (PAYOUTS_ACCOUNT, withdrawal["amount"])],
+        description="Withdrawal paid out"
+    )
+    transactions_collection.update_one(
+        {"_id": withdrawal["_id"], "status": "settling"},
+        {"$set": {"status": "completed", "completed_at": datetime.utcnow()}}
+    )
+
+
+def _release(withdrawal: dict, reason: str) -> bool:
+    claimed = transactions_collection.find_one_and_update(
+        {"_id": withdrawal["_id"], "status": "processing"},
+        {"$set": {"status": "releasing", "releasing_at": datetime.utcnow(), "failure_reason": reason}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not claimed:
+        return False
+    _finish_release(claimed)
+    return True
+
+
+def _finish_release(withdrawal: dict):
+    post_journal(
+        f"{withdrawal['_id']}:release",
+        [(PAYOUTS_PENDING_ACCOUNT, -withdrawal["amount"]), (withdrawal["user_id"], withdrawal["amount"])],
+        description="Withdrawal payout failed, funds returned"
+    )
+    transactions_collection.update_one(
+        {"_id": withdrawal["_id"], "status": "releasing"},
+        {"$set": {"status": "failed"}}
+    )
+
+
+def _batch_known_to_provider(batch: dict) -> bool:
+    try:
+        response = get_bulk_disbursement_transactions(batch["batch_reference"], page_size=1)
+    except Exception:
+        return False
+    return bool(response.get("requestSuccessful") and (response.get("responseBody") or {}).get("content"))
+
+
+def submit_payout_batch(batch: dict) -> dict:
+    """Send a claimed batch to Monnify as one bulk disbursement"""
+    withdrawals = list(transactions_collection.find(
+        {"_id": {"$in": batch["withdrawal_ids"]}, "status": "processing"}
+    ))
+    user_ids = list({w["user_id"] for w in withdrawals if not w.get("destination")})
+    payout_accounts = {
+        str(user["_id"]): user.get("payout_account")
+        for user in users_collection.find(
+            {"_id": {"$in": [ObjectId(uid) for uid in user_ids if ObjectId.is_valid(uid)]}},
+            {"payout_account": 1}
+        )
+    }
+
+    transfers = []
+    for withdrawal in withdrawals:
+        destination = _destination(withdrawal, payout_accounts)
+        if not destination:
+            _release(withdrawal, "No payout bank account on file")
+            continue
+        transfers.append({
+            # The withdrawal ID doubles as the transfer reference, so a resubmitted
+            # transfer is rejected by Monnify as a duplicate instead of paid twice
+            "reference": str(withdrawal["_id"]),
+            "amount": withdrawal["amount"],
+            "narration": PAYOUT_NARRATION,
+            "destinationBankCode": destination["bank_code"],
+            "destinationAccountNumber": destination["account_number"]
+        })
+
+    if not transfers:
+        payout_batches_collection.update_one({"_id": batch["_id"]}, {"$set": {"status": "reconciled"}})
+        return {"batch_reference": batch["batch_reference"], "submitted": 0}
+
+    if (batch["status"] == "submit_failed" or batch.get("recovered")) and _batch_known_to_provider(batch):
+        # An earlier attempt reached Monnify even though we saw an error or died
+        response = {}
+    else:
+        try:
+            response = initiate_bulk_disbursement(batch["batch_reference"], transfers, PAYOUT_NARRATION)
+            if not response.get("requestSuccessful"):
+                raise Exception(response.get("responseMessage", "Bulk disbursement rejected"))
+        except Exception as e:
+            # Keep the withdrawals in this batch: the next run checks whether Monnify
+            # received it before resubmitting under the same batch reference
+            payout_batches_collection.update_one(
+                {"_id": batch["_id"]},
+                {"$set": {"status": "submit_failed", "error": str(e)}, "$inc": {"attempts": 1}}
+            )
+            return {"batch_reference": batch["batch_reference"], "error": str(e)}
+
+    payout_batches_collection.update_one(
+        {"_id": batch["_id"]},
+        {"$set": {
+            "status": "submitted",
+            "submitted_at": datetime.utcnow(),
+            "provider_status": (response.get("responseBody") or {}).get("batchStatus")
+        }}
+    )
+    return {"batch_reference": batch["batch_reference"], "submitted": len(transfers)}
+
+
+def reconcile_payout_batch(batch: dict) -> dict:
+    """Settle or release each withdrawal in a submitted batch from Monnify's per-transfer results"""
+    results, page_no = {}, 0
+    try:
+        while True:
+            response = get_bulk_disbursement_transactions(batch["batch_reference"], page_no=page_no)
+            body = response.get("responseBody") or {}
+            for transfer in body.get("content", []):
+                results[transfer["reference"]] = transfer
+            if body.get("last", True):
+                break
+            page_no += 1
+    except Exception as e:
+        return {"batch_reference": batch["batch_reference"], "error": str(e)}
+
+    settled, released, pending = 0, 0, 0
+    for withdrawal in transactions_collection.find({"payout_batch": batch["batch_reference"], "status": "processing"}):
+        transfer = results.get(str(withdrawal["_id"]))
+        status = (transfer or {}).get("status", "").upper()
+        if status in SUCCESS_STATUSES:
+            settled += _settle(withdrawal, transfer.get("transactionReference"))
+        elif status in FAILED_STATUSES:
+            released += _release(withdrawal, transfer.get("transactionDescription") or status)
+        else:
+            pending += 1
+
+    if not pending:
+        payout_batches_collection.update_one(
+            {"_id": batch["_id"]},
+            {"$set": {"status": "reconciled", "reconciled_at": datetime.utcnow()}}
+        )
+    return {"batch_reference": batch["batch_reference"], "settled": settled, "released": released,
+            "pending": pending}
+
+
+def run_payouts(max_batches: int = PAYOUT_MAX_BATCHES_PER_RUN) -> dict:
+    """Scheduler job: batch approved withdrawals, submit them concurrently, then reconcile"""
+    batches: List[dict] = sweep_stale_payouts()
+    batches += list(payout_batches_collection.find({"status": "submit_failed"}).limit(max_batches))
+    while len(batches) < max_batches:
+        batch = claim_payout_batch()
+        if not batch:
+            break
+        batches.append(batch)
+
+    with ThreadPoolExecutor(max_workers=PAYOUT_CONCURRENCY) as pool:
+        submitted = list(pool.map(submit_payout_batch, batches))
+        reconciled = list(pool.map(
+            reconcile_payout_batch,
+            payout_batches_collection.find({"status": "submitted"}).limit(max_batches)
+        ))
+
+    return {"submitted": submitted, "reconciled": reconciled}
+
+
+def get_payout_batch(batch_reference: str) -> Optional[dict]:
+    batch = payout_batches_collection.find_one({"batch_reference": batch_reference})
+    if not batch:
+        return None
+    batch["_id"] = str(batch["_id"])
+    batch["withdrawal_ids"] = [str(w) for w in batch["withdrawal_ids"]]
+    return batch
@@ -1,17 +1,24 @@
-from db import users_collection, services_collection, reviews_collection
-from typing import List, Optional, Dict, Any
+from db import users_collection, reviews_collection
+from typing import List, Optional, Dict, Any, Tuple
 from bson import ObjectId
+from handlers.review_handler import get_rating_stats, rating_stats_from_provider
 from handlers.service_handler import (
     add_services_to_provider,
     remove_services_from_provider,
     get_provider_services,
+    service_ref,
 serialize_service
 )
+from services.catalog_cache import service_catalog
+from services.cloudinary_service import with_image_variants, DEFAULT_VARIANT_FORMAT
+from services.pagination import keyset_page
 
-def serialize_provider(provider):
+def serialize_provider(provider, image_size: Optional[str] = None, image_format: str = DEFAULT_VARIANT_FORMAT):
     """Convert MongoDB document to serializable format"""
     if provider and '_id' in provider:
         provider['_id'] = str(provider['_id'])
+    if provider:
+        with_image_variants(provider, 'profile_image', image_size, image_format)
     return provider
 
 
@@ -30,21 +37,21 @@ def get_recent_reviews(provider_id: str, limit: int = 3) -> List[Dict]:
     } for review in reviews]
 
 
-def get_all_providers() -> List[dict]:
+def get_all_providers(image_size: Optional[str] = None,
+                      image_format: str = DEFAULT_VARIANT_FORMAT) -> List[dict]:
     """Get all providers with their services and rating info"""
     providers = users_collection.find(
         {"role": "provider"},
-        {"password": 0}
+        {"password": 0, "gallery": 0}
     )
     result = []
     for provider in providers:
-        provider = serialize_provider(provider)
+        provider = serialize_provider(provider, image_size, image_format)
         # Get full service details
         if 'services_offered' in provider:
             try:
-                service_ids = [ObjectId(id) for id in provider['services_offered']]
-                services = services_collection.find({"_id": {"$in": service_ids}})
-                provider['services'] = [serialize_service(s) for s in services]
+                services = service_catalog.get_many(provider['services_offered']).values()
+                provider['services'] = [serialize_service(s, image_size, image_format) for s in services]
             except:
                 provider['services'] = []
         else:
@@ -52,7 +59,7 @@ def get_all_providers() -> List[dict]:
 
         # Add rating information
         provider_id = str(provider['_id'])
-        provider['rating_stats'] = get_provider_rating_stats(provider_id)
+        provider['rating_stats'] = rating_stats_from_provider(provider)
         provider['recent_reviews'] = get_recent_reviews(provider_id)
 
         result.append(provider)
@@ -63,7 +70,7 @@ def get_provider_by_id(provider_id: str):
     """Get single provider with their services and rating info"""
     provider = users_collection.find_one(
         {"_id": ObjectId(provider_id), "role": "provider"},
-        {"password": 0}
+        {"password": 0, "gallery": 0}
     )
     if not provider:
         return None
@@ -72,76 +79,64 @@ def get_provider_by_id(provider_id: str):
 
     # Get full service details
     if 'services_offered' in provider:
-        service_ids = [ObjectId(id) for id in provider['services_offered']]
-        services = services_collection.find({"_id": {"$in": service_ids}})
+        services = service_catalog.get_many(provider['services_offered']).values()
         provider['services'] = [serialize_service(s) for s in services]
     else:
         provider['services'] = []
 
     # Add rating information
     provider_id = str(provider['_id'])
-    provider['rating_stats'] = get_provider_rating_stats(provider_id)
+    provider['rating_stats'] = rating_stats_from_provider(provider)
     provider['recent_reviews'] = get_recent_reviews(provider_id)
 
     return provider
 
-def get_providers_by_service(service_id: str):
-    """Get providers offering a specific service
+def get_providers_by_service(service_id: str, limit: int = 20, cursor: Optional[str] = None,
+                             image_size: Optional[str] = None,
+                             image_format: str = DEFAULT_VARIANT_FORMAT) -> Tuple[List[dict], Optional[str]]:
+    """Get one page of providers offering a specific service
 
     Args:
         service_id: The ID of the service to search for
+        limit: Page size
+        cursor: next_cursor of the previous page
+        image_size: Return only this image variant (thumb, card or full)
+        image_format: Format of that variant (webp or avif)
 
     Returns:
-        List of serialized provider documents
+        Serialized provider documents and the cursor of the next page
 
     Raises:
         InvalidId: If the service_id is not a valid ObjectId
+        ValueError: If the cursor is invalid
     """
-    try:
-        # Validate service_id format first
-        service_obj_id = ObjectId(service_id)
-
-        # Check if service exists
-        if not services_collection.find_one({"_id": service_obj_id}):
-            return []
-
-        # Find providers offering this service
-        providers = users_collection.find(
-            {
-                "role": "provider",
-                "services_offered": service_obj_id
-            },
-            {
-                "password": 0,
-                "services_offered": 0  # Exclude from response
-            }
-        )
-
-        # Include service details in each provider's response
-        service = services_collection.find_one(
-            {"_id": service_obj_id},
-            {"name": 1, "description": 1, "price": 1, "image": 1}
-        )
-
-        serialized_providers = []
-        for provider in providers:
-            provider = serialize_provider(provider)
-            provider["service_details"] = serialize_service(service)
-            serialized_providers.append(provider)
-
-        return serialized_providers
-
-    except InvalidId:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid service ID format"
-        )
-    except Exception as e:
-        print(f"Error in get_providers_by_service: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail="Internal server error while fetching providers"
-        )
+    service = service_catalog.get(ObjectId(service_id))
+    if not service:
+        return [], None
+
+    # The (services_offered, role, _id) index finds the page and keeps it in _id
+    # order, but services_offered is an array, so the index is multikey and cannot
+    # cover the query: each matching provider is fetched, once, with the page
+    providers, next_cursor = keyset_page(
+        users_collection,
+        {"services_offered": service_ref(service_id), "role": "provider"},
+        [],
+        limit,
+        cursor=cursor,
+        direction=1,
+        projection={"password": 0, "services_offered": 0, "gallery": 0}
+    )
+
+    service_details = serialize_service(
+        {field: service.get(field) for field in ("_id", "name", "description", "price", "image")},
+        image_size, image_format
+    )
+    serialized_providers = []
+    for provider in providers:
+        provider = serialize_provider(provider, image_size, image_format)
+        provider["service_details"] = service_details
+        serialized_providers.append(provider)
+    return serialized_providers, next_cursor
 
 
 def toggle_provider_availability(provider_id: str, is_available: bool):
@@ -178,23 +173,23 @@ def update_provider_profile(
     )
 
 
-def get_top_rated_providers(limit: int = 10) -> List[dict]:
+def get_top_rated_providers(limit: int = 10, image_size: Optional[str] = None,
+                            image_format: str = DEFAULT_VARIANT_FORMAT) -> List[dict]:
     """Get top rated providers sorted by rating with full rating information"""
     providers = users_collection.find(
         {"role": "provider"},
-        {"password": 0}
+        {"password": 0, "gallery": 0}
     ).sort("rating", -1).limit(limit)
 
     result = []
     for provider in providers:
-        provider = serialize_provider(provider)
+        provider = serialize_provider(provider, image_size, image_format)
 
         # Get full service details for the provider
         if 'services_offered' in provider:
             try:
-                service_ids = [ObjectId(id) for id in provider['services_offered']]
-                services = services_collection.find({"_id": {"$in": service_ids}})
-                provider['services'] = [serialize_service(s) for s in services]
+                services = service_catalog.get_many(provider['services_offered']).values()
+                provider['services'] = [serialize_service(s, image_size, image_format) for s in services]
             except:
                 provider['services'] = []
         else:
@@ -202,7 +197,7 @@ def get_top_rated_providers(limit: int = 10) -> List[dict]:
 
         # Add rating information
         provider_id = str(provider['_id'])
-        provider['rating_stats'] = get_provider_rating_stats(provider_id)
+        provider['rating_stats'] = rating_stats_from_provider(provider)
         provider['recent_reviews'] = get_recent_reviews(provider_id)
 
         result.append(provider)
@@ -210,26 +205,26 @@ def get_top_rated_providers(limit: int = 10) -> List[dict]:
     return result
 
 
-def get_providers_nearby(location: str) -> List[dict]:
+def get_providers_nearby(location: str, image_size: Optional[str] = None,
+                          image_format: str = DEFAULT_VARIANT_FORMAT) -> List[dict]:
     """Find providers near a location with full rating information"""
     providers = users_collection.find(
         {
             "role": "provider",
             "address": {"$regex": location, "$options": "i"}
         },
-        {"password": 0}
+        {"password": 0, "gallery": 0}
     )
 
     result = []
     for provider in providers:
-        provider = serialize_provider(provider)
+        provider = serialize_provider(provider, image_size, image_format)
 
         # Get full service details for the provider
         if 'services_offered' in provider:
             try:
-                service_ids = [ObjectId(id) for id in provider['services_offered']]
-                services = services_collection.find({"_id": {"$in": service_ids}})
-                provider['services'] = [serialize_service(s) for s in services]
+                services = service_catalog.get_many(provider['services_offered']).values()
+                provider['services'] = [serialize_service(s, image_size, image_format) for s in services]
             except:
                 provider['services'] = []
         else:
@@ -237,7 +232,7 @@ def get_providers_nearby(location: str) -> List[dict]:
 
         # Add rating information
         provider_id = str(provider['_id'])
-        provider['rating_stats'] = get_provider_rating_stats(provider_id)
+        provider['rating_stats'] = rating_stats_from_provider(provider)
         provider['recent_reviews'] = get_recent_reviews(provider_id)
 
         result.append(provider)
@@ -247,42 +242,9 @@ def get_providers_nearby(location: str) -> List[dict]:
 
 def get_provider_rating_stats(provider_id: str) -> Dict:
     """Get detailed rating statistics for a provider"""
-    pipeline = [
-        {"$match": {"provider_id": provider_id}},
-        {"$group": {
-            "_id": None,
-            "average": {"$avg": "$rating"},
-            "count": {"$sum": 1},
-            "1_star": {"$sum": {"$cond": [{"$eq": ["$rating", 1]}, 1, 0]}},
-            "2_star": {"$sum": {"$cond": [{"$eq": ["$rating", 2]}, 1, 0]}},
-            "3_star": {"$sum": {"$cond": [{"$eq": ["$rating", 3]}, 1, 0]}},
-            "4_star": {"$sum": {"$cond": [{"$eq": ["$rating", 4]}, 1, 0]}},
-            "5_star": {"$sum": {"$cond": [{"$eq": ["$rating", 5]}, 1, 0]}}
-        }}
-    ]
-
-    result = list(reviews_collection.aggregate(pipeline))
-
-    if not result:
-        return {
-            "average": 0,
-            "count": 0,
-            "breakdown": {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        }
-
-    return {
-        "average": result[0]["average"],
-        "count": result[0]["count"],
-        "breakdown": {
-            1: result[0]["1_star"],
-            2: result[0]["2_star"],
-            3: result[0]["3_star"],
-            4: result[0]["4_star"],
-            5: result[0]["5_star"]
-        }
-    }
-
-
+    stats = get_rating_stats(provider_id)
+    stats.pop("provider_id")
+    return stats
 
 
 def delete_provider(provider_id: str):
@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from bson import ObjectId
+from gridfs import GridFS
+from pymongo.errors import BulkWriteError
+from db import db, users_collection, jobs_collection
+from handlers.service_import_handler import import_format, read_import_rows, IMPORT_FORMATS
+from handlers.auth_handler import search_fields
+from services.auth_service import hash_password
+from services.job_queue import (
+    job_handler, enqueue_job, enqueue_jobs, get_job, update_job_progress, JOB_MAX_ATTEMPTS
+)
+
+PROVIDER_IMPORT_MAX_ROWS = 10000
+PROVIDER_IMPORT_BATCH_SIZE = 500
+# bcrypt is CPU-bound (about 0.3 s per hash per core at the default cost), so
+# passwords are hashed on a process per core
+PROVIDER_IMPORT_HASH_WORKERS = os.cpu_count() or 1
+PHONE_PATTERN = re.compile(r"^\+?\d{10,15}$")
+DUPLICATE_KEY_ERROR = 11000
+
+# The uploaded file (it holds plain-text passwords) is kept only until the import job has run
+provider_import_files = GridFS(db, collection="provider_imports")
+
+
+def queue_provider_import(source: BinaryIO, filename: str, admin_id: str) -> dict:
+    fmt = import_format(filename)
+    if not fmt:
+        return {"error": f"File must be one of: {', '.join(IMPORT_FORMATS)}"}
+    source_id = provider_import_files.put(source, filename=filename, metadata={"admin_id": admin_id})
+    job_id = enqueue_job("provider_import", {
+        "admin_id": admin_id,
+        "format": fmt,
+        "source_id": str(source_id)
+    }, max_attempts=3)
+    return {"job_id": job_id, "status": "queued"}
+
+
+def _validate_row(row: dict) -> Tuple[Optional[dict], Optional[str]]:
+    """The provider document of a row (password still in plain text), or why it cannot be imported"""
+    full_name = str(row.get("full_name") or "").strip()
+    if not 3 <= len(full_name) <= 50:
+        return None, "full_name must be 3 to 50 characters"
+    email = str(row.get("email") or "").strip()
+    if "@" not in email:
+        return None, "email is not valid"
+    password = str(row.get("password") or "")
+    if not 6 <= len(password) <= 100:
+        return None, "password must be 6 to 100 characters"
+    phone_number = str(row.get("phone_number") or "").strip() or None
+    if phone_number and not PHONE_PATTERN.match(phone_number):
+        return None, "phone_number is not valid"
+
+    provider = {
+        "full_name": full_name,
+        "email": email,
+        "password": password,
+        "role": "provider",
+        "phone_number": phone_number,
+        "address": str(row.get("address") or "").strip() or None,
+        "profile_image": None,
+        "bio": str(row.get("bio") or "").strip() or None,
+        "services_offered": [],
+        "is_available": True
+    }
+    provider.update(search_fields(provider))
+    try:
+        provider["experience_years"] = int(row.get("experience_years") or 0)
+        provider["base_price"] = float(row.get("base_price") or 0)
+    except (TypeError, ValueError):
+        return None, "experience_years and base_price must be numbers"
+    skills = row.get("skills") or []
+    # CSV cells list skills separated by semicolons; NDJSON may use an array
+    provider["skills"] = [s.strip() for s in skills.split(";") if s.strip()] if isinstance(skills, str) else skills
+    return provider, None
+
+
+def _insert_batch(batch: List[Tuple[int, dict]], results: List[dict]) -> List[Tuple[int, dict]]:
+    """Insert one batch, marking rows whose email was registered meanwhile; returns the inserted rows"""
+    duplicates = set()
+    try:
+        users_collection.insert_many([provider for _, provider in batch], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details["writeErrors"]:
+            if error["code"] != DUPLICATE_KEY_ERROR:
+                raise
+            duplicates.add(error["index"])
+
+    inserted = []
+    for position, (index, provider) in enumerate(batch):
+        if position in duplicates:
+            results[index].update(status="exists", error="Email already registered")
+        else:
+            results[index].update(status="created", user_id=str(provider["_id"]))
+            inserted.append((index, provider))
+    return inserted
+
+
+def _queue_provisioning(emails: List[str]) -> int:
+    """Queue reserved-account provisioning for every user with one of `emails` still waiting for it.
+
+    Querying by email rather than using the rows just inserted also picks up
+    users that an earlier, failed attempt of the import inserted but never
+    queued. Users whose provisioning job is already waiting or running are
+    skipped.
+    """
+    users = list(users_collection.find(
+        {"email": {"$in": emails}, "role": "provider", "provisioning.reserved_account": "pending"},
+        {"full_name": 1, "email": 1}
+    ))
+    queued = {
+        job["payload"]["user_id"]
+        for job in jobs_collection.find({
+            "status": {"$in": ["queued", "running"]},
+            "job_type": "provision_reserved_account",
+            "payload.user_id": {"$in": [str(user["_id"]) for user in users]}
+        }, {"payload.user_id": 1})
+    }
+    return len(enqueue_jobs("provision_reserved_account", [
+        {"user_id": str(user["_id"]), "full_name": user["full_name"], "email": user["email"]}
+        for user in users if str(user["_id"]) not in queued
+    ]))
+
+
+@job_handler("provider_import")
+def run_provider_import(job: dict) -> dict:
+    try:
+        return _import_providers(job)
+    except Exception:
+        if job["attempts"] >= job.get("max_attempts", JOB_MAX_ATTEMPTS):
+            # No attempt is left to use the file, and it holds plain-text passwords
+            provider_import_files.delete(ObjectId(job["payload"]["source_id"]))
+        raise
+
+
+def _import_providers(job: dict) -> dict:
+    payload = job["payload"]
+    results: List[dict] = []
+    providers: List[Tuple[int, dict]] = []
+    seen: Dict[str, int] = {}
+
+    rows = read_import_rows(provider_import_files.get(ObjectId(payload["source_id"])), payload["format"])
+    for number, (row, error) in enumerate(rows, start=1):
+        if number > PROVIDER_IMPORT_MAX_ROWS:
+            results.append({"row": number, "status": "error",
+                            "error": f"Only {PROVIDER_IMPORT_MAX_ROWS} rows are imported"})
+            break
+        provider = None
+        if not error:
+            provider, error = _validate_row(row)
+        if not error and provider["email"] in seen:
+            error = f"Duplicate of row {seen[provider['email']]}"
+        if error:
+            results.append({"row": number, "status": "error", "error": error})
+            continue
+        seen[provider["email"]] = number
+        results.append({"row": number, "status": "pending", "email": provider["email"]})
+        providers.append((len(results) - 1, provider))
+
+    # One query finds every email that is already registered
+    existing = {
+        user["email"]
+        for user in users_collection.find({"email": {"$in": list(seen)}}, {"email": 1, "_id": 0})
+    }
+    for index, provider in providers:
+        if provider["email"] in existing:
+            results[index].update(status="exists", error="Email already registered")
+    providers = [(index, provider) for index, provider in providers if provider["email"] not in existing]
+    existing = list(existing)
+    for start in range(0, len(existing), PROVIDER_IMPORT_BATCH_SIZE):
+        _queue_provisioning(existing[start:start + PROVIDER_IMPORT_BATCH_SIZE])
+    update_job_progress(job["_id"], {"rows": len(results), "new": len(providers), "created": 0})
+
+    created = 0
+    # Spawned, not forked: the job runs inside the API process, and a forked child
+    # would inherit its MongoClient and scheduler threads mid-flight
+    with ProcessPoolExecutor(max_workers=PROVIDER_IMPORT_HASH_WORKERS,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        for start in range(0, len(providers), PROVIDER_IMPORT_BATCH_SIZE):
+            batch = providers[start:start + PROVIDER_IMPORT_BATCH_SIZE]
+            hashes = pool.map(hash_password, [provider["password"] for _, provider in batch], chunksize=16)
+            now = datetime.utcnow()
+            for (_, provider), hashed in zip(batch, hashes):
+                provider.update(
+                    password=hashed,
+                    created_at=now,
+                    provisioning={"reserved_account": "pending"}
+                )
+
+            inserted = _insert_batch(batch, results)
+            _queue_provisioning([provider["email"] for _, provider in batch])
+            created += len(inserted)
+            update_job_progress(job["_id"], {"rows": len(results), "new": len(providers), "created": created})
+
+    provider_import_files.delete(ObjectId(payload["source_id"]))
+
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in ("created", "exists", "error")}
+    return {**counts, "rows": results}
+
+
+def get_provider_import(job_id: str) -> dict:
+    job = get_job(job_id)
+    if not job or job.get("job_type") != "provider_import":
+        return {"error": "Import not found"}
+
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "progress": job.get("progress"),
+        "result": job.get("result"),
+        "last_error": job.get("last_error")
+    }
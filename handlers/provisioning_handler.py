@@ -0,0 +1,108 @@
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from gridfs import GridFS
+from db import db, users_collection, notifications_collection
+from services.image_store import store_image
+from services.job_queue import job_handler, enqueue_job, JOB_MAX_ATTEMPTS
+from services.monnify_service import create_reserved_account, get_reserved_account
+
+# Uploaded bytes wait here until the upload job has pushed them to Cloudinary
+pending_uploads = GridFS(db, collection="pending_uploads")
+
+
+def queue_user_provisioning(user_id: str, full_name: str, email: str, profile_image=None,
+                            content_type: Optional[str] = None) -> dict:
+    """Queue the third-party work of a new signup and return the initial provisioning status.
+
+    The profile image is parked in GridFS so the request only pays for local
+    DB writes; Monnify and Cloudinary are called by background jobs.
+    """
+    provisioning = {"reserved_account": "pending"}
+    jobs = [("provision_reserved_account", {"user_id": user_id, "full_name": full_name, "email": email})]
+
+    if profile_image is not None:
+        file_id = pending_uploads.put(profile_image, content_type=content_type, metadata={"user_id": user_id})
+        jobs.append(("upload_profile_image", {"user_id": user_id, "file_id": str(file_id)}))
+        provisioning["profile_image"] = "pending"
+
+    # Record the pending status before queueing so a fast job cannot be overwritten by it
+    users_collection.update_one(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"provisioning": provisioning}}
+    )
+    for job_type, payload in jobs:
+        enqueue_job(job_type, payload)
+    return provisioning
+
+
+def _finish_step(user_id: str, step: str, status: str, update: Optional[dict] = None):
+    users_collection.update_one(
+        {"_id": ObjectId(user_id)},
+        {"$set": {f"provisioning.{step}": status, **(update or {})}}
+    )
+    if status == "completed" and step == "reserved_account":
+        # Push channel for clients that do not poll /api/auth/provisioning
+        notifications_collection.insert_one({
+            "user_id": user_id,
+            "title": "Wallet ready",
+            "message": "Your wallet account has been created.",
+            "created_at": datetime.utcnow(),
+            "is_read": False
+        })
+
+
+def _fail_if_last_attempt(job: dict, step: str):
+    if job["attempts"] >= job.get("max_attempts", JOB_MAX_ATTEMPTS):
+        _finish_step(job["payload"]["user_id"], step, "failed")
+
+
+@job_handler("provision_reserved_account")
+def run_reserved_account_provisioning(job: dict) -> dict:
+    payload = job["payload"]
+    result = create_reserved_account(
+        account_reference=payload["user_id"],
+        account_name=payload["full_name"],
+        customer_email=payload["email"],
+        bvn="",  # If BVN is required, add it as a form field
+        customer_name=payload["full_name"]
+    )
+    if "error" in result or not result.get("requestSuccessful", True):
+        # A retry after a lost response hits Monnify's duplicate-reference check,
+        # so look the account up before treating this as a failure
+        existing = get_reserved_account(payload["user_id"])
+        if "error" in existing or not existing.get("requestSuccessful"):
+            _fail_if_last_attempt(job, "reserved_account")
+            raise Exception(result.get("error") or result.get("responseMessage") or "Reserved account creation failed")
+        result = existing
+
+    _finish_step(payload["user_id"], "reserved_account", "completed", {"reserved_account": result.get("responseBody")})
+    return {"account_reference": payload["user_id"]}
+
+
+@job_handler("upload_profile_image")
+def run_profile_image_upload(job: dict) -> dict:
+    payload = job["payload"]
+    file_id = ObjectId(payload["file_id"])
+    image_url = store_image(pending_uploads.get(file_id))
+    if isinstance(image_url, dict) and "error" in image_url:
+        _fail_if_last_attempt(job, "profile_image")
+        raise Exception(image_url["error"])
+
+    _finish_step(payload["user_id"], "profile_image", "completed", {"profile_image": image_url})
+    pending_uploads.delete(file_id)
+    return {"url": image_url}
+
+
+def get_provisioning_status(user_id: str) -> dict:
+    user = users_collection.find_one(
+        {"_id": ObjectId(user_id)},
+        {"provisioning": 1, "reserved_account": 1, "profile_image": 1}
+    )
+    if not user:
+        return {"error": "User not found"}
+    return {
+        "provisioning": user.get("provisioning", {}),
+        "reserved_account": user.get("reserved_account"),
+        "profile_image": user.get("profile_image")
+    }
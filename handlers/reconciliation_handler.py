@@ -0,0 +1,171 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from db import transactions_collection, reconciliation_reports_collection
+from handlers.wallet_handler import confirm_wallet_funding, UNSETTLED_DEPOSIT_STATUSES
+from services.cache import TTLCache
+from services.job_queue import job_handler, enqueue_job, update_job_progress
+from services.monnify_service import AsyncMonnifyClient
+from models.wallet import TransactionStatus
+
+# Deposits are created with status "pending" and a reconcile_after time (see
+# generate_monnify_payment_link), giving the webhook a chance to arrive before we ask Monnify.
+# Deposits created before those fields existed have neither and are due straight away.
+DEPOSIT_RECHECK_MINUTES = 30
+DEPOSIT_EXPIRY_HOURS = 48
+DEPOSIT_BATCH_SIZE = 500
+DEPOSIT_MAX_PER_RUN = 20000
+DEPOSIT_VERIFY_CONCURRENCY = 8
+DEPOSIT_VERIFY_PER_SECOND = 20
+# A paid or failed answer never changes, so it is kept and reused if settling has to be retried
+DEPOSIT_VERIFY_CACHE_SECONDS = 24 * 3600
+
+PAID_STATUSES = {"PAID", "OVERPAID"}
+FAILED_STATUSES = {"FAILED", "CANCELLED", "EXPIRED", "ABANDONED", "REVERSED"}
+
+_verifications = TTLCache(ttl_seconds=DEPOSIT_VERIFY_CACHE_SECONDS, max_entries=DEPOSIT_MAX_PER_RUN)
+
+
+def _payment_status(result: dict) -> str:
+    return ((result.get("responseBody") or {}).get("paymentStatus") or "").upper()
+
+
+class _Verifier:
+    """Verifies payment references over one Monnify client and token for a whole run,
+    with at most DEPOSIT_VERIFY_CONCURRENCY calls in flight and no more than
+    DEPOSIT_VERIFY_PER_SECOND started each second"""
+
+    def __init__(self):
+        self.client = AsyncMonnifyClient()
+        self.semaphore = asyncio.Semaphore(DEPOSIT_VERIFY_CONCURRENCY)
+        self.pacing_lock = asyncio.Lock()
+        self.next_slot = time.monotonic()
+        self.cache_hits = 0
+
+    async def verify(self, reference: str):
+        cached = _verifications.get(reference)
+        if cached is not None:
+            self.cache_hits += 1
+            return reference, cached
+
+        async with self.semaphore:
+            async with self.pacing_lock:
+                delay = self.next_slot - time.monotonic()
+                self.next_slot = max(self.next_slot, time.monotonic()) + 1.0 / DEPOSIT_VERIFY_PER_SECOND
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                result = await self.client.verify_transaction(reference)
+            except Exception as e:
+                return reference, {"error": str(e)}
+
+        if _payment_status(result) in PAID_STATUSES | FAILED_STATUSES:
+            _verifications.set(reference, result)
+        return reference, result
+
+    async def verify_all(self, references: List[str]) -> Dict[str, dict]:
+        return dict(await asyncio.gather(*[self.verify(reference) for reference in references]))
+
+
+def _expire(deposit: dict, status: str, reason: str) -> bool:
+    result = transactions_collection.update_one(
+        {"_id": deposit["_id"], "status": {"$in": [TransactionStatus.PENDING.value, None]}},
+        {"$set": {"status": status, "failure_reason": reason, "reconciled_at": datetime.utcnow()}}
+    )
+    return result.modified_count > 0
+
+
+def _settle_batch(deposits: List[dict], results: Dict[str, dict], expiry_cutoff: datetime, summary: dict):
+    for deposit in deposits:
+        summary["checked"] += 1
+        result = results.get(deposit["reference"], {})
+        payment_status = _payment_status(result)
+
+        try:
+            if payment_status in PAID_STATUSES:
+                # confirm_wallet_funding claims the deposit atomically, so a webhook
+                # arriving at the same moment cannot credit it a second time
+                confirm_wallet_funding(deposit["reference"])
+                summary["settled"] += 1
+            elif payment_status in FAILED_STATUSES:
+                summary["failed"] += _expire(deposit, TransactionStatus.FAILED.value, f"Monnify status {payment_status}")
+            elif "error" not in result and deposit["created_at"] < expiry_cutoff:
+                summary["expired"] += _expire(deposit, TransactionStatus.EXPIRED.value, "No payment received")
+            else:
+                # Still unpaid, or Monnify could not be reached: it is looked at again after reconcile_after
+                summary["errors" if "error" in result else "still_pending"] += 1
+                transactions_collection.update_one(
+                    {"_id": deposit["_id"], "status": {"$in": UNSETTLED_DEPOSIT_STATUSES}},
+                    {"$set": {"provider_status": payment_status or None}}
+                )
+        except Exception as e:
+            print(f"Reconciling deposit {deposit['reference']} failed: {str(e)}")
+            summary["errors"] += 1
+
+
+async def _reconcile(max_deposits: int, on_batch: Optional[Callable[[dict], None]]) -> dict:
+    started_at = datetime.utcnow()
+    summary = {"checked": 0, "settled": 0, "failed": 0, "expired": 0, "still_pending": 0, "errors": 0}
+    expiry_cutoff = started_at - timedelta(hours=DEPOSIT_EXPIRY_HOURS)
+    verifier = _Verifier()
+
+    try:
+        while summary["checked"] < max_deposits:
+            deposits = list(transactions_collection.find(
+                {
+                    "transaction_type": "deposit",
+                    # "crediting" deposits were confirmed as paid but not credited yet, and
+                    # deposits from before statuses existed have none; $in with null still
+                    # uses the (transaction_type, status, reconcile_after) index
+                    "status": {"$in": UNSETTLED_DEPOSIT_STATUSES},
+                    "$or": [{"reconcile_after": {"$lte": started_at}}, {"reconcile_after": None}]
+                },
+                {"reference": 1, "created_at": 1}
+            ).sort("reconcile_after", 1).limit(min(DEPOSIT_BATCH_SIZE, max_deposits - summary["checked"])))
+            if not deposits:
+                break
+
+            # Push the batch out of reach of any other run before spending API calls on it
+            transactions_collection.update_many(
+                {"_id": {"$in": [d["_id"] for d in deposits]}},
+                {"$set": {"reconcile_after": datetime.utcnow() + timedelta(minutes=DEPOSIT_RECHECK_MINUTES)}}
+            )
+            results = await verifier.verify_all([d["reference"] for d in deposits])
+            _settle_batch(deposits, results, expiry_cutoff, summary)
+            if on_batch:
+                on_batch(summary)
+    finally:
+        await verifier.client.aclose()
+
+    return {**summary, "cache_hits": verifier.cache_hits, "started_at": started_at}
+
+
+def reconcile_pending_deposits(max_deposits: int = DEPOSIT_MAX_PER_RUN,
+                               on_batch: Optional[Callable[[dict], None]] = None) -> dict:
+    """Scheduler job: settle or expire deposits whose webhook never arrived"""
+    report = asyncio.run(_reconcile(max_deposits, on_batch))
+    report["finished_at"] = datetime.utcnow()
+    reconciliation_reports_collection.insert_one(dict(report))
+    return report
+
+
+def request_deposit_reconciliation(max_deposits: int = DEPOSIT_MAX_PER_RUN) -> str:
+    return enqueue_job("deposit_reconciliation", {"max_deposits": max_deposits}, max_attempts=1)
+
+
+@job_handler("deposit_reconciliation")
+def run_deposit_reconciliation(job: dict) -> dict:
+    # Each batch renews the job lease, so a long backlog is never handed to a second worker
+    return reconcile_pending_deposits(
+        job["payload"]["max_deposits"],
+        on_batch=lambda summary: update_job_progress(job["_id"], dict(summary))
+    )
+
+
+def get_latest_reconciliation_report() -> dict:
+    report = reconciliation_reports_collection.find_one(sort=[("started_at", -1)])
+    if not report:
+        return {"error": "No reconciliation has run yet"}
+    report["_id"] = str(report["_id"])
+    return report
@@ -1,17 +1,34 @@
 from datetime import datetime
 from bson import ObjectId
-from db import reviews_collection, bookings_collection, providers_collection
+from pymongo import ReturnDocument, UpdateOne
+from db import reviews_collection, bookings_collection, providers_collection, users_collection, jobs_collection
 from models.review import (
     ReviewFilter,
     ReviewSortField,
     SortOrder,
     PaginatedReviewResponse
 )
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
+from services.job_queue import job_handler, enqueue_job
+from services.pagination import keyset_page, encode_cursor
+
+# Sort keys per sort mode; keyset_page appends _id as the tie-breaker
+REVIEW_SORT_FIELDS = {
+    "date": ["created_at"],
+    "rating": ["rating", "created_at"]
+}
+REVIEW_KEY_PROJECTION = {"_id": 1, "rating": 1, "created_at": 1}
+
+# Rating stats live on the provider document as review_count, rating_sum and a
+# rating_histogram of whole-star counts, kept current with $inc on submit/delete.
+# Providers from before the counters existed get them from the rebuild job queued
+# at startup; until then their stats are aggregated from the reviews on read.
+RATING_STARS = [1, 2, 3, 4, 5]
+RATING_STATS_PROJECTION = {"review_count": 1, "rating_sum": 1, "rating_histogram": 1}
 
 
 def submit_review(booking_id: str, user_id: str, rating: float, comment: str = None):
-    """Submit a review and update provider's average rating"""
+    """Submit a review and update provider's rating counters"""
     booking = bookings_collection.find_one({"_id": ObjectId(booking_id), "user_id": user_id})
     if not booking:
         return {"error": "Booking not found or you are not authorized to review this booking"}
@@ -33,20 +50,39 @@ def submit_review(booking_id: str, user_id: str, rating: float, comment: str = N
 
     result = reviews_collection.insert_one(review)
     if result.inserted_id:
-        update_provider_rating(provider_id)
+        _record_rating(provider_id, rating, 1)
         return {"message": "Review submitted successfully", "review_id": str(result.inserted_id)}
     return {"error": "Failed to submit review"}
 
 
-def get_provider_reviews(
+def serialize_review(review: dict) -> dict:
+    return {
+        "id": str(review["_id"]),
+        "user_id": review["user_id"],
+        "provider_id": review["provider_id"],
+        "rating": review["rating"],
+        "comment": review.get("comment"),
+        "created_at": review["created_at"]
+    }
+
+
+def get_review_page(
         provider_id: str,
-        page: int = 1,
         limit: int = 10,
+        cursor: Optional[str] = None,
         sort_by: str = "date",
         sort_order: str = "desc",
-        filters: Optional[Dict] = None
-) -> PaginatedReviewResponse:
-    """Get paginated and filtered reviews for a provider"""
+        filters: Optional[Dict] = None,
+        page: int = 1
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of a provider's reviews and the cursor for the next page.
+
+    The keyset scan only reads the fields in REVIEW_KEY_PROJECTION, all of which are
+    in the (provider_id, created_at, _id, rating) and (provider_id, rating,
+    created_at, _id) indexes, so it is answered from the index alone; full
+    documents are then fetched for just the page. `page` is only used when no
+    cursor is given, for clients that still page by number.
+    """
     query = {"provider_id": provider_id}
 
     # Apply filters
@@ -61,91 +97,191 @@ def get_provider_reviews(
         if filters.get("star_rating"):
             query["rating"] = filters["star_rating"]
 
-    # Calculate skip for pagination
-    skip = (page - 1) * limit
+    direction = -1 if sort_order == "desc" else 1
+    if cursor or page <= 1:
+        keys, next_cursor = keyset_page(
+            reviews_collection,
+            query,
+            REVIEW_SORT_FIELDS[sort_by],
+            limit,
+            cursor=cursor,
+            direction=direction,
+            projection=REVIEW_KEY_PROJECTION
+        )
+    else:
+        fields = REVIEW_SORT_FIELDS[sort_by] + ["_id"]
+        keys = list(
+            reviews_collection.find(query, REVIEW_KEY_PROJECTION)
+            .sort([(field, direction) for field in fields])
+            .skip((page - 1) * limit)
+            .limit(limit + 1)
+        )
+        next_cursor = None
+        if len(keys) > limit:
+            keys = keys[:limit]
+            next_cursor = encode_cursor([keys[-1].get(field) for field in fields])
 
-    # Determine sort field and order
-    sort_field = "created_at" if sort_by == "date" else "rating"
-    sort_direction = -1 if sort_order == "desc" else 1
+    ids = [key["_id"] for key in keys]
+    reviews = {review["_id"]: review for review in reviews_collection.find({"_id": {"$in": ids}})}
+    return [serialize_review(reviews[_id]) for _id in ids if _id in reviews], next_cursor
 
-    # Get total count for pagination
-    total = reviews_collection.count_documents(query)
 
-    # Get paginated results
-    reviews = list(
-        reviews_collection.find(query)
-        .sort(sort_field, sort_direction)
-        .skip(skip)
-        .limit(limit)
-    )
+def get_provider_reviews(
+        provider_id: str,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        sort_by: str = "date",
+        sort_order: str = "desc",
+        filters: Optional[Dict] = None,
+        page: int = 1
+) -> PaginatedReviewResponse:
+    """Get cursor-paginated and filtered reviews for a provider"""
+    reviews_list, next_cursor = get_review_page(provider_id, limit, cursor, sort_by, sort_order, filters, page)
 
-    # Convert to response format
-    reviews_list = [{
-        "id": str(review["_id"]),
-        "user_id": review["user_id"],
-        "provider_id": review["provider_id"],
-        "rating": review["rating"],
-        "comment": review.get("comment"),
-        "created_at": review["created_at"]
-    } for review in reviews]
+    # The total comes from the provider's review counter; filtered totals are not counted
+    total = None
+    if not filters and ObjectId.is_valid(provider_id):
+        provider = providers_collection.find_one({"_id": ObjectId(provider_id)}, {"review_count": 1})
+        total = (provider or {}).get("review_count", 0)
 
     return PaginatedReviewResponse(
         reviews=reviews_list,
         total=total,
         page=page,
         limit=limit,
-        total_pages=(total + limit - 1) // limit
+        total_pages=(total + limit - 1) // limit if total is not None else None,
+        next_cursor=next_cursor
     )
 
 
+def _star(rating: float) -> int:
+    """Histogram bucket of a rating: whole stars, so 4.5 counts as 4"""
+    return min(5, max(1, int(rating)))
+
+
+def rating_stats_from_provider(provider: Optional[dict]) -> Dict:
+    """Rating stats from the counters stored on a provider document"""
+    provider = provider or {}
+    count = provider.get("review_count", 0)
+    histogram = provider.get("rating_histogram") or {}
+    return {
+        "average": provider.get("rating_sum", 0) / count if count > 0 else 0,
+        "count": count,
+        "breakdown": {star: histogram.get(str(star), 0) for star in RATING_STARS}
+    }
+
+
+def _rating_group() -> dict:
+    """$group stage body computing count, sum and whole-star buckets per provider"""
+    group = {"_id": "$provider_id", "count": {"$sum": 1}, "sum": {"$sum": "$rating"}}
+    for star in RATING_STARS:
+        low = {"$gte": ["$rating", star]} if star > 1 else True
+        high = {"$lt": ["$rating", star + 1]} if star < 5 else True
+        group[str(star)] = {"$sum": {"$cond": [{"$and": [low, high]}, 1, 0]}}
+    return group
+
+
+def _counters(row: Optional[dict]) -> dict:
+    """Provider counter fields from a _rating_group row (all zero for None)"""
+    row = row or {}
+    count, total = row.get("count", 0), row.get("sum", 0)
+    return {
+        "review_count": count,
+        "rating_sum": total,
+        "rating_histogram": {str(star): row.get(str(star), 0) for star in RATING_STARS},
+        "rating": total / count if count else 0
+    }
+
+
+def _aggregate_counters(provider_ids: List[str]) -> Dict[str, dict]:
+    rows = reviews_collection.aggregate([
+        {"$match": {"provider_id": {"$in": provider_ids}}},
+        {"$group": _rating_group()}
+    ])
+    counters = {row["_id"]: _counters(row) for row in rows}
+    return {pid: counters.get(pid, _counters(None)) for pid in provider_ids}
+
+
 def get_rating_stats(provider_id: str) -> Dict:
     """Get detailed rating statistics for a provider"""
-    pipeline = [
-        {"$match": {"provider_id": provider_id}},
-        {"$group": {
-            "_id": None,
-            "average": {"$avg": "$rating"},
-            "count": {"$sum": 1},
-            "1_star": {"$sum": {"$cond": [{"$eq": ["$rating", 1]}, 1, 0]}},
-            "2_star": {"$sum": {"$cond": [{"$eq": ["$rating", 2]}, 1, 0]}},
-            "3_star": {"$sum": {"$cond": [{"$eq": ["$rating", 3]}, 1, 0]}},
-            "4_star": {"$sum": {"$cond": [{"$eq": ["$rating", 4]}, 1, 0]}},
-            "5_star": {"$sum": {"$cond": [{"$eq": ["$rating", 5]}, 1, 0]}}
-        }}
-    ]
-
-    result = list(reviews_collection.aggregate(pipeline))
-
-    if not result:
-        return {
-            "provider_id": provider_id,
-            "average": 0,
-            "count": 0,
-            "breakdown": {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        }
-
-    stats = result[0]
+    return get_rating_stats_bulk([provider_id])[provider_id]
+
+
+def get_rating_stats_bulk(provider_ids: List[str]) -> Dict[str, Dict]:
+    """Rating stats for many providers from one $in query on their stored counters"""
+    object_ids = list({ObjectId(pid) for pid in provider_ids if ObjectId.is_valid(pid)})
+    providers = {
+        str(provider["_id"]): provider
+        for provider in providers_collection.find({"_id": {"$in": object_ids}}, RATING_STATS_PROJECTION)
+    }
+    # Counters not backfilled yet: count these providers' reviews directly
+    missing = [pid for pid, provider in providers.items() if "review_count" not in provider]
+    if missing:
+        providers.update(_aggregate_counters(missing))
     return {
-        "provider_id": provider_id,
-        "average": stats["average"],
-        "count": stats["count"],
-        "breakdown": {
-            1: stats["1_star"],
-            2: stats["2_star"],
-            3: stats["3_star"],
-            4: stats["4_star"],
-            5: stats["5_star"]
-        }
+        pid: {"provider_id": pid, **rating_stats_from_provider(providers.get(pid))}
+        for pid in provider_ids
     }
 
 
-def update_provider_rating(provider_id: str):
-    """Update provider's average rating based on all reviews"""
-    stats = get_rating_stats(provider_id)
+def _record_rating(provider_id: str, rating: float, sign: int):
+    """Add (sign=1) or remove (sign=-1) one rating from the provider's counters"""
+    provider = providers_collection.find_one_and_update(
+        {"_id": ObjectId(provider_id), "review_count": {"$exists": True}},
+        {"$inc": {
+            "review_count": sign,
+            "rating_sum": sign * rating,
+            f"rating_histogram.{_star(rating)}": sign
+        }},
+        projection=RATING_STATS_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not provider:
+        # No counters yet: start them from all of the provider's reviews, which
+        # already include (or no longer include) this one, rather than from zero
+        providers_collection.update_one(
+            {"_id": ObjectId(provider_id), "review_count": {"$exists": False}},
+            {"$set": _aggregate_counters([provider_id])[provider_id]}
+        )
+        return
+    # Only write the average if no other review has landed since our $inc;
+    # otherwise that later writer sets it from newer counters
     providers_collection.update_one(
-        {"_id": ObjectId(provider_id)},
-        {"$set": {"rating": stats["average"]}}
+        {"_id": provider["_id"], "review_count": provider["review_count"], "rating_sum": provider["rating_sum"]},
+        {"$set": {"rating": rating_stats_from_provider(provider)["average"]}}
+    )
+
+
+def request_rating_stats_rebuild() -> str:
+    return enqueue_job("rebuild_rating_stats", {})
+
+
+def ensure_rating_stats():
+    """Startup hook: queue the counter backfill unless a rebuild is pending or has already run"""
+    if not jobs_collection.find_one({"job_type": "rebuild_rating_stats",
+                                     "status": {"$in": ["queued", "running", "completed"]}}):
+        request_rating_stats_rebuild()
+
+
+@job_handler("rebuild_rating_stats")
+def rebuild_rating_stats(job: dict) -> dict:
+    """Recompute every provider's rating counters from reviews_collection"""
+    operations, rebuilt_ids = [], []
+    for row in reviews_collection.aggregate([{"$group": _rating_group()}], allowDiskUse=True):
+        if not ObjectId.is_valid(row["_id"] or ""):
+            continue
+        rebuilt_ids.append(ObjectId(row["_id"]))
+        operations.append(UpdateOne({"_id": ObjectId(row["_id"])}, {"$set": _counters(row)}))
+    if operations:
+        users_collection.bulk_write(operations, ordered=False)
+
+    # Providers without any reviews
+    reset = users_collection.update_many(
+        {"role": "provider", "_id": {"$nin": rebuilt_ids}},
+        {"$set": _counters(None)}
     )
+    return {"rebuilt": len(operations), "reset": reset.modified_count}
+
 
 def delete_review(review_id: str, user_id: str):
     """Delete a review if the user is authorized"""
@@ -155,6 +291,6 @@ def delete_review(review_id: str, user_id: str):
 
     result = reviews_collection.delete_one({"_id": ObjectId(review_id)})
     if result.deleted_count:
-        update_provider_rating(review["provider_id"])
+        _record_rating(review["provider_id"], review["rating"], -1)
         return {"message": "Review deleted successfully"}
     return {"error": "Failed to delete review"}
@@ -1,16 +1,38 @@
+import re
 from db import services_collection, users_collection
 from bson import ObjectId
-from typing import Optional, List, Dict, Union, Any
-from services.cloudinary_service import upload_image
+from pymongo.errors import DuplicateKeyError
+from typing import Optional, List, Dict, Union, Any, Tuple
+from services.image_store import store_image
+from services.cloudinary_service import with_image_variants, DEFAULT_VARIANT_FORMAT
+from services.catalog_cache import service_catalog
+from services.pagination import keyset_page
 from fastapi import UploadFile
 
+# Catalog sort options -> (sort fields, direction); keyset_page adds _id as tie-breaker
+CATALOG_SORTS = {
+    "name": (["name_lower"], 1),
+    "price_asc": (["price"], 1),
+    "price_desc": (["price"], -1)
+}
 
-def serialize_service(service):
+
+def serialize_service(service, image_size: Optional[str] = None, image_format: str = DEFAULT_VARIANT_FORMAT):
     if service and '_id' in service:
         service['_id'] = str(service['_id'])
+    if service and 'image' in service:
+        with_image_variants(service, 'image', image_size, image_format)
     return service
 
 
+def service_ref(service_id) -> str:
+    """Canonical form of a service ID inside services_offered: the 24-char hex string.
+
+    Raises InvalidId if `service_id` is not a valid ObjectId.
+    """
+    return str(ObjectId(service_id))
+
+
 def add_services_to_provider(provider_id: str, service_ids: List[str]) -> Dict[str, Union[int, str]]:
     """Add services to a provider's offerings with validation"""
     # Convert to ObjectId for query
@@ -18,10 +40,11 @@ def add_services_to_provider(provider_id: str, service_ids: List[str]) -> Dict[s
         service_object_ids = [ObjectId(id) for id in service_ids]
     except:
         return {"error": "Invalid service ID format"}
+    service_ids = list({str(oid) for oid in service_object_ids})
 
     # Verify all services exist
     existing_count = services_collection.count_documents({
-        "_id": {"$in": service_object_ids}
+        "_id": {"$in": list(set(service_object_ids))}
     })
     if existing_count != len(service_ids):
         return {"error": "One or more services not found"}
@@ -38,9 +61,10 @@ def add_services_to_provider(provider_id: str, service_ids: List[str]) -> Dict[s
 
 def remove_services_from_provider(provider_id: str, service_ids: List[str]) -> Dict[str, Union[int, str]]:
     """Remove services from a provider's offerings"""
+    refs = [service_ref(id) for id in service_ids if ObjectId.is_valid(id)]
     result = users_collection.update_one(
         {"_id": ObjectId(provider_id), "role": "provider"},
-        {"$pull": {"services_offered": {"$in": service_ids}}}
+        {"$pull": {"services_offered": {"$in": refs}}}
     )
 
     if result.matched_count == 0:
@@ -62,26 +86,58 @@ def get_provider_services(provider_id: str) -> Union[List[Dict], Dict[str, str]]
     except:
         return {"error": "Invalid service ID format in provider record"}
 
-    services = services_collection.find({"_id": {"$in": service_ids}})
+    services = service_catalog.get_many(service_ids).values()
     return [serialize_service(s) for s in services]
 
 # Get list of available services
-def get_services():
-    services = list(services_collection.find())
-    for service in services:
-        service["_id"] = str(service["_id"])
-    return services
+def get_services(image_size: Optional[str] = None, image_format: str = DEFAULT_VARIANT_FORMAT):
+    return [serialize_service(service, image_size, image_format) for service in service_catalog.all()]
+
+
+# Search the service catalog one page at a time
+def search_services(
+        q: Optional[str] = None,
+        prefix: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = "name",
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        image_size: Optional[str] = None,
+        image_format: str = DEFAULT_VARIANT_FORMAT
+) -> Tuple[List[dict], Optional[str]]:
+    """Filter the catalog by words (text index), name prefix and price range.
+
+    Name prefixes match the indexed name_lower field case-insensitively and
+    pages are cursor-based, so every page is an index seek.
+    """
+    query = {}
+    if q:
+        query["$text"] = {"$search": q}
+    if prefix:
+        query["name_lower"] = {"$regex": f"^{re.escape(prefix.lower())}"}
+    if min_price is not None or max_price is not None:
+        query["price"] = {}
+        if min_price is not None:
+            query["price"]["$gte"] = min_price
+        if max_price is not None:
+            query["price"]["$lte"] = max_price
+
+    sort_fields, direction = CATALOG_SORTS[sort]
+    services, next_cursor = keyset_page(
+        services_collection, query, sort_fields, limit, cursor=cursor, direction=direction
+    )
+    return [serialize_service(service, image_size, image_format) for service in services], next_cursor
 
 
 # Get details of a specific service
 def get_service_by_id(service_id: str):
-    service = services_collection.find_one({"_id": ObjectId(service_id)})
+    service = service_catalog.get(service_id)
     if not service:
         return {"error": "Service not found"}
 
     # Convert ObjectId to string for JSON serialization
-    service["_id"] = str(service["_id"])
-    return service
+    return serialize_service(service)
 
 # Add a new service (Admin only)
 def add_service(name: str, description: str, price: float, image: Optional[UploadFile]):
@@ -90,18 +146,23 @@ def add_service(name: str, description: str, price: float, image: Optional[Uploa
     image_url = None
     if image:
         # Upload image to Cloudinary
-        cloudinary_response = upload_image(image.file)
+        cloudinary_response = store_image(image.file)
         image_url = cloudinary_response
 
     service_data = {
         "name": name,
+        "name_lower": name.lower(),
         "description": description,
         "price": price,
         "image": image_url
     }
 
     # Save to DB (assuming `services_collection` exists)
-    result = services_collection.insert_one(service_data)
+    try:
+        result = services_collection.insert_one(service_data)
+    except DuplicateKeyError:
+        return {"error": "A service with this name already exists"}
+    service_catalog.bump()
 
     return {"message": "Service added successfully", "service_id": str(result.inserted_id)}
 
@@ -112,6 +173,7 @@ def update_service(service_id: str, name: Optional[str], description: Optional[s
     update_data = {}
     if name:
         update_data["name"] = name
+        update_data["name_lower"] = name.lower()
     if description:
         update_data["description"] = description
     if price is not None:
@@ -119,8 +181,12 @@ def update_service(service_id: str, name: Optional[str], description: Optional[s
     if image:
         update_data["image"] = image
 
-    result = services_collection.update_one({"_id": ObjectId(service_id)}, {"$set": update_data})
+    try:
+        result = services_collection.update_one({"_id": ObjectId(service_id)}, {"$set": update_data})
+    except DuplicateKeyError:
+        return {"error": "A service with this name already exists"}
     if result.matched_count:
+        service_catalog.bump()
         return {"message": "Service updated successfully"}
     return {"error": "Service not found"}
 
@@ -129,5 +195,11 @@ def update_service(service_id: str, name: Optional[str], description: Optional[s
 def delete_service(service_id: str):
     result = services_collection.delete_one({"_id": ObjectId(service_id)})
     if result.deleted_count:
+        service_catalog.bump()
+        # One multikey-indexed update drops the service from every provider offering it
+        users_collection.update_many(
+            {"services_offered": service_ref(service_id)},
+            {"$pull": {"services_offered": service_ref(service_id)}}
+        )
         return {"message": "Service deleted successfully"}
     return {"error": "Service not found"}
@@ -0,0 +1,235 @@
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from bson import ObjectId
+from gridfs import GridFS
+from pymongo import UpdateOne
+from db import db, services_collection, SERVICE_NAME_UNIQUE_INDEX
+from services.catalog_cache import service_catalog
+from services.cloudinary_service import upload_image
+from services.image_store import store_image
+from services.job_queue import job_handler, enqueue_job, get_job, update_job_progress
+from services.upload_service import MAX_IMAGE_BYTES, MULTIPART_OVERHEAD_BYTES
+
+# Rows are matched to existing services by their case-insensitive name
+IMPORT_FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson"
+}
+IMPORT_MAX_ROWS = 5000
+IMPORT_MAX_FILE_BYTES = 5 * 1024 * 1024
+IMPORT_MAX_IMAGES = 50
+# An import request carries the source file plus up to IMPORT_MAX_IMAGES full-size images
+IMPORT_MAX_REQUEST_BYTES = IMPORT_MAX_FILE_BYTES + IMPORT_MAX_IMAGES * MAX_IMAGE_BYTES + MULTIPART_OVERHEAD_BYTES
+IMPORT_BATCH_SIZE = 500
+# Image uploads of one import run in parallel, but never more than this many at once
+IMPORT_IMAGE_CONCURRENCY = 8
+IMPORT_FOLDER = "services"
+
+# The source file and any attached images wait here until the import job has run
+service_import_files = GridFS(db, collection="service_imports")
+
+
+def import_format(filename: str) -> Optional[str]:
+    for extension, fmt in IMPORT_FORMATS.items():
+        if (filename or "").lower().endswith(extension):
+            return fmt
+    return None
+
+
+def _import_blocker() -> Optional[str]:
+    """Why imports cannot run yet: rows are upserted by name_lower, which needs every
+    service to have one and the unique index to keep concurrent upserts from duplicating"""
+    if services_collection.find_one({"name_lower": {"$exists": False}}, {"_id": 1}):
+        return "Some services have no name_lower yet; run the service_name_lower migration first"
+    if SERVICE_NAME_UNIQUE_INDEX not in services_collection.index_information():
+        return "Some services share a case-insensitive name; merge them before importing"
+    return None
+
+
+def queue_service_import(source: BinaryIO, filename: str, images: List[Tuple[str, BinaryIO, str]],
+                         admin_id: str) -> dict:
+    """Park the source file and images in GridFS and queue the import job.
+
+    `images` are (filename, file, content_type) tuples; rows refer to them by
+    filename in their image_file column.
+    """
+    fmt = import_format(filename)
+    if not fmt:
+        return {"error": f"File must be one of: {', '.join(IMPORT_FORMATS)}"}
+    blocker = _import_blocker()
+    if blocker:
+        return {"error": blocker}
+    if len(images) > IMPORT_MAX_IMAGES:
+        return {"error": f"At most {IMPORT_MAX_IMAGES} images can be attached to one import"}
+    if len({name for name, _, _ in images}) != len(images):
+        return {"error": "Attached images must have distinct filenames"}
+
+    source_id = service_import_files.put(source, filename=filename, metadata={"admin_id": admin_id})
+    image_ids = {
+        name: str(service_import_files.put(image, filename=name, content_type=content_type,
+                                           metadata={"admin_id": admin_id}))
+        for name, image, content_type in images
+    }
+    job_id = enqueue_job("service_import", {
+        "admin_id": admin_id,
+        "format": fmt,
+        "source_id": str(source_id),
+        "images": image_ids
+    }, max_attempts=3)
+    return {"job_id": job_id, "status": "queued"}
+
+
+def read_import_rows(source, fmt: str) -> Iterator[Tuple[Optional[dict], Optional[str]]]:
+    """Yield (row, None) for every record, or (None, error) for one that cannot be parsed"""
+    text = io.TextIOWrapper(source, encoding="utf-8-sig")
+    if fmt == "csv":
+        for row in csv.DictReader(text):
+            yield {key.strip(): (value or "").strip() for key, value in row.items() if key}, None
+        return
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, f"Invalid JSON: {str(e)}"
+            continue
+        yield (row, None) if isinstance(row, dict) else (None, "Each line must be a JSON object")
+
+
+def _validate_row(row: dict, images: Dict[str, str]) -> Tuple[Optional[dict], Optional[str]]:
+    """The service fields of a row, or the reason it cannot be imported"""
+    name = str(row.get("name") or "").strip()
+    if len(name) < 2:
+        return None, "name must be at least 2 characters"
+    try:
+        price = float(row.get("price"))
+    except (TypeError, ValueError):
+        return None, "price must be a number"
+    if not price > 0:
+        return None, "price must be greater than 0"
+
+    service = {"name": name, "name_lower": name.lower(), "price": price}
+    if row.get("description"):
+        service["description"] = str(row["description"])
+
+    image_url, image_file = row.get("image_url"), row.get("image_file")
+    if image_url and image_file:
+        return None, "Give image_url or image_file, not both"
+    if image_url:
+        if not str(image_url).startswith(("http://", "https://")):
+            return None, "image_url must be an http(s) URL"
+        service["_image"] = ("url", str(image_url))
+    elif image_file:
+        if image_file not in images:
+            return None, f"Image file {image_file} was not uploaded"
+        service["_image"] = ("file", images[image_file])
+    return service, None
+
+
+def _upload_row_image(source: Tuple[str, str]):
+    kind, value = source
+    if kind == "url":
+        # Cloudinary fetches remote URLs itself
+        return upload_image(value, folder=IMPORT_FOLDER)
+    return store_image(service_import_files.get(ObjectId(value)), IMPORT_FOLDER)
+
+
+@job_handler("service_import")
+def run_service_import(job: dict) -> dict:
+    payload = job["payload"]
+    results: List[dict] = []
+    services: List[Tuple[int, dict]] = []
+    seen: Dict[str, int] = {}
+
+    for number, (row, error) in enumerate(
+            read_import_rows(service_import_files.get(ObjectId(payload["source_id"])), payload["format"]), start=1):
+        if number > IMPORT_MAX_ROWS:
+            results.append({"row": number, "status": "error", "error": f"Only {IMPORT_MAX_ROWS} rows are imported"})
+            break
+        service = None
+        if not error:
+            service, error = _validate_row(row, payload["images"])
+        if not error and service["name_lower"] in seen:
+            error = f"Duplicate of row {seen[service['name_lower']]}"
+        if error:
+            results.append({"row": number, "status": "error", "error": error})
+            continue
+        seen[service["name_lower"]] = number
+        results.append({"row": number, "status": "pending", "name": service["name"]})
+        services.append((len(results) - 1, service))
+    update_job_progress(job["_id"], {"rows": len(results), "valid": len(services)})
+
+    # Upload every image first, concurrently; a row whose image fails is not written.
+    # Progress is recorded as each upload finishes, which also keeps the job's lease
+    # alive through imports whose uploads take longer than JOB_LEASE_SECONDS.
+    with_images = [(index, service) for index, service in services if "_image" in service]
+    with ThreadPoolExecutor(max_workers=IMPORT_IMAGE_CONCURRENCY) as pool:
+        uploads = {pool.submit(_upload_row_image, service["_image"]): (index, service)
+                   for index, service in with_images}
+        for uploaded, future in enumerate(as_completed(uploads), start=1):
+            index, service = uploads[future]
+            url = future.result()
+            del service["_image"]
+            if isinstance(url, dict) and "error" in url:
+                results[index].update(status="error", error=f"Image upload failed: {url['error']}")
+            else:
+                service["image"] = url
+            update_job_progress(job["_id"], {"rows": len(results), "valid": len(services),
+                                             "images": len(with_images), "images_uploaded": uploaded})
+    services = [(index, service) for index, service in services if results[index]["status"] == "pending"]
+    update_job_progress(job["_id"], {"rows": len(results), "valid": len(services), "images": len(with_images),
+                                     "images_uploaded": len(with_images)})
+
+    now = datetime.utcnow()
+    for start in range(0, len(services), IMPORT_BATCH_SIZE):
+        batch = services[start:start + IMPORT_BATCH_SIZE]
+        outcome = services_collection.bulk_write([
+            UpdateOne(
+                {"name_lower": service["name_lower"]},
+                {"$set": {**service, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+                upsert=True
+            )
+            for _, service in batch
+        ], ordered=False)
+        upserted = outcome.upserted_ids
+        for position, (index, _) in enumerate(batch):
+            results[index]["status"] = "created" if position in upserted else "updated"
+
+    if services:
+        ids = {
+            service["name_lower"]: str(service["_id"])
+            for service in services_collection.find(
+                {"name_lower": {"$in": [service["name_lower"] for _, service in services]}},
+                {"name_lower": 1}
+            )
+        }
+        for index, service in services:
+            results[index]["service_id"] = ids.get(service["name_lower"])
+        service_catalog.bump()
+
+    for file_id in [payload["source_id"], *payload["images"].values()]:
+        service_import_files.delete(ObjectId(file_id))
+
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in ("created", "updated", "error")}
+    return {**counts, "rows": results}
+
+
+def get_service_import(job_id: str) -> dict:
+    job = get_job(job_id)
+    if not job or job.get("job_type") != "service_import":
+        return {"error": "Import not found"}
+
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "progress": job.get("progress"),
+        "result": job.get("result"),
+        "last_error": job.get("last_error")
+    }
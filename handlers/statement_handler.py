@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+from bson import ObjectId
+from gridfs import GridFS
+from db import db, transactions_collection
+from handlers.wallet_handler import serialize_transaction
+from services.job_queue import job_handler, enqueue_job, get_job, update_job_progress
+
+STATEMENT_FIELDS = [
+    "id", "user_id", "amount", "transaction_type", "status",
+    "reference", "description", "metadata", "created_at"
+]
+STATEMENT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+STATEMENT_BATCH_SIZE = 500
+STATEMENT_PROGRESS_EVERY = 10000
+
+# Finished exports are stored in GridFS so any worker can serve the download
+statement_files = GridFS(db, collection="statement_exports")
+
+
+def _statement_cursor(user_id: str, start_date: Optional[datetime], end_date: Optional[datetime]):
+    query = {"user_id": user_id}
+    if start_date or end_date:
+        query["created_at"] = {}
+        if start_date:
+            query["created_at"]["$gte"] = start_date
+        if end_date:
+            query["created_at"]["$lte"] = end_date
+
+    return transactions_collection.find(query).sort(
+        [("created_at", 1), ("_id", 1)]
+    ).batch_size(STATEMENT_BATCH_SIZE)
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _csv_value(value):
+    if isinstance(value, dict):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_statement(user_id: str, fmt: str = "csv", start_date: Optional[datetime] = None,
+                     end_date: Optional[datetime] = None) -> Iterator[str]:
+    """Yield a statement one encoded row at a time straight from the Mongo cursor"""
+    if fmt not in STATEMENT_FORMATS:
+        raise ValueError(f"Unsupported statement format: {fmt}")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=STATEMENT_FIELDS, extrasaction="ignore")
+
+    def drain() -> str:
+        row = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return row
+
+    if fmt == "csv":
+        writer.writeheader()
+        yield drain()
+
+    for transaction in _statement_cursor(user_id, start_date, end_date):
+        row = serialize_transaction(transaction)
+        if fmt == "csv":
+            writer.writerow({k: _csv_value(v) for k, v in row.items()})
+            yield drain()
+        else:
+            yield json.dumps(row, default=_json_default) + "\n"
+
+
+def statement_filename(user_id: str, fmt: str) -> str:
+    return f"statement_{user_id}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}"
+
+
+def request_statement_export(user_id: str, fmt: str, start_date: Optional[datetime] = None,
+                             end_date: Optional[datetime] = None) -> dict:
+    """Queue a background export; the finished file is downloadable via its job ID"""
+    if fmt not in STATEMENT_FORMATS:
+        return {"error": f"Unsupported statement format: {fmt}"}
+
+    job_id = enqueue_job("statement_export", {
+        "user_id": user_id,
+        "format": fmt,
+        "start_date": start_date,
+        "end_date": end_date
+    })
+    return {"message": "Statement export queued", "job_id": job_id}
+
+
+@job_handler("statement_export")
+def run_statement_export(job: dict) -> dict:
+    payload = job["payload"]
+    fmt = payload["format"]
+    grid_in = statement_files.new_file(
+        filename=statement_filename(payload["user_id"], fmt),
+        content_type=STATEMENT_FORMATS[fmt],
+        metadata={"user_id": payload["user_id"], "job_id": str(job["_id"])}
+    )
+
+    rows = 0
+    try:
+        for chunk in stream_statement(payload["user_id"], fmt, payload.get("start_date"), payload.get("end_date")):
+            grid_in.write(chunk.encode())
+            rows += 1
+            if rows % STATEMENT_PROGRESS_EVERY == 0:
+                update_job_progress(job["_id"], {"rows": rows})
+    except Exception:
+        grid_in.abort()
+        raise
+    grid_in.close()
+
+    return {"file_id": str(grid_in._id), "filename": grid_in.filename, "rows": rows}
+
+
+def get_statement_export(job_id: str, user_id: str) -> dict:
+    job = get_job(job_id)
+    if not job or job.get("job_type") != "statement_export" or job["payload"]["user_id"] != user_id:
+        return {"error": "Export not found"}
+
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "progress": job.get("progress"),
+        "result": job.get("result"),
+        "last_error": job.get("last_error")
+    }
+
+
+def open_statement_file(job_id: str, user_id: str):
+    """Return the GridFS file of a completed export owned by `user_id`, or None"""
+    export = get_statement_export(job_id, user_id)
+    if export.get("status") != "completed":
+        return None
+    return statement_files.get(ObjectId(export["result"]["file_id"]))
@@ -1,7 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional, List
-from db import wallets_collection, transactions_collection, bookings_collection, services_collection
+from db import wallets_collection, transactions_collection, bookings_collection
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from handlers.ledger_handler import (
+    post_journal,
+    get_account_balance,
+    FUNDING_ACCOUNT,
+    PAYOUTS_PENDING_ACCOUNT,
+    SERVICE_PAYMENTS_ACCOUNT
+)
+from services.cache import TTLCache
+from services.catalog_cache import service_catalog
+from services.pagination import keyset_page, encode_cursor
 from models.wallet import (
     TransactionType,
     TransactionStatus,
@@ -9,6 +20,14 @@ from models.wallet import (
     WalletTransactionResponse
 )
 
+DEPOSIT_RECONCILE_AFTER_MINUTES = 30
+# Deposits that may still be credited; None covers those created before deposits had a status
+UNSETTLED_DEPOSIT_STATUSES = [TransactionStatus.PENDING.value, TransactionStatus.CREDITING.value, None]
+
+# History totals are cached per filter signature; a short TTL keeps them close enough for paging UIs
+TRANSACTION_TOTAL_TTL_SECONDS = 30
+_transaction_totals = TTLCache(ttl_seconds=TRANSACTION_TOTAL_TTL_SECONDS)
+
 
 # def serialize_transaction(transaction) -> dict:
 #     if transaction and '_id' in transaction:
@@ -39,13 +58,17 @@ def serialize_transaction(transaction) -> dict:
 
 # Generate Monnify payment link for funding wallet
 def generate_monnify_payment_link(user_id: str, amount: float):
-    payment_reference = f"MONNIFY_{user_id}_{int(datetime.utcnow().timestamp())}"
+    now = datetime.utcnow()
+    payment_reference = f"MONNIFY_{user_id}_{int(now.timestamp())}"
     transaction = {
         "user_id": user_id,
         "amount": amount,
         "transaction_type": "deposit",
+        "status": TransactionStatus.PENDING.value,
         "reference": payment_reference,
-        "created_at": datetime.utcnow()
+        "created_at": now,
+        # Picked up by the deposit reconciliation job if the webhook has not confirmed it by then
+        "reconcile_after": now + timedelta(minutes=DEPOSIT_RECONCILE_AFTER_MINUTES)
     }
     transactions_collection.insert_one(transaction)
     return {"payment_link": f"https://monnify.com/pay/{payment_reference}", "reference": payment_reference}
@@ -53,32 +76,46 @@ def generate_monnify_payment_link(user_id: str, amount: float):
 
 # Monnify webhook to confirm wallet funding
 def confirm_wallet_funding(reference: str):
-    transaction = transactions_collection.find_one({"reference": reference})
+    # Claim the deposit before crediting it. A claim left in "crediting" by a failed
+    # attempt can be claimed again: the journal is keyed by the transaction _id, so
+    # posting it twice credits the wallet once. Failed and expired deposits stay final.
+    transaction = transactions_collection.find_one_and_update(
+        {"reference": reference, "status": {"$in": UNSETTLED_DEPOSIT_STATUSES}},
+        {"$set": {"status": TransactionStatus.CREDITING.value}},
+        return_document=ReturnDocument.AFTER
+    )
     if not transaction:
-        return {"error": "Transaction not found"}
-
-    wallets_collection.update_one(
-        {"user_id": transaction["user_id"]},
-        {"$inc": {"balance": transaction["amount"]}},
-        upsert=True
+        existing = transactions_collection.find_one({"reference": reference}, {"status": 1})
+        if not existing:
+            return {"error": "Transaction not found"}
+        if existing["status"] == TransactionStatus.COMPLETED.value:
+            return {"message": "Wallet already funded"}
+        return {"error": f"Transaction is {existing['status']}"}
+
+    post_journal(
+        str(transaction["_id"]),
+        [(transaction["user_id"], transaction["amount"]), (FUNDING_ACCOUNT, -transaction["amount"])],
+        description=f"Wallet funding {reference}"
+    )
+    transactions_collection.update_one(
+        {"_id": transaction["_id"]},
+        {"$set": {"status": TransactionStatus.COMPLETED.value}}
     )
     return {"message": "Wallet funded successfully"}
 
 
 # Get user wallet balance
 def get_wallet_balance(user_id: str):
-    wallet = wallets_collection.find_one({"user_id": user_id})
-    return {"balance": wallet["balance"] if wallet else 0.0}
+    return {"balance": get_account_balance(user_id)}
 
 
 # Get provider wallet balance
 def get_provider_wallet_balance(provider_id: str):
-    wallet = wallets_collection.find_one({"user_id": provider_id})
-    return {"balance": wallet["balance"] if wallet else 0.0}
+    return {"balance": get_account_balance(provider_id)}
 
 
 # Provider requests withdrawal
-def request_withdrawal(provider_id: str, amount: float):
+def request_withdrawal(provider_id: str, amount: float, destination: Optional[dict] = None):
     wallet = wallets_collection.find_one({"user_id": provider_id})
     if not wallet or wallet["balance"] < amount:
         return {"error": "Insufficient balance"}
@@ -90,49 +127,95 @@ def request_withdrawal(provider_id: str, amount: float):
         "status": "pending",
         "created_at": datetime.utcnow()
     }
+    if destination:
+        # Otherwise the payout goes to the provider's saved payout_account
+        withdrawal_request["destination"] = destination
     transactions_collection.insert_one(withdrawal_request)
     return {"message": "Withdrawal request submitted"}
 
 
-# Admin approves withdrawal
-def approve_withdrawal(withdrawal_id: str):
-    withdrawal = transactions_collection.find_one(
-        {"_id": ObjectId(withdrawal_id), "transaction_type": "withdrawal", "status": "pending"})
-    if not withdrawal:
-        return {"error": "Withdrawal request not found or already processed"}
+def reserve_withdrawal(withdrawal: dict) -> dict:
+    """Move a claimed ("reserving") withdrawal's funds into the payout pending account.
 
-    wallets_collection.update_one(
-        {"user_id": withdrawal["user_id"]},
-        {"$inc": {"balance": -withdrawal["amount"]}}
+    The reservation journal is keyed by the withdrawal ID, so this is safe to
+    repeat for a withdrawal left in "reserving" by a crash.
+    """
+    posted = post_journal(
+        f"{withdrawal['_id']}:reserve",
+        [(withdrawal["user_id"], -withdrawal["amount"]), (PAYOUTS_PENDING_ACCOUNT, withdrawal["amount"])],
+        description="Withdrawal reserved for payout",
+        debit_account=withdrawal["user_id"]
     )
+    if posted is None:
+        transactions_collection.update_one(
+            {"_id": withdrawal["_id"], "status": TransactionStatus.RESERVING.value},
+            {"$set": {"status": TransactionStatus.PENDING.value}}
+        )
+        return {"error": "Insufficient balance"}
+
+    # Approved and reserved in one update, so the payout pipeline never sees one without the other
     transactions_collection.update_one(
-        {"_id": ObjectId(withdrawal_id)},
-        {"$set": {"status": "approved"}}
+        {"_id": withdrawal["_id"], "status": TransactionStatus.RESERVING.value},
+        {"$set": {"status": TransactionStatus.APPROVED.value, "funds_reserved": True}}
     )
     return {"message": "Withdrawal approved"}
 
 
-def get_recent_transactions(user_id: str, limit: int = 5) -> List[WalletTransaction]:
-    """Get recent transactions for a user"""
+# Admin approves withdrawal: funds are reserved now and paid out by the payout pipeline
+def approve_withdrawal(withdrawal_id: str):
     try:
-        transactions = transactions_collection.find(
-            {"user_id": user_id}
-        ).sort("created_at", -1).limit(limit)
+        withdrawal_obj_id = ObjectId(withdrawal_id)
+    except Exception:
+        return {"error": "Invalid withdrawal ID format"}
 
-        return [serialize_transaction(t) for t in transactions]
+    withdrawal = transactions_collection.find_one_and_update(
+        {"_id": withdrawal_obj_id, "transaction_type": "withdrawal", "status": TransactionStatus.PENDING.value},
+        {"$set": {"status": TransactionStatus.RESERVING.value, "reserving_at": datetime.utcnow()}}
+    )
+    if not withdrawal:
+        return {"error": "Withdrawal request not found or already processed"}
+    return reserve_withdrawal(withdrawal)
+
+
+def get_recent_transactions(user_id: str, limit: int = 5, cursor: Optional[str] = None):
+    """Get recent transactions for a user, plus the cursor for the next (older) batch"""
+    try:
+        transactions, next_cursor = keyset_page(
+            transactions_collection,
+            {"user_id": user_id},
+            ["created_at"],
+            limit,
+            cursor=cursor
+        )
+        return [serialize_transaction(t) for t in transactions], next_cursor
     except Exception as e:
         raise Exception(f"Error fetching transactions: {str(e)}")
 
 
+def _count_transactions(query: dict, signature: tuple) -> int:
+    total = _transaction_totals.get(signature)
+    if total is None:
+        total = transactions_collection.count_documents(query)
+        _transaction_totals.set(signature, total)
+    return total
+
+
 def get_transaction_history(
         user_id: str,
         page: int = 1,
         limit: int = 10,
         transaction_type: Optional[str] = None,
         start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None
+        end_date: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True
 ) -> WalletTransactionResponse:
-    """Get paginated transaction history with filters"""
+    """Get paginated transaction history with filters.
+
+    Passing the `next_cursor` of a previous response seeks straight to the
+    next page over the (user_id, created_at, _id) index; `page` is only used
+    when no cursor is given.
+    """
     try:
         query = {"user_id": user_id}
 
@@ -146,11 +229,26 @@ def get_transaction_history(
         elif end_date:
             query["created_at"] = {"$lte": end_date}
 
-        # Get total count
-        total = transactions_collection.count_documents(query)
-
-        # Get paginated results
-        transactions = transactions_collection.find(query).sort("created_at", -1).skip((page - 1) * limit).limit(limit)
+        total = None
+        if include_total:
+            signature = (user_id, transaction_type, start_date, end_date)
+            total = _count_transactions(query, signature)
+
+        if cursor:
+            transactions, next_cursor = keyset_page(
+                transactions_collection, query, ["created_at"], limit, cursor=cursor
+            )
+        else:
+            transactions = list(
+                transactions_collection.find(query)
+                .sort([("created_at", -1), ("_id", -1)])
+                .skip((page - 1) * limit)
+                .limit(limit + 1)
+            )
+            next_cursor = None
+            if len(transactions) > limit:
+                transactions = transactions[:limit]
+                next_cursor = encode_cursor([transactions[-1].get("created_at"), transactions[-1]["_id"]])
 
         # Properly serialize each transaction
         serialized_transactions = [serialize_transaction(t) for t in transactions if t]
@@ -159,7 +257,8 @@ def get_transaction_history(
             transactions=serialized_transactions,
             total=total,
             page=page,
-            limit=limit
+            limit=limit,
+            next_cursor=next_cursor
         )
     except Exception as e:
         raise Exception(f"Error fetching transaction history: {str(e)}")
@@ -181,22 +280,22 @@ def pay_for_service(booking_id: str):
         return {"error": "Booking not found"}
 
     # Get the associated service to get the price
-    service = services_collection.find_one({"_id": ObjectId(booking["service_id"])})
+    service = service_catalog.get(booking["service_id"])
     if not service:
         return {"error": "Service not found"}
 
     price = service["price"]
 
-    # Check wallet balance
-    wallet = wallets_collection.find_one({"user_id": booking["user_id"]})
-    if not wallet or wallet["balance"] < price:
-        return {"error": "Insufficient wallet balance"}
-
-    # Process payment
-    wallets_collection.update_one(
-        {"user_id": booking["user_id"]},
-        {"$inc": {"balance": -price}}
+    # Debit the wallet only if it can cover the price; the check and debit are one atomic update
+    transaction_id = ObjectId()
+    posted = post_journal(
+        str(transaction_id),
+        [(booking["user_id"], -price), (SERVICE_PAYMENTS_ACCOUNT, price)],
+        description=f"Payment for service {service['name']}",
+        debit_account=booking["user_id"]
     )
+    if posted is None:
+        return {"error": "Insufficient wallet balance"}
 
     # Update booking status
     bookings_collection.update_one(
@@ -206,6 +305,7 @@ def pay_for_service(booking_id: str):
 
     # Create transaction record
     transaction = {
+        "_id": transaction_id,
         "user_id": booking["user_id"],
         "amount": price,
         "transaction_type": "payment",
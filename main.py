@@ -14,6 +14,17 @@ from routes.provider_routes import router as provider_router
 from routes.review_routes import router as review_router
 from routes.upload_routes import router as upload_router
 from routes.provider_dashboard_routes import router as dashboard_router
+from db import ensure_indexes
+from services.scheduler import scheduler
+from services.catalog_cache import service_catalog
+from services.upload_service import UploadSizeLimitMiddleware, UPLOAD_LIMITS
+from services.job_queue import run_pending_jobs
+from handlers.payout_handler import run_payouts
+from handlers.reconciliation_handler import reconcile_pending_deposits
+from handlers.ledger_handler import snapshot_wallets, audit_snapshots, open_legacy_wallets
+from handlers.review_handler import ensure_rating_stats
+from handlers.service_import_handler import IMPORT_MAX_REQUEST_BYTES
+from handlers.gallery_handler import GALLERY_UPLOAD_MAX_BYTES
 
 app = FastAPI(
     title="Fixa API",
@@ -30,6 +41,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Refuse oversized uploads before their bodies are read. Bulk service imports and
+# gallery uploads carry several files, so they get their own, larger limits.
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits=(
+        ("/api/services/import", IMPORT_MAX_REQUEST_BYTES),
+        ("/api/providers/dashboard/gallery", GALLERY_UPLOAD_MAX_BYTES),
+    ) + UPLOAD_LIMITS
+)
+
 # Include routers
 app.include_router(auth_router, prefix="/api/auth", tags=["Auth"])
 app.include_router(wallet_router, prefix="/api/wallets", tags=["Wallets"])
@@ -38,12 +59,34 @@ app.include_router(support_ticket_router, prefix="/api/support-tickets", tags=["
 app.include_router(admin_router, prefix="/api/admin", tags=["Users"])
 app.include_router(booking_router, prefix="/api/bookings", tags=["Bookings"])
 app.include_router(notifications_router, prefix="/api/notifications", tags=["Notifications"])
-app.include_router(provider_router, prefix="/api/providers", tags=["Providers"])
+# Before the provider router, whose /{provider_id}/... paths would otherwise match /dashboard/...
 app.include_router(dashboard_router, prefix="/api/providers/dashboard", tags=["Provider Dashboard"])
+app.include_router(provider_router, prefix="/api/providers", tags=["Providers"])
 app.include_router(review_router, prefix="/api/review", tags=["Reviews"])
 app.include_router(upload_router, prefix="/api/file", tags=["Upload"])
 
 
+@app.on_event("startup")
+def start_background_jobs():
+    ensure_indexes()
+    ensure_rating_stats()
+    scheduler.add_job(open_legacy_wallets, "date", id="open_legacy_wallets", replace_existing=True)
+    scheduler.add_job(snapshot_wallets, "interval", minutes=5, id="wallet_snapshots", replace_existing=True)
+    scheduler.add_job(audit_snapshots, "interval", hours=1, id="wallet_snapshot_audit", replace_existing=True)
+    scheduler.add_job(run_payouts, "interval", minutes=15, id="withdrawal_payouts", replace_existing=True)
+    scheduler.add_job(reconcile_pending_deposits, "interval", minutes=10, id="deposit_reconciliation",
+                      replace_existing=True)
+    scheduler.add_job(run_pending_jobs, "interval", seconds=5, id="job_queue", max_instances=4,
+                      replace_existing=True)
+    scheduler.start()
+    service_catalog.start_watcher()
+
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    scheduler.shutdown(wait=False)
+
+
 @app.get("/")
 def root():
     return {"message": "Welcome to the All-Purpose Services API"}
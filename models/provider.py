@@ -56,6 +56,10 @@ class ProviderResponse(ProviderBase):
     id: str = Field(..., alias="_id")
     created_at: Optional[datetime] = None
     services: List[dict] = Field(default_factory=list)
+    # {"thumb": {"webp": url, "avif": url}, "card": ..., "full": ...}
+    profile_image_variants: Optional[Dict[str, Dict[str, str]]] = None
+    # The gallery itself is read from /{provider_id}/gallery
+    gallery_count: int = 0
     rating_stats: RatingStats
     recent_reviews: List[ReviewPreview] = Field(default_factory=list)
 
@@ -95,6 +99,7 @@ class DashboardStatsResponse(BaseModel):
     pending_bookings: int
     recent_earnings: float
     average_rating: float
+    status_counts: Dict[str, int] = {}
 
 class EarningsResponse(BaseModel):
     period: str
@@ -103,6 +108,21 @@ class EarningsResponse(BaseModel):
     start_date: str
     end_date: str
 
+class EarningsPoint(BaseModel):
+    period_start: str
+    earnings: float
+    bookings: int
+    completed: int
+    cancelled: int
+
+class EarningsSeriesResponse(BaseModel):
+    interval: str
+    start_date: str
+    end_date: str
+    total_earnings: float
+    total_bookings: int
+    points: List[EarningsPoint]
+
 class BookingResponse(BaseModel):
     id: str
     service_id: Optional[str]
@@ -113,6 +133,25 @@ class BookingResponse(BaseModel):
     created_at: Optional[datetime]
     completed_at: Optional[datetime]
 
+class GalleryImage(BaseModel):
+    id: str
+    url: str
+    url_variants: Optional[Dict[str, Dict[str, str]]] = None
+    caption: Optional[str] = None
+    created_at: datetime
+
+class GalleryPage(BaseModel):
+    images: List[GalleryImage]
+    total: int
+    next_offset: Optional[int] = None
+
+class GalleryUploadResponse(BaseModel):
+    images: List[GalleryImage]
+    errors: List[dict] = []
+
+class GalleryReorderRequest(BaseModel):
+    image_ids: List[str]
+
 class ProviderProfileUpdate(BaseModel):
     bio: Optional[str]
     experience_years: Optional[int]
@@ -49,6 +49,7 @@ class ReviewFilter(BaseModel):
 
 class ReviewQueryParams(BaseModel):
     page: int = Field(1, ge=1)
+    cursor: Optional[str] = None
     limit: int = Field(10, ge=1, le=100)
     sort_by: ReviewSortField = ReviewSortField.DATE
     sort_order: SortOrder = SortOrder.DESC
@@ -57,10 +58,11 @@ class ReviewQueryParams(BaseModel):
 
 class PaginatedReviewResponse(BaseModel):
     reviews: List[ReviewResponse]
-    total: int
-    page: int
+    total: Optional[int] = None
+    page: int = 1
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 
@@ -71,6 +73,9 @@ class RatingStatsResponse(BaseModel):
     count: int
     breakdown: Dict[int, int]
 
+class RatingStatsBatchRequest(BaseModel):
+    provider_ids: List[str] = Field(..., min_length=1, max_length=100)
+
 class AverageRatingResponse(BaseModel):
     provider_id: str
     average_rating: float
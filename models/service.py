@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class ServiceBase(BaseModel):
@@ -25,7 +25,16 @@ class ServiceUpdate(BaseModel):
 class ServiceResponse(ServiceBase):
     """Model for returning service details."""
     id: str = Field(..., alias="_id")
+    # {"thumb": {"webp": url, "avif": url}, "card": ..., "full": ...}
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None
 
     class Config:
         orm_mode = True
         allow_population_by_field_name = True
+
+
+
+class ServiceCatalogResponse(BaseModel):
+    """A page of catalog search results."""
+    services: List[ServiceResponse]
+    next_cursor: Optional[str] = None
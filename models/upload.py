@@ -1,4 +1,29 @@
+from enum import Enum
 from pydantic import BaseModel
+from typing import Optional, Union
+
+
+class ImageSize(str, Enum):
+    THUMB = "thumb"
+    CARD = "card"
+    FULL = "full"
+
+
+class ImageFormat(str, Enum):
+    WEBP = "webp"
+    AVIF = "avif"
+
 
 class ImageUploadResponse(BaseModel):
-    url: str
\ No newline at end of file
+    url: str
+
+class DirectUploadRequest(BaseModel):
+    target: str = "profile"
+    target_id: Optional[str] = None
+
+
+class DirectUploadComplete(BaseModel):
+    intent_id: str
+    public_id: str
+    version: Union[int, str]
+    signature: str
@@ -13,11 +13,18 @@ class TransactionType(str, Enum):
 
 class TransactionStatus(str, Enum):
     PENDING = "pending"
+    CREDITING = "crediting"
     COMPLETED = "completed"
     FAILED = "failed"
+    EXPIRED = "expired"
     REVERSED = "reversed"
+    RESERVING = "reserving"
     APPROVED = "approved"
+    PROCESSING = "processing"
+    SETTLING = "settling"
+    RELEASING = "releasing"
     DECLINED = "declined"
+    REJECTED = "rejected"
 
 # class WalletTransaction(BaseModel):
 #     id: str = Field(alias="_id")
@@ -43,9 +50,10 @@ class WalletTransaction(BaseModel):
 
 class WalletTransactionResponse(BaseModel):
     transactions: List[WalletTransaction]
-    total: int
+    total: Optional[int] = None  # None when the caller opted out of counting
     page: int
     limit: int
+    next_cursor: Optional[str] = None
 
 
 
@@ -1,36 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Response
+from fastapi.responses import StreamingResponse
 from db import users_collection, providers_collection, bookings_collection, transactions_collection
 from bson import ObjectId
 from models.user import User
 from services.auth_service import get_current_admin
-from handlers.admin_handler import get_all_users as get_users, get_all_providers as get_providers, get_all_bookings as get_bookings, get_all_wallet_transactions as get_wallet_transactions, approve_withdrawal as withdrawal_approve, reject_withdrawal as withdrawal_rejection, delete_user as delete_user_data, delete_provider as delete_provider_data
+from handlers.ledger_handler import audit_snapshots
+from handlers.payout_handler import run_payouts, get_payout_batch
+from handlers.earnings_handler import request_rollup_backfill
+from handlers.review_handler import request_rating_stats_rebuild
+from services.catalog_cache import service_catalog
+from services.image_store import get_dedup_stats
+from handlers.provider_import_handler import queue_provider_import, get_provider_import
+from handlers.migration_handler import list_migrations, start_migration, get_migration_run, get_migration_runs
+from handlers.reconciliation_handler import request_deposit_reconciliation, get_latest_reconciliation_report
+from handlers.admin_handler import search_users, get_admin_page, stream_admin_list, ADMIN_LIST_FORMATS, ADMIN_LIST_PAGE_SIZE, approve_withdrawal as withdrawal_approve, reject_withdrawal as withdrawal_rejection, delete_user as delete_user_data, delete_provider as delete_provider_data
 
 router = APIRouter()
 
+def _admin_list(name: str, response: Response, filters: dict, fields: Optional[str], created_from: Optional[datetime],
+                created_to: Optional[datetime], limit: int, cursor: Optional[str], format: str):
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    if format in ADMIN_LIST_FORMATS:
+        return StreamingResponse(
+            stream_admin_list(name, format, filters, field_list, created_from, created_to),
+            media_type=ADMIN_LIST_FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'}
+        )
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json, csv or ndjson")
+    try:
+        documents, next_cursor = get_admin_page(name, filters, field_list, created_from, created_to, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return documents
+
+# List endpoints return one page (cursor in X-Next-Cursor) or, with format=csv|ndjson, stream every match
+LIST_FIELDS = Query(None, description="Comma-separated fields to return")
+LIST_CREATED_FROM = Query(None, description="Only documents created at or after this time")
+LIST_CREATED_TO = Query(None, description="Only documents created at or before this time")
+LIST_LIMIT = Query(ADMIN_LIST_PAGE_SIZE, ge=1, le=500)
+LIST_CURSOR = Query(None, description="X-Next-Cursor value from a previous call")
+LIST_FORMAT = Query("json", description="json (one page), csv or ndjson (everything, streamed)")
+
 @router.get("/users", response_model=list)
-def get_all_users(admin: User = Depends(get_current_admin)):
-    """Retrieve all users (Admin only)"""
-    return get_users()
+def get_all_users(
+        response: Response,
+        role: Optional[str] = None,
+        is_available: Optional[bool] = None,
+        fields: Optional[str] = LIST_FIELDS,
+        created_from: Optional[datetime] = LIST_CREATED_FROM,
+        created_to: Optional[datetime] = LIST_CREATED_TO,
+        limit: int = LIST_LIMIT,
+        cursor: Optional[str] = LIST_CURSOR,
+        format: str = LIST_FORMAT,
+        admin: User = Depends(get_current_admin)
+):
+    """Retrieve users, newest first (Admin only)"""
+    return _admin_list("users", response, {"role": role, "is_available": is_available},
+                       fields, created_from, created_to, limit, cursor, format)
+
+@router.get("/users/search", response_model=list)
+def search_all_users(
+        response: Response,
+        q: str = Query(..., min_length=1, description="Start of the email, phone number or name"),
+        by: str = Query("auto", description="auto, email, phone or name"),
+        role: Optional[str] = None,
+        is_available: Optional[bool] = None,
+        fields: Optional[str] = LIST_FIELDS,
+        created_from: Optional[datetime] = LIST_CREATED_FROM,
+        created_to: Optional[datetime] = LIST_CREATED_TO,
+        limit: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = LIST_CURSOR,
+        admin: User = Depends(get_current_admin)
+):
+    """Find users by email, phone or name prefix (Admin only); the next page's cursor is in X-Next-Cursor"""
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    try:
+        users, next_cursor = search_users(q, by, role, is_available, created_from, created_to,
+                                          field_list, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return users
 
 @router.get("/providers", response_model=list)
-def get_all_providers():
-    """Retrieve all service providers"""
-    return get_providers()
+def get_all_providers(
+        response: Response,
+        is_available: Optional[bool] = None,
+        fields: Optional[str] = LIST_FIELDS,
+        created_from: Optional[datetime] = LIST_CREATED_FROM,
+        created_to: Optional[datetime] = LIST_CREATED_TO,
+        limit: int = LIST_LIMIT,
+        cursor: Optional[str] = LIST_CURSOR,
+        format: str = LIST_FORMAT,
+        admin: User = Depends(get_current_admin)
+):
+    """Retrieve service providers, newest first (Admin only)"""
+    return _admin_list("providers", response, {"is_available": is_available},
+                       fields, created_from, created_to, limit, cursor, format)
 
 @router.get("/bookings", response_model=list)
-def get_all_bookings():
-    """Retrieve all bookings"""
-    return get_bookings()
+def get_all_bookings(
+        response: Response,
+        status: Optional[str] = None,
+        user_id: Optional[str] = None,
+        provider_id: Optional[str] = None,
+        fields: Optional[str] = LIST_FIELDS,
+        created_from: Optional[datetime] = LIST_CREATED_FROM,
+        created_to: Optional[datetime] = LIST_CREATED_TO,
+        limit: int = LIST_LIMIT,
+        cursor: Optional[str] = LIST_CURSOR,
+        format: str = LIST_FORMAT,
+        admin: User = Depends(get_current_admin)
+):
+    """Retrieve bookings, newest first (Admin only)"""
+    return _admin_list("bookings", response, {"status": status, "user_id": user_id, "provider_id": provider_id},
+                       fields, created_from, created_to, limit, cursor, format)
 
 @router.get("/transactions", response_model=list)
-def get_all_wallet_transactions():
-    """Retrieve all wallet transactions"""
-    return get_wallet_transactions()
+def get_all_wallet_transactions(
+        response: Response,
+        transaction_type: Optional[str] = None,
+        status: Optional[str] = None,
+        user_id: Optional[str] = None,
+        fields: Optional[str] = LIST_FIELDS,
+        created_from: Optional[datetime] = LIST_CREATED_FROM,
+        created_to: Optional[datetime] = LIST_CREATED_TO,
+        limit: int = LIST_LIMIT,
+        cursor: Optional[str] = LIST_CURSOR,
+        format: str = LIST_FORMAT,
+        admin: User = Depends(get_current_admin)
+):
+    """Retrieve wallet transactions, newest first (Admin only)"""
+    return _admin_list("transactions", response,
+                       {"transaction_type": transaction_type, "status": status, "user_id": user_id},
+                       fields, created_from, created_to, limit, cursor, format)
 
 @router.put("/withdrawals/{withdrawal_id}/approve")
 def approve_withdrawal(withdrawal_id: str, admin: User = Depends(get_current_admin)):
     """Approve provider withdrawal request"""
-    return withdrawal_approve(withdrawal_id)
+    response = withdrawal_approve(withdrawal_id)
+    if "error" in response:
+        raise HTTPException(status_code=400, detail=response["error"])
+    return response
 
 @router.put("/withdrawals/{withdrawal_id}/reject")
 def reject_withdrawal(withdrawal_id: str, admin: User = Depends(get_current_admin)):
@@ -42,7 +159,118 @@ def delete_user(user_id: str, admin: User = Depends(get_current_admin)):
     """Delete a user (Admin only)"""
     return delete_user_data(user_id)
 
+@router.post("/providers/import", response_model=dict, status_code=202)
+def import_providers(
+        file: UploadFile = File(..., description="CSV or NDJSON with full_name, email, password, phone_number, "
+                                                 "address, bio, experience_years, base_price, skills"),
+        admin: User = Depends(get_current_admin)
+):
+    """Register providers in bulk as a background job; poll /providers/imports/{job_id} for the report"""
+    result = queue_provider_import(file.file, file.filename, str(admin["_id"]))
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/providers/imports/{job_id}", response_model=dict)
+def provider_import_status(job_id: str, admin: User = Depends(get_current_admin)):
+    """Status and per-row report of a bulk provider import"""
+    result = get_provider_import(job_id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
 @router.delete("/providers/{provider_id}")
 def delete_provider(provider_id: str, admin: User = Depends(get_current_admin)):
     """Delete a provider"""
     return delete_provider_data(provider_id)
+
+
+@router.post("/ledger/audit", response_model=dict)
+def audit_wallet_ledger(admin: User = Depends(get_current_admin)):
+    """Verify pending wallet snapshots against the ledger (Admin only)"""
+    return audit_snapshots()
+
+
+@router.post("/payouts/run", response_model=dict)
+def run_withdrawal_payouts(admin: User = Depends(get_current_admin)):
+    """Batch approved withdrawals into Monnify bulk disbursements and reconcile earlier batches"""
+    return run_payouts()
+
+
+@router.get("/payouts/{batch_reference}", response_model=dict)
+def payout_batch_details(batch_reference: str, admin: User = Depends(get_current_admin)):
+    """Get the status of a payout batch"""
+    batch = get_payout_batch(batch_reference)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Payout batch not found")
+    return batch
+
+
+@router.post("/reconciliation/deposits", response_model=dict)
+def run_deposit_reconciliation(admin: User = Depends(get_current_admin)):
+    """Queue a run that verifies pending deposits with Monnify and settles or expires them"""
+    job_id = request_deposit_reconciliation()
+    return {"message": "Deposit reconciliation queued", "job_id": job_id}
+
+
+@router.get("/reconciliation/deposits/latest", response_model=dict)
+def latest_deposit_reconciliation(admin: User = Depends(get_current_admin)):
+    """Summary of the most recent deposit reconciliation run"""
+    report = get_latest_reconciliation_report()
+    if "error" in report:
+        raise HTTPException(status_code=404, detail=report["error"])
+    return report
+
+
+@router.post("/earnings/rollups/backfill", response_model=dict)
+def backfill_earnings_rollups(start_date: date, end_date: date, provider_id: Optional[str] = None,
+                              admin: User = Depends(get_current_admin)):
+    """Queue a rebuild of daily earnings rollups from bookings for a date range"""
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    job_id = request_rollup_backfill(start_date, end_date, provider_id)
+    return {"message": "Earnings rollup backfill queued", "job_id": job_id}
+
+
+@router.get("/migrations", response_model=dict)
+def get_migrations(admin: User = Depends(get_current_admin)):
+    """List registered data migrations and their recent runs"""
+    return {"migrations": list_migrations(), "runs": get_migration_runs()}
+
+
+@router.post("/migrations/{name}/runs", response_model=dict)
+def start_data_migration(name: str, dry_run: bool = True, batch_size: int = 500, throttle_ms: int = 100,
+                  admin: User = Depends(get_current_admin)):
+    """Start a data migration in the background (dry run unless dry_run=false)"""
+    run = start_migration(name, dry_run=dry_run, batch_size=batch_size, throttle_ms=throttle_ms)
+    if "error" in run:
+        raise HTTPException(status_code=400, detail=run["error"])
+    return run
+
+
+@router.get("/migrations/runs/{run_id}", response_model=dict)
+def migration_run_status(run_id: str, admin: User = Depends(get_current_admin)):
+    """Progress of a data migration run"""
+    run = get_migration_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Migration run not found")
+    return run
+
+
+@router.post("/reviews/rating-stats/rebuild", response_model=dict)
+def rebuild_provider_rating_stats(admin: User = Depends(get_current_admin)):
+    """Queue a rebuild of every provider's rating counters from the reviews"""
+    job_id = request_rating_stats_rebuild()
+    return {"message": "Rating stats rebuild queued", "job_id": job_id}
+
+
+@router.get("/cache/stats", response_model=dict)
+def cache_stats(admin: User = Depends(get_current_admin)):
+    """Hit rates and versions of this worker's in-process caches"""
+    return {"service_catalog": service_catalog.stats()}
+
+
+@router.get("/uploads/dedup/stats", response_model=dict)
+def upload_dedup_stats(admin: User = Depends(get_current_admin)):
+    """Stored images, their references and the upload bytes saved by content deduplication"""
+    return get_dedup_stats()
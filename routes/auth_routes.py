@@ -6,9 +6,8 @@ from handlers.auth_handler import (
     update_profile, switch_role, verify_otp, forgot_password, reset_password,
     delete_account
 )
-from services.monnify_service import create_reserved_account
+from handlers.provisioning_handler import queue_user_provisioning, get_provisioning_status
 from services.auth_service import get_current_user, authenticate_user, create_access_token
-from services.cloudinary_service import upload_image
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 
@@ -28,10 +27,6 @@ def register(
         address: Optional[str] = Form(None),
         profile_image: Optional[UploadFile] = File(None)
 ):
-    profile_image_url = None
-    if profile_image:
-        profile_image_url = upload_image(profile_image.file)
-
     user_data = {
         "full_name": full_name,
         "email": email,
@@ -39,22 +34,37 @@ def register(
         "role": role,
         "phone_number": phone_number,
         "address": address,
-        "profile_image": profile_image_url
+        "profile_image": None
     }
 
     result = register_user(user_data)
     if "error" in result:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result["error"])
 
-    # Create reserved account after successful registration
-    reserved_account = create_reserved_account(
-        account_reference=result["user_id"],
-        account_name=full_name,
-        customer_email=email,
-        bvn="",  # If BVN is required, add it as a form field
-        customer_name=full_name
+    # Reserved account creation and the image upload run as background jobs;
+    # poll /provisioning (or watch notifications) for the outcome
+    provisioning = queue_user_provisioning(
+        result["user_id"],
+        full_name,
+        email,
+        profile_image=profile_image.file if profile_image else None,
+        content_type=profile_image.content_type if profile_image else None
     )
-    return {"message": result["message"], "reserved_account": reserved_account}
+    return {
+        "message": result["message"],
+        "user_id": result["user_id"],
+        "reserved_account": None,
+        "provisioning": provisioning
+    }
+
+
+# Provisioning status of the current user's wallet account and profile image
+@router.get("/provisioning")
+def provisioning_status(user: dict = Depends(get_current_user)):
+    result = get_provisioning_status(user["_id"])
+    if "error" in result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["error"])
+    return result
 
 
 # Login user
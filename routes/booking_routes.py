@@ -10,7 +10,7 @@ from handlers.booking_handler import (
     delete_booking,
 )
 from services.auth_service import get_current_user
-from db import services_collection
+from services.catalog_cache import service_catalog
 
 router = APIRouter(prefix="/bookings", tags=["Bookings"])
 
@@ -18,7 +18,7 @@ router = APIRouter(prefix="/bookings", tags=["Bookings"])
 @router.post("/", response_model=Booking)
 def create_new_booking(booking_data: BookingCreate, user: dict = Depends(get_current_user)):
 
-    service = services_collection.find_one({"_id": ObjectId(booking_data.service_id)})
+    service = service_catalog.get(booking_data.service_id)
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
 
@@ -1,26 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from datetime import date, datetime, timedelta
 from typing import List, Optional
 from bson import ObjectId
-from bson.errors import InvalidId
+from models.upload import ImageSize, ImageFormat
 from models.provider import (
     DashboardStatsResponse,
     EarningsResponse,
+    EarningsSeriesResponse,
     BookingResponse,
     ServiceUpdate,
-    AvailabilityUpdate
+    AvailabilityUpdate,
+    GalleryPage,
+    GalleryUploadResponse,
+    GalleryReorderRequest
 )
 from services.auth_service import get_current_provider
+from handlers.booking_handler import get_provider_booking_summary, EARNINGS_WINDOWS
+from handlers.earnings_handler import get_earnings_series, record_booking_transition
+from handlers.review_handler import get_review_page
+from handlers.service_handler import service_ref
+from handlers.gallery_handler import add_gallery_images, get_gallery_page, reorder_gallery, delete_gallery_image
+from services.catalog_cache import service_catalog
 from db import (
     users_collection,
-    services_collection,
     bookings_collection,
-    transactions_collection,
-    reviews_collection
+    transactions_collection
 )
-import tempfile
-import os
-from services.cloudinary_service import upload_image
+from services.upload_service import check_image_file, upload_image_async, UploadRejected
 
 router = APIRouter()
 
@@ -36,49 +42,16 @@ async def get_dashboard_stats(
     provider_id = str(current_provider["_id"])
 
     try:
-        # Total services offered
-        total_services = len(current_provider.get("services_offered", []))
-
-        # Total bookings
-        total_bookings = bookings_collection.count_documents({
-            "provider_id": provider_id
-        })
-
-        # Pending bookings
-        pending_bookings = bookings_collection.count_documents({
-            "provider_id": provider_id,
-            "status": "pending"
-        })
-
-        # Recent earnings (include both accepted and completed)
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        earnings_result = bookings_collection.aggregate([
-            {
-                "$match": {
-                    "provider_id": provider_id,
-                    "status": {"$in": ["completed", "accepted"]},
-                    "created_at": {"$gte": thirty_days_ago}
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "total": {"$sum": "$price"}
-                }
-            }
-        ])
-        earnings = list(earnings_result)
-        recent_earnings = earnings[0]["total"] if earnings else 0
-
-        # Average rating
-        avg_rating = current_provider.get("rating", 0)
+        summary = get_provider_booking_summary(provider_id)
 
         return {
-            "total_services": total_services,
-            "total_bookings": total_bookings,
-            "pending_bookings": pending_bookings,
-            "recent_earnings": recent_earnings,
-            "average_rating": avg_rating
+            "total_services": len(current_provider.get("services_offered", [])),
+            "total_bookings": summary["total_bookings"],
+            "pending_bookings": summary["status_counts"].get("pending", 0),
+            # Accepted and completed bookings over the last 30 days
+            "recent_earnings": summary["earnings"]["month"]["total_earnings"],
+            "average_rating": current_provider.get("rating", 0),
+            "status_counts": summary["status_counts"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -92,103 +65,47 @@ async def get_earnings(
         period: str = Query("month"),
         current_provider: dict = Depends(get_current_provider)
 ):
-    try:
-        provider_id = str(current_provider["_id"])
-        now = datetime.now()
-
-        # Calculate date range
-        if period == "week":
-            start_date = now - timedelta(days=7)
-        elif period == "month":
-            start_date = now - timedelta(days=30)
-        elif period == "year":
-            start_date = now - timedelta(days=365)
-        else:
-            raise HTTPException(status_code=400, detail="Invalid period specified")
-
-        # Match both completed status and created_at date
-        pipeline = [
-            {
-                "$match": {
-                    "provider_id": provider_id,
-                    "status": {"$in": ["completed", "accepted"]},  # Include accepted bookings
-                    "created_at": {"$gte": start_date}
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "total_earnings": {"$sum": "$price"},
-                    "total_bookings": {"$sum": 1}
-                }
-            }
-        ]
+    if period not in EARNINGS_WINDOWS:
+        raise HTTPException(status_code=400, detail="Invalid period specified")
 
-        result = list(bookings_collection.aggregate(pipeline))
+    try:
+        summary = get_provider_booking_summary(str(current_provider["_id"]))
+        earnings = summary["earnings"][period]
 
         return {
             "period": period,
-            "total_earnings": result[0]["total_earnings"] if result else 0,
-            "total_bookings": result[0]["total_bookings"] if result else 0,
-            "start_date": start_date.isoformat(),
-            "end_date": now.isoformat()
+            "total_earnings": earnings["total_earnings"],
+            "total_bookings": earnings["total_bookings"],
+            "start_date": earnings["start_date"].isoformat(),
+            "end_date": summary["as_of"].isoformat()
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/earnings/series", response_model=EarningsSeriesResponse)
+async def get_earnings_time_series(
+        start_date: Optional[date] = Query(None),
+        end_date: Optional[date] = Query(None),
+        interval: str = Query("day"),
+        current_provider: dict = Depends(get_current_provider)
+):
+    """
+    Earnings per day, week or month for charting (defaults to the last 30 days)
+    """
+    end_date = end_date or datetime.utcnow().date()
+    start_date = start_date or end_date - timedelta(days=29)
+
+    result = get_earnings_series(str(current_provider["_id"]), start_date, end_date, interval)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
 # --------------------------
 # Booking Management
 # --------------------------
 
 
-@router.get("/migrate_bookings")
-def migrate_booking_prices():
-    try:
-        # Get all bookings without a price field
-        bookings = bookings_collection.find({"price": {"$exists": False}})
-        updated_count = 0
-
-        for booking in bookings:
-            try:
-                # Handle both string and ObjectId service_ids
-                service_id = booking["service_id"]
-
-                # If service_id is already an ObjectId (in case of direct DB access)
-                if isinstance(service_id, ObjectId):
-                    service_obj_id = service_id
-                else:
-                    # Try to convert string to ObjectId
-                    service_obj_id = ObjectId(service_id)
-
-                # Find the service
-                service = services_collection.find_one({"_id": service_obj_id})
-
-                if service:
-                    # Update the booking with the service price
-                    result = bookings_collection.update_one(
-                        {"_id": booking["_id"]},
-                        {"$set": {"price": service["price"]}}
-                    )
-                    if result.modified_count > 0:
-                        updated_count += 1
-
-            except (InvalidId, KeyError) as e:
-                print(f"Skipping booking {booking.get('_id')} - invalid service_id: {str(e)}")
-                continue
-
-        return {
-            "message": f"Successfully updated {updated_count} bookings",
-            "updated_count": updated_count
-        }
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Migration failed: {str(e)}"
-        )
-
-
 @router.get("/bookings", response_model=List[BookingResponse])
 async def get_provider_bookings(
         status: Optional[str] = Query(None),
@@ -227,7 +144,7 @@ async def accept_booking(
     Accept a booking request
     """
     try:
-        result = bookings_collection.update_one(
+        previous = bookings_collection.find_one_and_update(
             {
                 "_id": ObjectId(booking_id),
                 "provider_id": str(current_provider["_id"]),
@@ -236,8 +153,9 @@ async def accept_booking(
             {"$set": {"status": "accepted"}}
         )
 
-        if result.modified_count == 0:
+        if not previous:
             raise HTTPException(status_code=400, detail="Booking not found or already processed")
+        record_booking_transition(previous, "accepted")
 
         return {"message": "Booking accepted successfully"}
 
@@ -254,7 +172,7 @@ async def complete_booking(
     Mark a booking as completed
     """
     try:
-        result = bookings_collection.update_one(
+        previous = bookings_collection.find_one_and_update(
             {
                 "_id": ObjectId(booking_id),
                 "provider_id": str(current_provider["_id"]),
@@ -268,8 +186,9 @@ async def complete_booking(
             }
         )
 
-        if result.modified_count == 0:
+        if not previous:
             raise HTTPException(status_code=400, detail="Booking not found or not in accepted state")
+        record_booking_transition(previous, "completed")
 
         return {"message": "Booking marked as completed"}
 
@@ -333,16 +252,13 @@ async def update_profile_image(
     provider_id = current_provider["_id"]
 
     try:
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(await image.read())
-            temp_path = temp_file.name
+        image_file = check_image_file(image)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-        # Upload to Cloudinary
-        image_url = upload_image(temp_path, folder="provider_profiles")
-
-        # Clean up temporary file
-        os.unlink(temp_path)
+    try:
+        # Upload to Cloudinary straight from the spooled part, off the event loop
+        image_url = await upload_image_async(image_file, folder="provider_profiles")
 
         if isinstance(image_url, dict) and "error" in image_url:
             raise HTTPException(status_code=400, detail=image_url["error"])
@@ -353,7 +269,8 @@ async def update_profile_image(
             {"$set": {"profile_image": image_url}}
         )
 
-        if result.modified_count == 0:
+        # A re-uploaded identical image yields the same URL, so nothing is modified
+        if result.matched_count == 0:
             raise HTTPException(status_code=400, detail="Failed to update profile image")
 
         return {"message": "Profile image updated successfully", "image_url": image_url}
@@ -362,6 +279,78 @@ async def update_profile_image(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# --------------------------
+# Portfolio Gallery
+# --------------------------
+
+@router.get("/gallery", response_model=GalleryPage)
+def get_own_gallery(
+        offset: int = Query(0, ge=0),
+        limit: int = Query(20, ge=1, le=50),
+        image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+        image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant"),
+        current_provider: dict = Depends(get_current_provider)
+):
+    """
+    Get one page of the provider's portfolio gallery, in display order
+    """
+    return get_gallery_page(str(current_provider["_id"]), offset, limit,
+                            image_size and image_size.value, image_format.value)
+
+
+@router.post("/gallery", response_model=GalleryUploadResponse)
+async def upload_gallery_images(
+        images: List[UploadFile] = File(...),
+        captions: Optional[List[str]] = Form(None),
+        current_provider: dict = Depends(get_current_provider)
+):
+    """
+    Add images to the portfolio gallery
+
+    The images are uploaded concurrently and appended in the order they were
+    sent; `captions` pairs with `images` by position. Images that fail to
+    upload are reported in `errors` by index.
+    """
+    try:
+        image_files = [check_image_file(image) for image in images]
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    result = await add_gallery_images(str(current_provider["_id"]), image_files, captions)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@router.put("/gallery/order")
+def reorder_gallery_images(
+        data: GalleryReorderRequest,
+        current_provider: dict = Depends(get_current_provider)
+):
+    """
+    Set the display order of the gallery; image_ids must list every image once
+    """
+    result = reorder_gallery(str(current_provider["_id"]), data.image_ids)
+    if "error" in result:
+        status_code = 409 if "changed" in result["error"] else 400
+        raise HTTPException(status_code=status_code, detail=result["error"])
+    return result
+
+
+@router.delete("/gallery/{image_id}")
+def remove_gallery_image(
+        image_id: str,
+        current_provider: dict = Depends(get_current_provider)
+):
+    """
+    Remove an image from the gallery
+    """
+    result = delete_gallery_image(str(current_provider["_id"]), image_id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+
 # --------------------------
 # Availability Management
 # --------------------------
@@ -413,8 +402,7 @@ async def get_my_services(
         if not provider:
             raise HTTPException(status_code=404, detail="Provider not found")
 
-        service_ids = [ObjectId(id) for id in provider.get("services_offered", [])]
-        services = list(services_collection.find({"_id": {"$in": service_ids}}))
+        services = list(service_catalog.get_many(provider.get("services_offered", [])).values())
 
         return [{
             "id": str(service["_id"]),
@@ -440,14 +428,14 @@ async def add_my_service(
 
     try:
         # Verify service exists
-        service = services_collection.find_one({"_id": ObjectId(service_id)})
+        service = service_catalog.get(service_id)
         if not service:
             raise HTTPException(status_code=404, detail="Service not found")
 
         # Add to provider's services
         result = users_collection.update_one(
             {"_id": ObjectId(provider_id)},
-            {"$addToSet": {"services_offered": service_id}}
+            {"$addToSet": {"services_offered": service_ref(service_id)}}
         )
 
         if result.modified_count == 0:
@@ -472,7 +460,7 @@ async def remove_my_service(
     try:
         result = users_collection.update_one(
             {"_id": ObjectId(provider_id)},
-            {"$pull": {"services_offered": service_id}}
+            {"$pull": {"services_offered": service_ref(service_id)}}
         )
 
         if result.modified_count == 0:
@@ -490,19 +478,25 @@ async def remove_my_service(
 
 @router.get("/all/reviews", response_model=List[dict])
 async def get_my_reviews(
+        response: Response,
+        limit: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor value from a previous call"),
         current_provider: dict = Depends(get_current_provider)
 ):
+    """
+    Newest reviews first (the cursor for older ones is returned in X-Next-Cursor)
+    """
     try:
-        provider_id = str(current_provider["_id"])
-        reviews = list(reviews_collection.find({"provider_id": provider_id}))
-
-        return [{
-            "id": str(review["_id"]),
-            "user_id": review["user_id"],
-            "rating": review["rating"],
-            "comment": review.get("comment", ""),
-            "created_at": review["created_at"]
-        } for review in reviews]
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        reviews, next_cursor = get_review_page(str(current_provider["_id"]), limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [{
+        "id": review["id"],
+        "user_id": review["user_id"],
+        "rating": review["rating"],
+        "comment": review["comment"] or "",
+        "created_at": review["created_at"]
+    } for review in reviews]
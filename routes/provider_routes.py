@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from typing import List, Optional
 from bson import ObjectId
 from bson.errors import InvalidId
 from db import users_collection
-from models.provider import ProviderUpdate, ToggleAvailability, ProviderResponse
+from models.provider import ProviderUpdate, ToggleAvailability, ProviderResponse, GalleryPage
+from models.upload import ImageSize, ImageFormat
 from services.auth_service import get_current_user
+from handlers.gallery_handler import get_gallery_page
 from handlers.provider_handler import (
     get_all_providers,
     get_provider_by_id,
@@ -24,9 +26,12 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[ProviderResponse])
-def list_all_providers():
+def list_all_providers(
+        image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+        image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant")
+):
     """Get all providers with their rating information"""
-    return get_all_providers()
+    return get_all_providers(image_size and image_size.value, image_format.value)
 
 @router.get("/{provider_id}", response_model=ProviderResponse)
 def get_single_provider(provider_id: str):
@@ -38,51 +43,37 @@ def get_single_provider(provider_id: str):
 
 
 @router.get("/service/{service_id}", response_model=List[dict])
-def filter_providers_by_service(service_id: str):
-    """Get providers offering a specific service"""
+def filter_providers_by_service(
+        service_id: str,
+        response: Response,
+        limit: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor value from a previous call"),
+        image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+        image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant")
+):
+    """Get providers offering a specific service (the next page's cursor is returned in X-Next-Cursor)"""
     try:
-        # Convert to ObjectId for consistent comparison
-        service_obj_id = ObjectId(service_id)
-
-        # Find providers that have this service in their services_offered array
-        providers = users_collection.find(
-            {
-                "role": "provider",
-                "services_offered": service_id  # Compare as string to string
-            },
-            {"password": 0}
+        providers_list, next_cursor = get_providers_by_service(
+            service_id, limit, cursor, image_size and image_size.value, image_format.value
         )
+    except InvalidId:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid service ID format"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        providers_list = []
-        for provider in providers:
-            provider = serialize_provider(provider)
-            # Get the specific service details
-            if 'services_offered' in provider:
-                for offered_service in provider.get('services', []):
-                    if str(offered_service['_id']) == service_id:
-                        provider['matched_service'] = offered_service
-                        break
-            providers_list.append(provider)
-
-        if not providers_list:
-            raise HTTPException(
-                status_code=404,
-                detail="No providers found for this service"
-            )
-
-        return providers_list
-
-    except Exception as e:
-        if isinstance(e, InvalidId):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid service ID format"
-            )
+    if not providers_list and not cursor:
         raise HTTPException(
-            status_code=500,
-            detail=f"Error retrieving providers: {str(e)}"
+            status_code=404,
+            detail="No providers found for this service"
         )
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return providers_list
+
 @router.patch("/{provider_id}/availability", response_model=dict)
 def update_availability(
         provider_id: str,
@@ -120,15 +111,22 @@ def update_provider_details(
 
 
 @router.get("/top-rated/", response_model=List[dict])
-def list_top_rated_providers():
+def list_top_rated_providers(
+        image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+        image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant")
+):
     """Get top rated providers"""
-    return get_top_rated_providers()
+    return get_top_rated_providers(image_size=image_size and image_size.value, image_format=image_format.value)
 
 
 @router.get("/nearby/{location}", response_model=List[dict])
-def find_nearby_providers(location: str):
+def find_nearby_providers(
+        location: str,
+        image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+        image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant")
+):
     """Find providers near a location"""
-    return get_providers_nearby(location)
+    return get_providers_nearby(location, image_size and image_size.value, image_format.value)
 
 
 @router.get("/{provider_id}/ratings", response_model=dict)
@@ -163,6 +161,23 @@ def get_provider_reviews(provider_id: str, limit: int = 10):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/{provider_id}/gallery", response_model=GalleryPage)
+def get_provider_gallery(
+        provider_id: str,
+        offset: int = Query(0, ge=0),
+        limit: int = Query(20, ge=1, le=50),
+        image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+        image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant")
+):
+    """Get one page of a provider's portfolio gallery, in display order"""
+    if not ObjectId.is_valid(provider_id):
+        raise HTTPException(status_code=400, detail="Invalid provider ID format")
+    gallery = get_gallery_page(provider_id, offset, limit, image_size and image_size.value, image_format.value)
+    if gallery is None:
+        raise HTTPException(status_code=404, detail="Provider not found")
+    return gallery
+
+
 @router.delete("/{provider_id}", response_model=dict)
 def remove_provider(
         provider_id: str,
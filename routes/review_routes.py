@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
+from typing import Dict, List, Optional
 from bson import ObjectId
 from db import reviews_collection
 from models.review import (
@@ -9,6 +9,7 @@ from models.review import (
     ReviewQueryParams,
     PaginatedReviewResponse,
     RatingStatsResponse,
+    RatingStatsBatchRequest,
     AverageRatingResponse,
     ReviewSortField,
     SortOrder
@@ -17,7 +18,8 @@ from services.auth_service import get_current_user
 from handlers.review_handler import (
     submit_review,
     get_provider_reviews,
-    delete_review, get_rating_stats
+    delete_review, get_rating_stats,
+    get_rating_stats_bulk
 )
 
 router = APIRouter()
@@ -32,10 +34,17 @@ def create_review(data: ReviewCreate, user: dict = Depends(get_current_user)):
     return result
 
 
+@router.post("/stats/batch", response_model=Dict[str, RatingStatsResponse])
+def get_rating_stats_batch(data: RatingStatsBatchRequest):
+    """Rating statistics for up to 100 providers, keyed by provider ID"""
+    return get_rating_stats_bulk(data.provider_ids)
+
+
 @router.get("/{provider_id}", response_model=PaginatedReviewResponse)
 def provider_reviews(
         provider_id: str,
-        page: int = Query(1, ge=1),
+        page: int = Query(1, ge=1, description="Ignored when cursor is given"),
+        cursor: Optional[str] = Query(None),
         limit: int = Query(10, ge=1, le=100),
         sort_by: ReviewSortField = Query(ReviewSortField.DATE),
         sort_order: SortOrder = Query(SortOrder.DESC),
@@ -43,7 +52,10 @@ def provider_reviews(
         max_rating: Optional[int] = Query(None, ge=1, le=5),
         star_rating: Optional[int] = Query(None, ge=1, le=5)
 ):
-    """Retrieve paginated and filtered reviews for a provider"""
+    """Retrieve paginated and filtered reviews for a provider.
+
+    Follow next_cursor for cheap deep paging; page numbers are still accepted.
+    """
     filters = {}
     if min_rating is not None:
         filters["min_rating"] = min_rating
@@ -52,14 +64,18 @@ def provider_reviews(
     if star_rating is not None:
         filters["star_rating"] = star_rating
 
-    return get_provider_reviews(
-        provider_id,
-        page=page,
-        limit=limit,
-        sort_by=sort_by.value,
-        sort_order=sort_order.value,
-        filters=filters if filters else None
-    )
+    try:
+        return get_provider_reviews(
+            provider_id,
+            limit=limit,
+            cursor=cursor,
+            sort_by=sort_by.value,
+            sort_order=sort_order.value,
+            filters=filters if filters else None,
+            page=page
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.delete("/{review_id}", response_model=dict)
@@ -1,20 +1,85 @@
-from fastapi import APIRouter, HTTPException, Depends, Form, UploadFile, File,Body
+from fastapi import APIRouter, HTTPException, Depends, Form, UploadFile, File,Body, Query
 from typing import Optional
 from typing import List, Optional
-from models.service import ServiceCreate, ServiceUpdate, ServiceResponse
+from models.service import ServiceCreate, ServiceUpdate, ServiceResponse, ServiceCatalogResponse
+from models.upload import ImageSize, ImageFormat
 from services.auth_service import get_current_admin, get_current_user
+from services.upload_service import check_image_file, UploadRejected
 from db import services_collection
 from bson import ObjectId
 
-from handlers.service_handler import get_services, get_service_by_id, add_service, update_service, delete_service, add_services_to_provider, remove_services_from_provider, get_provider_services
+from handlers.service_import_handler import queue_service_import, get_service_import, IMPORT_MAX_FILE_BYTES
+from handlers.service_handler import search_services, CATALOG_SORTS, get_services, get_service_by_id, add_service, update_service, delete_service, add_services_to_provider, remove_services_from_provider, get_provider_services
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[ServiceResponse])
-def fetch_services():
+def fetch_services(
+    image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+    image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant")
+):
     """Retrieve a list of available services."""
-    return get_services()
+    return get_services(image_size and image_size.value, image_format.value)
+
+
+@router.get("/catalog", response_model=ServiceCatalogResponse)
+def search_catalog(
+    q: Optional[str] = Query(None, description="Words to find in the name or description"),
+    prefix: Optional[str] = Query(None, description="Case-insensitive start of the service name"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: str = Query("name", description="name, price_asc or price_desc"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    image_size: Optional[ImageSize] = Query(None, description="Return only this image variant"),
+    image_format: ImageFormat = Query(ImageFormat.WEBP, description="Format of the image_size variant")
+):
+    """Search, filter and page through the service catalog."""
+    if sort not in CATALOG_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(CATALOG_SORTS)}")
+    try:
+        services, next_cursor = search_services(
+            q, prefix, min_price, max_price, sort, limit, cursor, image_size and image_size.value, image_format.value
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"services": services, "next_cursor": next_cursor}
+
+
+@router.post("/import", response_model=dict, status_code=202)
+def import_services(
+    file: UploadFile = File(..., description="CSV or NDJSON with name, price, description, image_url, image_file"),
+    images: Optional[List[UploadFile]] = File(None, description="Images referenced by the image_file column"),
+    admin: dict = Depends(get_current_admin)
+):
+    """Create or update services in bulk from a file (Admin only).
+
+    Rows are matched to existing services by case-insensitive name. The import
+    runs as a background job; poll /imports/{job_id} for its per-row report.
+    """
+    size = file.size if file.size is not None else len(file.file.read())
+    if size > IMPORT_MAX_FILE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Import file exceeds {IMPORT_MAX_FILE_BYTES // (1024 * 1024)} MB")
+    file.file.seek(0)
+    try:
+        image_files = [(image.filename, check_image_file(image), image.content_type) for image in images or []]
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    result = queue_service_import(file.file, file.filename, image_files, str(admin["_id"]))
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@router.get("/imports/{job_id}", response_model=dict)
+def fetch_service_import(job_id: str, admin: dict = Depends(get_current_admin)):
+    """Status and per-row report of a bulk import (Admin only)."""
+    result = get_service_import(job_id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
 
 
 @router.get("/{service_id}", response_model=ServiceResponse)
@@ -35,6 +100,11 @@ def create_service(
     admin: dict = Depends(get_current_admin)
 ):
     """Add a new service (Admin only)."""
+    if image:
+        try:
+            check_image_file(image)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
     return add_service(name, description, price, image)
 
 
@@ -1,11 +1,12 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
+import hashlib
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
 from typing import Optional
-import os
-from models.upload import ImageUploadResponse
+from starlette.concurrency import run_in_threadpool
+from models.upload import ImageUploadResponse, DirectUploadRequest, DirectUploadComplete
+from handlers.direct_upload_handler import create_upload_intent, complete_upload
 from services.auth_service import get_current_user
-from services.cloudinary_service import upload_image, delete_image, upload_base64_image
-import tempfile
+from services.image_store import store_base64_image, release_image
+from services.upload_service import check_image_file, spool_request_body, upload_image_async, UploadRejected
 
 router = APIRouter()
 
@@ -27,24 +28,51 @@ async def upload_image_file(
         URL of the uploaded image
     """
     try:
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(await file.read())
-            temp_path = temp_file.name
+        image = check_image_file(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-        # Upload to Cloudinary
-        image_url = upload_image(temp_path, folder=folder)
+    # The multipart part is passed straight through; the upload runs off the event loop
+    image_url = await upload_image_async(image, folder=folder)
+    if isinstance(image_url, dict) and "error" in image_url:
+        raise HTTPException(status_code=400, detail=image_url["error"])
 
-        # Clean up temporary file
-        os.unlink(temp_path)
+    return {"url": image_url}
 
-        if isinstance(image_url, dict) and "error" in image_url:
-            raise HTTPException(status_code=400, detail=image_url["error"])
 
-        return {"url": image_url}
+@router.post("/image/binary", response_model=ImageUploadResponse)
+async def upload_binary_image(
+        request: Request,
+        folder: Optional[str] = "service_app",
+        current_user: dict = Depends(get_current_user)
+):
+    """
+    Upload an image sent as the raw request body (Content-Type: image/...)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    Args:
+        folder: Cloudinary folder to store the image (default: 'service_app')
+
+    Returns:
+        URL of the uploaded image
+    """
+    hasher = hashlib.sha256()
+    try:
+        image = await spool_request_body(request, hasher=hasher)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    try:
+        # Hashed as it streamed in, so a duplicate is answered without re-reading the spool
+        image.seek(0, 2)
+        size = image.tell()
+        image.seek(0)
+        image_url = await upload_image_async(image, folder=folder, digest=hasher.hexdigest(), size=size)
+    finally:
+        image.close()
+    if isinstance(image_url, dict) and "error" in image_url:
+        raise HTTPException(status_code=400, detail=image_url["error"])
+
+    return {"url": image_url}
 
 
 @router.post("/image/base64", response_model=ImageUploadResponse)
@@ -56,6 +84,9 @@ async def upload_base64_image(
     """
     Upload an image from base64 string to Cloudinary
 
+    Prefer /image/binary: a base64 query string is a third larger than the image
+    and is capped by URL length limits.
+
     Args:
         base64_string: The image encoded as base64 string
         folder: Cloudinary folder to store the image (default: 'service_app')
@@ -63,16 +94,36 @@ async def upload_base64_image(
     Returns:
         URL of the uploaded image
     """
-    try:
-        image_url = upload_base64_image(base64_string, folder=folder)
+    image_url = await run_in_threadpool(store_base64_image, base64_string, folder)
+    if isinstance(image_url, dict) and "error" in image_url:
+        raise HTTPException(status_code=400, detail=image_url["error"])
 
-        if isinstance(image_url, dict) and "error" in image_url:
-            raise HTTPException(status_code=400, detail=image_url["error"])
+    return {"url": image_url}
 
-        return {"url": image_url}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@router.post("/direct/sign", response_model=dict)
+def sign_direct_upload(data: DirectUploadRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Get signed parameters for uploading an image straight to Cloudinary
+
+    POST the image as `file` together with every entry of `fields` to
+    `upload_url`, then report the result to /direct/complete.
+    """
+    result = create_upload_intent(current_user, data.target, data.target_id)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@router.post("/direct/complete", response_model=ImageUploadResponse)
+def complete_direct_upload(data: DirectUploadComplete, current_user: dict = Depends(get_current_user)):
+    """
+    Verify a direct upload's signature and attach the image to its profile or service
+    """
+    result = complete_upload(str(current_user["_id"]), data.intent_id, data.public_id, data.version, data.signature)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
 
 
 @router.delete("/image")
@@ -83,6 +134,9 @@ async def delete_cloudinary_image(
     """
     Delete an image from Cloudinary
 
+    Images shared by several uploads of the same content are only removed
+    once the last of them is deleted.
+
     Args:
         public_id: The public ID of the image to delete
 
@@ -90,7 +144,7 @@ async def delete_cloudinary_image(
         Result of the deletion operation
     """
     try:
-        result = delete_image(public_id)
+        result = await run_in_threadpool(release_image, public_id)
 
         if isinstance(result, dict) and "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
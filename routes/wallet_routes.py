@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from handlers.wallet_handler import (
     generate_monnify_payment_link,
     confirm_wallet_funding,
@@ -12,7 +12,16 @@ get_recent_transactions,
     get_transaction_history,
     get_transaction_details
 )
+from handlers.statement_handler import (
+    STATEMENT_FORMATS,
+    stream_statement,
+    statement_filename,
+    request_statement_export,
+    get_statement_export,
+    open_statement_file
+)
 from services.auth_service import get_current_user
+from fastapi.responses import StreamingResponse
 from models.wallet import WalletTransactionResponse
 from typing import Optional
 from datetime import datetime
@@ -31,7 +40,9 @@ def fund_wallet(amount: float, user: dict = Depends(get_current_user)):
 def confirm_funding(reference: str):
     response = confirm_wallet_funding(reference)
     if "error" in response:
-        raise HTTPException(status_code=404, detail=response["error"])
+        # Found but failed or expired: it can no longer be credited
+        status_code = 404 if response["error"] == "Transaction not found" else 409
+        raise HTTPException(status_code=status_code, detail=response["error"])
     return response
 
 
@@ -55,8 +66,17 @@ def provider_balance(provider_id: str, user: dict = Depends(get_current_user)):
 
 # Provider requests withdrawal
 @router.post("/withdraw")
-def withdraw_request(amount: float, user: dict = Depends(get_current_user)):
-    response = request_withdrawal(str(user["_id"]), amount)
+def withdraw_request(
+    amount: float,
+    bank_code: Optional[str] = None,
+    account_number: Optional[str] = None,
+    account_name: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    destination = None
+    if bank_code and account_number:
+        destination = {"bank_code": bank_code, "account_number": account_number, "account_name": account_name}
+    response = request_withdrawal(str(user["_id"]), amount, destination)
     if "error" in response:
         raise HTTPException(status_code=400, detail=response["error"])
     return response
@@ -64,12 +84,17 @@ def withdraw_request(amount: float, user: dict = Depends(get_current_user)):
 
 @router.get("/recent", response_model=list)
 async def get_user_recent_transactions(
-    limit: int = Query(5, description="Number of recent transactions to fetch"),
+    response: Response,
+    limit: int = Query(5, ge=1, le=100, description="Number of recent transactions to fetch"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from a previous call"),
     user: dict = Depends(get_current_user)
 ):
-    """Get user's recent transactions"""
+    """Get user's recent transactions (the cursor for older ones is returned in X-Next-Cursor)"""
     try:
-        return get_recent_transactions(str(user["_id"]), limit)
+        transactions, next_cursor = get_recent_transactions(str(user["_id"]), limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return transactions
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -81,6 +106,8 @@ async def get_user_transaction_history(
     transaction_type: Optional[str] = Query(None, description="Filter by transaction type"),
     start_date: Optional[datetime] = Query(None, description="Start date filter"),
     end_date: Optional[datetime] = Query(None, description="End date filter"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; overrides page"),
+    include_total: bool = Query(True, description="Set to false to skip counting matching transactions"),
     user: dict = Depends(get_current_user)
 ):
     """Get paginated transaction history with filters"""
@@ -91,12 +118,70 @@ async def get_user_transaction_history(
             limit=limit,
             transaction_type=transaction_type,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            cursor=cursor,
+            include_total=include_total
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/statement")
+def download_statement(
+    format: str = Query("csv", description="csv or ndjson"),
+    start_date: Optional[datetime] = Query(None, description="Start date filter"),
+    end_date: Optional[datetime] = Query(None, description="End date filter"),
+    user: dict = Depends(get_current_user)
+):
+    """Stream the user's full transaction statement for a date range"""
+    if format not in STATEMENT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be csv or ndjson")
+
+    user_id = str(user["_id"])
+    return StreamingResponse(
+        stream_statement(user_id, format, start_date, end_date),
+        media_type=STATEMENT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{statement_filename(user_id, format)}"'}
+    )
+
+
+@router.post("/statement/export")
+def export_statement(
+    format: str = Query("csv", description="csv or ndjson"),
+    start_date: Optional[datetime] = Query(None, description="Start date filter"),
+    end_date: Optional[datetime] = Query(None, description="End date filter"),
+    user: dict = Depends(get_current_user)
+):
+    """Queue a statement export as a background job"""
+    response = request_statement_export(str(user["_id"]), format, start_date, end_date)
+    if "error" in response:
+        raise HTTPException(status_code=400, detail=response["error"])
+    return response
+
+
+@router.get("/statement/export/{job_id}")
+def statement_export_status(job_id: str, user: dict = Depends(get_current_user)):
+    """Check the status of a statement export"""
+    response = get_statement_export(job_id, str(user["_id"]))
+    if "error" in response:
+        raise HTTPException(status_code=404, detail=response["error"])
+    return response
+
+
+@router.get("/statement/export/{job_id}/download")
+def download_statement_export(job_id: str, user: dict = Depends(get_current_user)):
+    """Download a finished statement export"""
+    grid_out = open_statement_file(job_id, str(user["_id"]))
+    if not grid_out:
+        raise HTTPException(status_code=404, detail="Export not found or not ready")
+
+    return StreamingResponse(
+        iter(grid_out.readchunk, b""),
+        media_type=grid_out.content_type,
+        headers={"Content-Disposition": f'attachment; filename="{grid_out.filename}"'}
+    )
+
+
 @router.get("/{transaction_id}", response_model=dict)
 async def get_transaction_detail(
         transaction_id: str,
@@ -99,7 +99,7 @@ def get_current_provider(token: str = Depends(oauth2_scheme)):
         user = users_collection.find_one({
             "_id": ObjectId(user_id),
             "role": "provider"
-        })
+        }, {"gallery": 0})
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
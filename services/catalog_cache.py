@@ -0,0 +1,132 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from db import services_collection, cache_versions_collection
+
+# A worker that is not receiving change-stream events re-reads the catalog
+# version at most this often, which bounds how stale its copy can be
+CATALOG_VERSION_CHECK_SECONDS = 5
+CATALOG_VERSION_KEY = "services"
+
+
+class ServiceCatalogCache:
+    """Whole service catalog held in memory, keyed by string ID.
+
+    Writers call bump() after changing services_collection; that increments a
+    shared version document and reloads this worker at once. Other workers
+    reload when a change stream on services_collection fires or, where change
+    streams are unavailable (no replica set), when a version check made at most
+    every CATALOG_VERSION_CHECK_SECONDS sees a newer version.
+    """
+
+    def __init__(self, check_seconds: float = CATALOG_VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._services: Dict[str, dict] = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._watching = False
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "reloads": 0}
+
+    def _current_version(self) -> int:
+        doc = cache_versions_collection.find_one({"_id": CATALOG_VERSION_KEY})
+        return doc["version"] if doc else 0
+
+    def _load(self, version: int):
+        self._services = {str(service["_id"]): service for service in services_collection.find()}
+        self._version = version
+        self._stale = False
+        self._stats["reloads"] += 1
+
+    def _refresh_if_needed(self):
+        now = time.monotonic()
+        if not self._stale and (self._watching or now - self._checked_at < self.check_seconds):
+            return
+        with self._lock:
+            if not self._stale and (self._watching or time.monotonic() - self._checked_at < self.check_seconds):
+                return
+            version = self._current_version()
+            if self._stale or version != self._version:
+                self._load(version)
+            self._checked_at = time.monotonic()
+
+    def get(self, service_id) -> Optional[dict]:
+        """A copy of one service, or None if it does not exist"""
+        self._refresh_if_needed()
+        key = str(service_id)
+        service = self._services.get(key)
+        if service is not None:
+            self._stats["hits"] += 1
+            return dict(service)
+
+        self._stats["misses"] += 1
+        # Possibly created by another worker since our last refresh
+        if not ObjectId.is_valid(key):
+            return None
+        service = services_collection.find_one({"_id": ObjectId(key)})
+        if service is not None:
+            self._services[key] = service
+            return dict(service)
+        return None
+
+    def get_many(self, service_ids: Iterable) -> Dict[str, dict]:
+        """Copies of the services that exist among `service_ids`, keyed by string ID"""
+        result = {}
+        for service_id in service_ids:
+            service = self.get(service_id)
+            if service is not None:
+                result[str(service_id)] = service
+        return result
+
+    def all(self) -> List[dict]:
+        self._refresh_if_needed()
+        self._stats["hits"] += 1
+        return [dict(service) for service in self._services.values()]
+
+    def bump(self):
+        """Record a catalog change for every worker and reload this one"""
+        doc = cache_versions_collection.find_one_and_update(
+            {"_id": CATALOG_VERSION_KEY},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self._lock:
+            self._load(doc["version"])
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._stale = True
+
+    def _watch(self):
+        try:
+            with services_collection.watch() as stream:
+                self._watching = True
+                self.invalidate()
+                for _ in stream:
+                    self.invalidate()
+        except PyMongoError as e:
+            print(f"Service catalog change stream unavailable, polling the version instead: {str(e)}")
+        finally:
+            self._watching = False
+
+    def start_watcher(self):
+        """Follow services_collection changes in a background thread when the server supports it"""
+        threading.Thread(target=self._watch, name="service-catalog-watch", daemon=True).start()
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": self._stats["hits"] / lookups if lookups else None,
+            "size": len(self._services),
+            "version": self._version,
+            "watching": self._watching
+        }
+
+
+service_catalog = ServiceCatalogCache()
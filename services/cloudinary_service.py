@@ -1,5 +1,8 @@
 import cloudinary
+import cloudinary.api
 import cloudinary.uploader
+import cloudinary.utils
+import hmac
 import os
 
 # Configure Cloudinary
@@ -9,14 +12,57 @@ cloudinary.config(
     api_secret=os.getenv("CLOUDINARY_API_SECRET")
 )
 
+# Named renditions generated for every upload; list endpoints can send just the
+# one a client renders instead of the full-resolution original
+IMAGE_VARIANTS = {
+    "thumb": {"width": 128, "height": 128, "crop": "fill", "gravity": "auto", "quality": "auto"},
+    "card": {"width": 640, "height": 400, "crop": "fill", "gravity": "auto", "quality": "auto"},
+    "full": {"width": 1600, "crop": "limit", "quality": "auto"}
+}
+IMAGE_VARIANT_FORMATS = ["webp", "avif"]
+DEFAULT_VARIANT_FORMAT = "webp"
+# Built at upload time (asynchronously) so the first client request is not a cache miss
+EAGER_VARIANTS = [
+    dict(transformation, format=fmt) for transformation in IMAGE_VARIANTS.values() for fmt in IMAGE_VARIANT_FORMATS
+]
+
+CLOUDINARY_UPLOAD_URL = f"https://api.cloudinary.com/v1_1/{os.getenv('CLOUDINARY_CLOUD_NAME')}/image/upload"
+
+
+# Sign parameters for an upload the client sends to Cloudinary itself
+def sign_upload_params(params: dict, api_secret: str = None) -> str:
+    return cloudinary.utils.api_sign_request(params, api_secret or cloudinary.config().api_secret)
+
+
+# Check the signature Cloudinary put on an upload response
+def verify_upload_signature(public_id: str, version, signature: str, api_secret: str = None) -> bool:
+    expected = sign_upload_params({"public_id": public_id, "version": version}, api_secret)
+    return hmac.compare_digest(expected, str(signature or ""))
+
+
+# Fetch an uploaded image's metadata (bytes, format, secure_url, ...)
+def get_image_resource(public_id):
+    try:
+        return cloudinary.api.resource(public_id)
+    except Exception as e:
+        return {"error": str(e)}
+
+
 # Upload Image
 def upload_image(image_path, folder="service_app"):
     try:
-        response = cloudinary.uploader.upload(image_path, folder=folder)
+        response = cloudinary.uploader.upload(image_path, folder=folder, eager=EAGER_VARIANTS, eager_async=True)
         return response.get("secure_url")
     except Exception as e:
         return {"error": str(e)}
 
+# Upload Image and return Cloudinary's full response (secure_url, public_id, bytes, ...)
+def upload_image_resource(image, folder="service_app"):
+    try:
+        return cloudinary.uploader.upload(image, folder=folder, eager=EAGER_VARIANTS, eager_async=True)
+    except Exception as e:
+        return {"error": str(e)}
+
 # Delete Image
 def delete_image(public_id):
     try:
@@ -28,7 +74,39 @@ def delete_image(public_id):
 # Upload Base64 Image
 def upload_base64_image(base64_string, folder="service_app"):
     try:
-        response = cloudinary.uploader.upload(base64_string, folder=folder)
+        response = cloudinary.uploader.upload(base64_string, folder=folder, eager=EAGER_VARIANTS, eager_async=True)
         return response.get("secure_url")
     except Exception as e:
         return {"error": str(e)}
+
+
+# URL of one variant of an uploaded image; URLs from elsewhere are returned unchanged
+def image_variant_url(url, variant, fmt=DEFAULT_VARIANT_FORMAT):
+    head, marker, path = url.partition("/image/upload/")
+    if not marker:
+        return url
+    transformation, _ = cloudinary.utils.generate_transformation_string(**IMAGE_VARIANTS[variant])
+    if "." in path.rsplit("/", 1)[-1]:
+        path = path.rsplit(".", 1)[0]
+    return f"{head}{marker}{transformation}/{path}.{fmt}"
+
+
+# Every variant of an image in every format: {"thumb": {"webp": url, "avif": url}, ...}
+def image_variants(url):
+    if not url:
+        return None
+    return {
+        variant: {fmt: image_variant_url(url, variant, fmt) for fmt in IMAGE_VARIANT_FORMATS}
+        for variant in IMAGE_VARIANTS
+    }
+
+
+# Add `<field>_variants` to a document, or with `image_size` replace `field` by that one variant
+def with_image_variants(doc, field, image_size=None, image_format=DEFAULT_VARIANT_FORMAT):
+    url = doc.get(field)
+    if image_size:
+        if url:
+            doc[field] = image_variant_url(url, image_size, image_format)
+    else:
+        doc[f"{field}_variants"] = image_variants(url)
+    return doc
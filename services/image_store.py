@@ -0,0 +1,131 @@
+import base64
+import binascii
+import hashlib
+import io
+from datetime import datetime
+from typing import BinaryIO, Optional, Tuple
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db import image_assets_collection
+from services.cloudinary_service import upload_image_resource, upload_base64_image, delete_image
+
+# Uploaded images are indexed by the sha256 of their content. Uploading bytes
+# that are already stored returns the existing URL without calling Cloudinary,
+# and each such reuse adds a reference that release_image() gives back.
+HASH_CHUNK_BYTES = 64 * 1024
+
+
+def hash_image(image: BinaryIO) -> Tuple[str, int]:
+    """sha256 hex digest and size of a file object, read in chunks and rewound"""
+    hasher = hashlib.sha256()
+    size = 0
+    image.seek(0)
+    for chunk in iter(lambda: image.read(HASH_CHUNK_BYTES), b""):
+        hasher.update(chunk)
+        size += len(chunk)
+    image.seek(0)
+    return hasher.hexdigest(), size
+
+
+def _reuse(digest: str, size: int) -> Optional[dict]:
+    return image_assets_collection.find_one_and_update(
+        {"_id": digest},
+        {
+            "$inc": {"refcount": 1, "reuses": 1, "bytes_saved": size},
+            "$set": {"last_used_at": datetime.utcnow()}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def store_image_asset(image: BinaryIO, folder: str = "service_app", digest: Optional[str] = None,
+                      size: Optional[int] = None) -> dict:
+    """Upload an image unless identical content is already stored.
+
+    Returns {"url", "public_id"} or {"error": ...}. Pass `digest` and `size`
+    when the caller already hashed the bytes while receiving them.
+    """
+    if digest is None or size is None:
+        digest, size = hash_image(image)
+    asset = _reuse(digest, size)
+    if asset:
+        return {"url": asset["url"], "public_id": asset["public_id"]}
+
+    response = upload_image_resource(image, folder)
+    if "error" in response:
+        return response
+
+    try:
+        image_assets_collection.insert_one({
+            "_id": digest,
+            "url": response["secure_url"],
+            "public_id": response["public_id"],
+            "bytes": size,
+            "refcount": 1,
+            "reuses": 0,
+            "bytes_saved": 0,
+            "created_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        # The same bytes were stored by a concurrent request; keep that copy
+        asset = _reuse(digest, size)
+        if asset:
+            delete_image(response["public_id"])
+            return {"url": asset["url"], "public_id": asset["public_id"]}
+    return {"url": response["secure_url"], "public_id": response["public_id"]}
+
+
+def store_image(image: BinaryIO, folder: str = "service_app", digest: Optional[str] = None,
+                size: Optional[int] = None):
+    """store_image_asset returning just the URL (or an {"error": ...} dict), like upload_image"""
+    asset = store_image_asset(image, folder, digest, size)
+    return asset if "error" in asset else asset["url"]
+
+
+def store_base64_image(base64_string: str, folder: str = "service_app"):
+    """store_image for a base64 string or data URI; anything else goes to Cloudinary as-is"""
+    payload = base64_string.split(",", 1)[-1] if base64_string.startswith("data:") else base64_string
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return upload_base64_image(base64_string, folder)
+    return store_image(io.BytesIO(data), folder)
+
+
+def release_image(public_id: str):
+    """Drop one reference to an image and delete it from Cloudinary once none remain.
+
+    Images uploaded before deduplication have no asset record and are deleted directly.
+    """
+    asset = image_assets_collection.find_one_and_update(
+        {"public_id": public_id, "refcount": {"$gt": 0}},
+        {"$inc": {"refcount": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if asset is None:
+        return delete_image(public_id)
+    if asset["refcount"] > 0:
+        return {"result": "in use", "refcount": asset["refcount"]}
+
+    # A reuse can land between the decrement and here; it wins and the image stays
+    if image_assets_collection.delete_one({"_id": asset["_id"], "refcount": 0}).deleted_count == 0:
+        return {"result": "in use", "refcount": 1}
+    return delete_image(public_id)
+
+
+def get_dedup_stats() -> dict:
+    rows = list(image_assets_collection.aggregate([
+        {"$group": {
+            "_id": None,
+            "assets": {"$sum": 1},
+            "references": {"$sum": "$refcount"},
+            "uploads_avoided": {"$sum": "$reuses"},
+            "bytes_stored": {"$sum": "$bytes"},
+            "bytes_saved": {"$sum": "$bytes_saved"}
+        }}
+    ]))
+    stats = rows[0] if rows else dict.fromkeys(
+        ["assets", "references", "uploads_avoided", "bytes_stored", "bytes_saved"], 0
+    )
+    stats.pop("_id", None)
+    return stats
@@ -0,0 +1,143 @@
+import random
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from db import jobs_collection
+
+# Durable background jobs stored in Mongo. Any worker process may claim a queued
+# job; a job whose worker died is reclaimed once its lease runs out.
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_SECONDS = 10
+
+JOB_HANDLERS: Dict[str, Callable[[dict], Optional[dict]]] = {}
+
+
+def job_handler(job_type: str):
+    """Register the function that runs jobs of `job_type`; it receives the job document"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def enqueue_job(job_type: str, payload: dict, run_at: Optional[datetime] = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+    now = datetime.utcnow()
+    job = {
+        "job_type": job_type,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": run_at or now,
+        "created_at": now,
+        "updated_at": now
+    }
+    return str(jobs_collection.insert_one(job).inserted_id)
+
+
+def enqueue_jobs(job_type: str, payloads: List[dict], max_attempts: int = JOB_MAX_ATTEMPTS) -> List[str]:
+    """Queue one job per payload with a single insert"""
+    if not payloads:
+        return []
+    now = datetime.utcnow()
+    jobs = [{
+        "job_type": job_type,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": now,
+        "created_at": now,
+        "updated_at": now
+    } for payload in payloads]
+    return [str(job_id) for job_id in jobs_collection.insert_many(jobs).inserted_ids]
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    try:
+        job = jobs_collection.find_one({"_id": ObjectId(job_id)})
+    except Exception:
+        return None
+    if job:
+        job["_id"] = str(job["_id"])
+    return job
+
+
+def update_job_progress(job_id, progress: dict):
+    """Record progress on a running job and extend its lease"""
+    jobs_collection.update_one(
+        {"_id": ObjectId(job_id)},
+        {"$set": {
+            "progress": progress,
+            "locked_until": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS),
+            "updated_at": datetime.utcnow()
+        }}
+    )
+
+
+def _claim_job() -> Optional[dict]:
+    now = datetime.utcnow()
+    return jobs_collection.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "locked_until": {"$lt": now}}
+            ],
+            "job_type": {"$in": list(JOB_HANDLERS)}
+        },
+        {
+            "$set": {
+                "status": "running",
+                "locked_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("run_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    # Exponential backoff with full jitter
+    return timedelta(seconds=random.uniform(0, JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)))
+
+
+def run_pending_jobs(max_jobs: int = 50) -> int:
+    """Scheduler entry point: claim and run queued jobs until none are due"""
+    processed = 0
+    while processed < max_jobs:
+        job = _claim_job()
+        if not job:
+            break
+        processed += 1
+
+        try:
+            result = JOB_HANDLERS[job["job_type"]](job)
+            jobs_collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {
+                    "status": "completed",
+                    "result": result,
+                    "completed_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+        except Exception as e:
+            print(f"Job {job['_id']} ({job['job_type']}) failed: {str(e)}")
+            failed = job["attempts"] >= job.get("max_attempts", JOB_MAX_ATTEMPTS)
+            jobs_collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {
+                    "status": "failed" if failed else "queued",
+                    "run_at": datetime.utcnow() + _retry_delay(job["attempts"]),
+                    "last_error": str(e),
+                    "last_traceback": traceback.format_exc(),
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+    return processed
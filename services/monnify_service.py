@@ -1,7 +1,12 @@
-import requests
-import os
+import asyncio
 import base64
-from datetime import datetime
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
 
 # Load Monnify Credentials from Environment Variables
 # MONNIFY_API_KEY = os.getenv("MONNIFY_API_KEY")
@@ -9,41 +14,163 @@ from datetime import datetime
 # MONNIFY_BASE_URL = "https://api.monnify.com/api/v1"
 
 MONNIFY_CONTRACT_CODE = "4001509973"
-MONNIFY_BASE_URL_2 = "https://sandbox.monnify.com/api/v2/bank-transfer/reserved-accounts"
-MONNIFY_BASE_URL = "https://sandbox.monnify.com/api/v1"
+# Point at a local stand-in server by overriding MONNIFY_API_URL
+MONNIFY_API_URL = os.getenv("MONNIFY_API_URL", "https://sandbox.monnify.com")
+MONNIFY_BASE_URL_2 = f"{MONNIFY_API_URL}/api/v2/bank-transfer/reserved-accounts"
+MONNIFY_BASE_URL = f"{MONNIFY_API_URL}/api/v1"
 PAYSTACK_SECRET = os.getenv("PAYSTACK_SECRET")
 MONNIFY_SECRET = os.getenv("MONNIFY_SECRET")
 MONNIFY_API_KEY = os.getenv("MONNIFY_API_KEY")
 MONNIFY_WALLET_ACCOUNT = os.getenv("MONNIFY_WALLET_ACCOUNT")
-MONNIFY_BASE_URL_3 = "https://sandbox.monnify.com/api/v2/disbursements/single"
-monnify_token = None
-token_expiry = 0
+MONNIFY_BASE_URL_3 = f"{MONNIFY_API_URL}/api/v2/disbursements/single"
+MONNIFY_DISBURSEMENT_URL = f"{MONNIFY_API_URL}/api/v2/disbursements"
 
-# Function to get authentication token
-def get_monnify_token():
-    """Fetch and cache Monnify authentication token."""
-    credentials = f"{MONNIFY_API_KEY}:{MONNIFY_SECRET}"
-    encoded_credentials = base64.b64encode(credentials.encode()).decode()
+MONNIFY_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+MONNIFY_POOL_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+MONNIFY_MAX_RETRIES = 3
+MONNIFY_RETRY_BASE_SECONDS = 0.5
+# Refresh the access token this long before Monnify says it expires
+MONNIFY_TOKEN_MARGIN_SECONDS = 60
+# Token lifetime assumed when the login response does not carry expiresIn
+MONNIFY_DEFAULT_TOKEN_TTL_SECONDS = 300
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class _MonnifyClientBase:
+    """Token cache and retry policy shared by the sync and async clients"""
 
-    headers = {"Authorization": f"Basic {encoded_credentials}"}
-    response = requests.post(f"{MONNIFY_BASE_URL}/auth/login", headers=headers)
+    def __init__(self):
+        self._token = None
+        self._token_expiry = 0.0
 
-    if response.status_code == 200:
+    def _login_headers(self) -> dict:
+        credentials = f"{MONNIFY_API_KEY}:{MONNIFY_SECRET}"
+        return {"Authorization": f"Basic {base64.b64encode(credentials.encode()).decode()}"}
+
+    def _token_valid(self) -> bool:
+        return self._token is not None and time.monotonic() < self._token_expiry
+
+    def _store_token(self, response: httpx.Response) -> str:
+        if response.status_code != 200:
+            raise Exception("Failed to authenticate with Monnify")
         data = response.json()["responseBody"]
-        return data["accessToken"]
+        self._token = data["accessToken"]
+        expires_in = int(data.get("expiresIn") or MONNIFY_DEFAULT_TOKEN_TTL_SECONDS)
+        self._token_expiry = time.monotonic() + max(expires_in - MONNIFY_TOKEN_MARGIN_SECONDS, 0)
+        return self._token
+
+    def _invalidate_token(self, token: str):
+        if self._token == token:
+            self._token = None
+
+    @staticmethod
+    def _retry_delay(attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0, MONNIFY_RETRY_BASE_SECONDS * 2 ** attempt)
+
+
+class MonnifyClient(_MonnifyClientBase):
+    """Monnify API client with a keep-alive connection pool and a cached access token.
+
+    The token is fetched once and reused until it nears expiry, so a normal
+    API call costs a single round trip. Concurrent threads that find the
+    token expired share one refresh. `transport` replaces the network layer,
+    e.g. with an httpx.MockTransport in tests.
+    """
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None):
+        super().__init__()
+        self._client = httpx.Client(timeout=MONNIFY_TIMEOUT, limits=MONNIFY_POOL_LIMITS, transport=transport)
+        self._token_lock = threading.Lock()
+
+    def get_token(self) -> str:
+        if self._token_valid():
+            return self._token
+        with self._token_lock:
+            # Another thread may have refreshed while we waited
+            if not self._token_valid():
+                self._store_token(self._client.post(f"{MONNIFY_BASE_URL}/auth/login", headers=self._login_headers()))
+            return self._token
+
+    def request(self, method: str, url: str, max_retries: int = MONNIFY_MAX_RETRIES, **kwargs) -> httpx.Response:
+        """Authenticated request, retried on connection errors, 429 and 5xx responses"""
+        for attempt in range(max_retries + 1):
+            token = self.get_token()
+            headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+            try:
+                response = self._client.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError:
+                if attempt == max_retries:
+                    raise
+            else:
+                if response.status_code == 401 and attempt < max_retries:
+                    self._invalidate_token(token)
+                    continue
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                    return response
+            time.sleep(self._retry_delay(attempt))
+
+    def close(self):
+        self._client.close()
+
+
+class AsyncMonnifyClient(_MonnifyClientBase):
+    """asyncio variant of MonnifyClient; create one per event loop"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        super().__init__()
+        self._client = httpx.AsyncClient(timeout=MONNIFY_TIMEOUT, limits=MONNIFY_POOL_LIMITS, transport=transport)
+        self._token_lock = asyncio.Lock()
+
+    async def get_token(self) -> str:
+        if self._token_valid():
+            return self._token
+        async with self._token_lock:
+            if not self._token_valid():
+                self._store_token(
+                    await self._client.post(f"{MONNIFY_BASE_URL}/auth/login", headers=self._login_headers())
+                )
+            return self._token
+
+    async def request(self, method: str, url: str, max_retries: int = MONNIFY_MAX_RETRIES, **kwargs) -> httpx.Response:
+        for attempt in range(max_retries + 1):
+            token = await self.get_token()
+            headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+            try:
+                response = await self._client.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError:
+                if attempt == max_retries:
+                    raise
+            else:
+                if response.status_code == 401 and attempt < max_retries:
+                    self._invalidate_token(token)
+                    continue
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                    return response
+            await asyncio.sleep(self._retry_delay(attempt))
+
+    async def verify_transaction(self, payment_reference: str):
+        response = await self.request(
+            "GET", f"{MONNIFY_BASE_URL}/transaction/status", params={"paymentReference": payment_reference}
+        )
+        return response.json()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# Shared pooled client used by the module-level helpers below
+monnify_client = MonnifyClient()
 
-    raise Exception("Failed to authenticate with Monnify")
+
+# Function to get authentication token
+def get_monnify_token():
+    """Return the cached Monnify access token, logging in only when it has expired."""
+    return monnify_client.get_token()
 
 # Function to create a dedicated virtual account
 def create_reserved_account(account_reference, account_name, customer_email, bvn, customer_name=None):
     """Create a general reserved account."""
-    token = get_monnify_token()
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-
     data = {
         "accountReference": account_reference,
         "accountName": account_name,
@@ -60,22 +187,26 @@ def create_reserved_account(account_reference, account_name, customer_email, bvn
         data["customerName"] = customer_name
 
     try:
-        response = requests.post(
-            "https://sandbox.monnify.com/api/v2/bank-transfer/reserved-accounts",
-            json=data,
-            headers=headers,
-        )
+        response = monnify_client.request("POST", MONNIFY_BASE_URL_2, json=data)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
+        return {"error": str(e)}
+
+
+# Function to fetch an existing reserved account by its reference
+def get_reserved_account(account_reference):
+    try:
+        response = monnify_client.request("GET", f"{MONNIFY_BASE_URL_2}/{account_reference}")
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
         return {"error": str(e)}
 
 
 # Function to initialize payment
 def initialize_payment(amount: float, customer_email: str, payment_reference: str, customer_name: str):
-    token = get_monnify_token()
     url = f"{MONNIFY_BASE_URL}/transaction/initialize"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
     payload = {
         "amount": amount,
         "customerName": customer_name,
@@ -87,26 +218,48 @@ def initialize_payment(amount: float, customer_email: str, payment_reference: st
         "redirectUrl": "https://yourapp.com/payment-success",
         "paymentMethods": ["CARD", "ACCOUNT_TRANSFER"]
     }
-    response = requests.post(url, json=payload, headers=headers)
+    response = monnify_client.request("POST", url, json=payload)
     return response.json()
 
 # Function to verify transaction status
 def verify_transaction(payment_reference: str):
-    token = get_monnify_token()
-    url = f"{MONNIFY_BASE_URL}/transaction/status?paymentReference={payment_reference}"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    response = requests.get(url, headers=headers)
+    url = f"{MONNIFY_BASE_URL}/transaction/status"
+    response = monnify_client.request("GET", url, params={"paymentReference": payment_reference})
     return response.json()
 
 # Function to refund a transaction
 def refund_transaction(transaction_reference: str, amount: float, reason: str):
-    token = get_monnify_token()
     url = f"{MONNIFY_BASE_URL}/transaction/refund"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
     payload = {
         "transactionReference": transaction_reference,
         "amount": amount,
         "refundReason": reason
     }
-    response = requests.post(url, json=payload, headers=headers)
+    # Refunds carry no idempotency key, so a failed attempt is never repeated
+    response = monnify_client.request("POST", url, max_retries=0, json=payload)
+    return response.json()
+
+
+# Function to submit a bulk disbursement (payouts to provider bank accounts)
+def initiate_bulk_disbursement(batch_reference: str, transactions: list, narration: str):
+    """Submit a batch of transfers; each transaction needs amount, reference,
+    narration, destinationBankCode and destinationAccountNumber."""
+    url = f"{MONNIFY_DISBURSEMENT_URL}/batch"
+    payload = {
+        "title": narration,
+        "batchReference": batch_reference,
+        "narration": narration,
+        "sourceAccountNumber": MONNIFY_WALLET_ACCOUNT,
+        "onValidationFailure": "CONTINUE",
+        "notificationInterval": 25,
+        "transactionList": [{"currency": "NGN", **transaction} for transaction in transactions]
+    }
+    response = monnify_client.request("POST", url, json=payload)
+    return response.json()
+
+
+# Function to fetch the per-transaction results of a bulk disbursement
+def get_bulk_disbursement_transactions(batch_reference: str, page_no: int = 0, page_size: int = 100):
+    url = f"{MONNIFY_DISBURSEMENT_URL}/bulk/{batch_reference}/transactions"
+    response = monnify_client.request("GET", url, params={"pageNo": page_no, "pageSize": page_size})
     return response.json()
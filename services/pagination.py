@@ -0,0 +1,61 @@
+import base64
+from typing import List, Optional, Sequence, Tuple
+from bson import json_util
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Encode the sort-key values of the last returned document as an opaque cursor"""
+    return base64.urlsafe_b64encode(json_util.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+def keyset_filter(fields: Sequence[str], values: Sequence, direction: int = -1) -> dict:
+    """Match documents strictly after `values` in (fields...) order"""
+    op = "$lt" if direction < 0 else "$gt"
+    clauses = []
+    for i, field in enumerate(fields):
+        clause = dict(zip(fields[:i], values[:i]))
+        clause[field] = {op: values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def keyset_page(
+        collection,
+        query: dict,
+        sort_fields: Sequence[str],
+        limit: int,
+        cursor: Optional[str] = None,
+        direction: int = -1,
+        projection: Optional[dict] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one page ordered by `sort_fields` (with `_id` as tie-breaker).
+
+    Seeks past the cursor instead of skipping, so every page costs the same
+    regardless of depth. Returns the documents and the cursor for the next
+    page (None on the last page).
+    """
+    fields = list(sort_fields) + ["_id"]
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise ValueError("Invalid pagination cursor")
+        query = {"$and": [query, keyset_filter(fields, values, direction)]}
+
+    documents = list(
+        collection.find(query, projection)
+        .sort([(field, direction) for field in fields])
+        .limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor([documents[-1].get(field) for field in fields])
+    return documents, next_cursor
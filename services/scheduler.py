@@ -0,0 +1,4 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+
+# Shared in-process scheduler for periodic maintenance jobs (started from main.py)
+scheduler = BackgroundScheduler(timezone="UTC")
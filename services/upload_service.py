@@ -0,0 +1,123 @@
+import tempfile
+from typing import Any, BinaryIO, Optional, Sequence, Tuple
+from fastapi import Request, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from services.image_store import store_image
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Room for multipart boundaries and the other form fields around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Request bodies larger than this spill from memory to disk while spooling
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/avif", "image/heic"}
+
+IMAGE_UPLOAD_MAX_BYTES = MAX_IMAGE_BYTES + MULTIPART_OVERHEAD_BYTES
+
+# Endpoints that accept uploads, as (path prefix, largest Content-Length) pairs checked
+# before the body is read; the first matching prefix applies, so list narrower ones first
+UPLOAD_LIMITS: Tuple[Tuple[str, int], ...] = (
+    ("/api/file/image", IMAGE_UPLOAD_MAX_BYTES),
+    ("/api/auth/register", IMAGE_UPLOAD_MAX_BYTES),
+    ("/api/services", IMAGE_UPLOAD_MAX_BYTES),
+    ("/api/providers/dashboard/profile/image", IMAGE_UPLOAD_MAX_BYTES)
+)
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _check_content_type(content_type: Optional[str]):
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type not in ALLOWED_IMAGE_TYPES:
+        raise UploadRejected(415, f"Unsupported image type: {media_type or 'unknown'}")
+
+
+def check_image_file(file: UploadFile, max_bytes: int = MAX_IMAGE_BYTES) -> BinaryIO:
+    """Validate a multipart image and return its underlying file, rewound.
+
+    Starlette has already spooled the part (in memory up to 1 MB, on disk beyond),
+    so the file object is handed to the uploader as-is instead of being read
+    into another buffer or copied to a temp file.
+    """
+    _check_content_type(file.content_type)
+    size = file.size
+    if size is None:
+        file.file.seek(0, 2)
+        size = file.file.tell()
+    if size > max_bytes:
+        raise UploadRejected(413, f"Image exceeds the {max_bytes // (1024 * 1024)} MB limit")
+    if size == 0:
+        raise UploadRejected(400, "Image is empty")
+    file.file.seek(0)
+    return file.file
+
+
+async def spool_request_body(request: Request, max_bytes: int = MAX_IMAGE_BYTES,
+                             hasher: Optional[Any] = None) -> BinaryIO:
+    """Copy a raw image request body chunk by chunk into a memory-capped spool file.
+
+    Stops reading as soon as the body passes `max_bytes`. Each chunk is also fed
+    to `hasher` (a hashlib object) when one is given.
+    """
+    _check_content_type(request.headers.get("content-type"))
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise UploadRejected(413, f"Image exceeds the {max_bytes // (1024 * 1024)} MB limit")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(413, f"Image exceeds the {max_bytes // (1024 * 1024)} MB limit")
+            if hasher is not None:
+                hasher.update(chunk)
+            # Spilling to disk is blocking file I/O, so keep it off the event loop
+            await run_in_threadpool(spool.write, chunk)
+    except Exception:
+        spool.close()
+        raise
+    if size == 0:
+        spool.close()
+        raise UploadRejected(400, "Image is empty")
+    spool.seek(0)
+    return spool
+
+
+async def upload_image_async(image: BinaryIO, folder: str = "service_app", digest: Optional[str] = None,
+                             size: Optional[int] = None):
+    """Run the blocking hash and deduplicated upload in the threadpool; returns store_image's result"""
+    return await run_in_threadpool(store_image, image, folder, digest, size)
+
+
+class UploadSizeLimitMiddleware:
+    """Reject uploads whose declared Content-Length is over the limit before any body is read"""
+
+    def __init__(self, app, limits: Sequence[Tuple[str, int]] = UPLOAD_LIMITS):
+        self.app = app
+        self.limits = tuple(limits)
+
+    def _max_bytes(self, path: str) -> Optional[int]:
+        for prefix, max_bytes in self.limits:
+            if path.startswith(prefix):
+                return max_bytes
+        return None
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = None
+        if scope["type"] == "http" and scope["method"] in ("POST", "PUT"):
+            max_bytes = self._max_bytes(scope["path"])
+        if max_bytes is not None:
+            for name, value in scope["headers"]:
+                if name == b"content-length" and value.isdigit() and int(value) > max_bytes:
+                    response = JSONResponse({"detail": "Upload too large"}, status_code=413)
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
@@ -0,0 +1,86 @@
+"""Shared test setup.
+
+Tests that need MongoDB run against the server at TEST_MONGO_URL when it is set.
+It must be a replica set, because the ledger posts in transactions, and they use
+the MONGO_DB_NAME database (service_app_test by default), which they empty. Without
+TEST_MONGO_URL they run against mongomock, if installed. Its transactions cannot
+roll back, and checks that need a real server (query plans) are skipped.
+
+db.py connects when it is imported, so this package sets that up before any test
+module imports it.
+"""
+import os
+import unittest
+
+TEST_MONGO_URL = os.getenv("TEST_MONGO_URL")
+
+if TEST_MONGO_URL:
+    os.environ["MONGO_URL"] = TEST_MONGO_URL
+    os.environ.setdefault("MONGO_DB_NAME", "service_app_test")
+    MONGO_AVAILABLE = True
+else:
+    try:
+        import mongomock
+    except ImportError:
+        mongomock = None
+    MONGO_AVAILABLE = mongomock is not None
+
+    if mongomock:
+        import pymongo
+
+        class _Session:
+            """Stands in for a client session; the callback runs without a transaction"""
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def with_transaction(self, callback):
+                return callback(None)
+
+        mongomock.MongoClient.start_session = lambda self, **kwargs: _Session()
+        pymongo.MongoClient = mongomock.MongoClient
+
+requires_mongo = unittest.skipUnless(MONGO_AVAILABLE, "needs TEST_MONGO_URL or mongomock")
+requires_mongo_server = unittest.skipUnless(TEST_MONGO_URL, "needs a MongoDB server at TEST_MONGO_URL")
+
+
+def reset_database():
+    from db import db
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+
+
+class FindRecorder:
+    """Wraps a collection and keeps the cursors find() returns, so a test can explain them"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.cursors = []
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def find(self, *args, **kwargs):
+        cursor = self.collection.find(*args, **kwargs)
+        self.cursors.append(cursor)
+        return cursor
+
+
+def plan_stages(cursor) -> list:
+    """Every stage of the cursor's winning plan, outermost first"""
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    # Plans run by the slot-based engine nest the classic plan under queryPlan
+    pending = [plan.get("queryPlan", plan)]
+    stages = []
+    while pending:
+        stage = pending.pop(0)
+        stages.append(stage)
+        for value in stage.values():
+            if isinstance(value, dict) and "stage" in value:
+                pending.append(value)
+            elif isinstance(value, list):
+                pending.extend(item for item in value if isinstance(item, dict) and "stage" in item)
+    return stages
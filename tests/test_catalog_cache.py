@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+
+from bson import ObjectId
+
+from tests import requires_mongo, reset_database
+from db import services_collection
+from services import catalog_cache
+from services.catalog_cache import ServiceCatalogCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@requires_mongo
+class ServiceCatalogCacheTest(unittest.TestCase):
+    """Two caches stand for two workers sharing one database, with no change stream"""
+
+    def setUp(self):
+        reset_database()
+        self.clock = Clock()
+        patch = mock.patch.object(catalog_cache, "time", self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.service_id = services_collection.insert_one({"name": "Plumbing", "price": 100}).inserted_id
+        self.writer = ServiceCatalogCache(check_seconds=5)
+        self.reader = ServiceCatalogCache(check_seconds=5)
+
+    def change_price(self, price: float):
+        services_collection.update_one({"_id": self.service_id}, {"$set": {"price": price}})
+        self.writer.bump()
+
+    def price_seen_by(self, cache: ServiceCatalogCache) -> float:
+        return cache.get(self.service_id)["price"]
+
+    def test_writer_sees_its_own_change_at_once(self):
+        self.assertEqual(self.price_seen_by(self.writer), 100)
+        self.change_price(150)
+        self.assertEqual(self.price_seen_by(self.writer), 150)
+
+    def test_other_worker_catches_up_within_the_check_interval(self):
+        self.assertEqual(self.price_seen_by(self.reader), 100)
+        self.change_price(150)
+
+        self.clock.now += 4.9
+        self.assertEqual(self.price_seen_by(self.reader), 100)
+        self.clock.now += 0.2
+        self.assertEqual(self.price_seen_by(self.reader), 150)
+        self.assertEqual(self.reader.stats()["reloads"], 2)
+
+    def test_unchanged_version_does_not_reload(self):
+        self.price_seen_by(self.reader)
+        for _ in range(3):
+            self.clock.now += 10
+            self.price_seen_by(self.reader)
+        self.assertEqual(self.reader.stats()["reloads"], 1)
+
+    def test_counts_hits_and_misses(self):
+        for _ in range(3):
+            self.price_seen_by(self.reader)
+        self.assertIsNone(self.reader.get(ObjectId()))
+        self.assertIsNone(self.reader.get("not-an-id"))
+
+        # Created without a bump: a miss that loads it, then a hit
+        created = services_collection.insert_one({"name": "Tiling", "price": 80}).inserted_id
+        self.assertEqual(self.reader.get(created)["price"], 80)
+        self.assertEqual(self.reader.get(created)["price"], 80)
+
+        stats = self.reader.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (4, 3))
+        self.assertAlmostEqual(stats["hit_rate"], 4 / 7)
+        self.assertEqual(stats["size"], 2)
+
+    def test_returns_copies(self):
+        self.reader.get(self.service_id)["price"] = 1
+        self.assertEqual(self.price_seen_by(self.reader), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from tests import requires_mongo, reset_database
+from db import upload_intents_collection, users_collection
+from handlers import direct_upload_handler
+from handlers.direct_upload_handler import create_upload_intent, complete_upload
+from services.cloudinary_service import sign_upload_params, verify_upload_signature
+
+SECRET = "test-secret"
+
+
+class UploadSignatureTest(unittest.TestCase):
+    def test_round_trip(self):
+        signature = sign_upload_params({"public_id": "services/abc", "version": 1700000000}, SECRET)
+        self.assertTrue(verify_upload_signature("services/abc", 1700000000, signature, SECRET))
+        # Cloudinary sends the version back as a string
+        self.assertTrue(verify_upload_signature("services/abc", "1700000000", signature, SECRET))
+
+    def test_rejects_tampering(self):
+        signature = sign_upload_params({"public_id": "services/abc", "version": 1700000000}, SECRET)
+        self.assertFalse(verify_upload_signature("services/abd", 1700000000, signature, SECRET))
+        self.assertFalse(verify_upload_signature("services/abc", 1700000001, signature, SECRET))
+        self.assertFalse(verify_upload_signature("services/abc", 1700000000, signature[:-1] + "0", SECRET))
+        self.assertFalse(verify_upload_signature("services/abc", 1700000000, None, SECRET))
+        self.assertFalse(verify_upload_signature("services/abc", 1700000000, signature, "other-secret"))
+
+
+@requires_mongo
+class DirectUploadTest(unittest.TestCase):
+    def setUp(self):
+        reset_database()
+        self.user_id = users_collection.insert_one({"name": "Ada", "role": "user"}).inserted_id
+        intent = create_upload_intent({"_id": self.user_id, "role": "user"}, "profile",
+                                      api_secret=SECRET, api_key="key")
+        self.intent_id = intent["intent_id"]
+        self.fields = intent["fields"]
+        self.public_id = self.fields["public_id"]
+        self.version = 1700000000
+        resource = {"secure_url": f"https://res.cloudinary.com/demo/image/upload/{self.public_id}.jpg",
+                    "bytes": 1024, "format": "jpg"}
+        for patch in (mock.patch.object(direct_upload_handler, "get_image_resource", return_value=resource),
+                      mock.patch.object(direct_upload_handler, "delete_image")):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def complete(self, public_id=None, version=None, signature=None):
+        public_id = public_id or self.public_id
+        version = version or self.version
+        if signature is None:
+            # What Cloudinary signs on the upload response
+            signature = sign_upload_params({"public_id": public_id, "version": version}, SECRET)
+        return complete_upload(str(self.user_id), self.intent_id, public_id, version, signature, SECRET)
+
+    def test_intent_fields_carry_a_signature_over_the_upload_params(self):
+        params = {k: v for k, v in self.fields.items() if k not in ("api_key", "signature")}
+        self.assertEqual(self.fields["signature"], sign_upload_params(params, SECRET))
+        tampered = dict(params, timestamp=params["timestamp"] + 1)
+        self.assertNotEqual(self.fields["signature"], sign_upload_params(tampered, SECRET))
+
+    def test_completes_a_signed_upload_once(self):
+        result = self.complete()
+        self.assertEqual(result["public_id"], self.public_id)
+        self.assertEqual(users_collection.find_one({"_id": self.user_id})["profile_image"], result["url"])
+        self.assertEqual(self.complete(), {"error": "Upload not found"})
+
+    def test_rejects_another_public_id(self):
+        # Validly signed, but not the asset this intent was issued for
+        self.assertEqual(self.complete(public_id="profile_images/someone-else"),
+                         {"error": "Invalid upload signature"})
+
+    def test_rejects_a_tampered_version(self):
+        signature = sign_upload_params({"public_id": self.public_id, "version": self.version}, SECRET)
+        self.assertEqual(self.complete(version=self.version + 1, signature=signature),
+                         {"error": "Invalid upload signature"})
+
+    def test_rejects_a_tampered_signature(self):
+        signature = sign_upload_params({"public_id": self.public_id, "version": self.version}, "other-secret")
+        self.assertEqual(self.complete(signature=signature), {"error": "Invalid upload signature"})
+        self.assertEqual(self.complete(signature=""), {"error": "Invalid upload signature"})
+        self.assertNotIn("profile_image", users_collection.find_one({"_id": self.user_id}))
+
+    def test_rejects_an_expired_intent(self):
+        upload_intents_collection.update_one({}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+        self.assertEqual(self.complete(), {"error": "Upload expired"})
+        self.assertNotIn("profile_image", users_collection.find_one({"_id": self.user_id}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+
+from services import monnify_service
+from services.monnify_service import MonnifyClient, AsyncMonnifyClient, MONNIFY_BASE_URL
+
+STATUS_URL = f"{MONNIFY_BASE_URL}/transaction/status"
+
+
+class MonnifyServer:
+    """Stands in for Monnify behind an httpx.MockTransport.
+
+    `failures` lists the status codes (or "drop" for a connection error) the
+    next API calls get before one succeeds.
+    """
+
+    def __init__(self, expires_in=3600, failures=()):
+        self.expires_in = expires_in
+        self.failures = list(failures)
+        self.logins = 0
+        self.calls = 0
+        self.tokens_seen = []
+
+    def login_body(self) -> dict:
+        body = {"accessToken": f"token-{self.logins}"}
+        if self.expires_in is not None:
+            body["expiresIn"] = self.expires_in
+        return {"requestSuccessful": True, "responseBody": body}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/auth/login"):
+            self.logins += 1
+            return httpx.Response(200, json=self.login_body())
+
+        self.calls += 1
+        self.tokens_seen.append(request.headers["Authorization"])
+        if self.failures:
+            failure = self.failures.pop(0)
+            if failure == "drop":
+                raise httpx.ConnectError("connection dropped", request=request)
+            return httpx.Response(failure, json={"requestSuccessful": False})
+        return httpx.Response(200, json={"requestSuccessful": True, "responseBody": {"paymentStatus": "PAID"}})
+
+    async def handle_async(self, request: httpx.Request) -> httpx.Response:
+        return self.handle(request)
+
+
+@mock.patch.object(monnify_service, "MONNIFY_RETRY_BASE_SECONDS", 0)
+class MonnifyClientTest(unittest.TestCase):
+    def client(self, server: MonnifyServer) -> MonnifyClient:
+        client = MonnifyClient(transport=httpx.MockTransport(server.handle))
+        self.addCleanup(client.close)
+        return client
+
+    def test_token_is_reused_across_calls(self):
+        server = MonnifyServer()
+        client = self.client(server)
+        for _ in range(5):
+            self.assertEqual(client.request("GET", STATUS_URL).status_code, 200)
+        self.assertEqual(server.logins, 1)
+        self.assertEqual(set(server.tokens_seen), {"Bearer token-1"})
+
+    def test_token_is_refreshed_once_expired(self):
+        server = MonnifyServer(expires_in=120)
+        client = self.client(server)
+        with mock.patch.object(monnify_service.time, "monotonic", return_value=1000.0):
+            client.request("GET", STATUS_URL)
+            client.request("GET", STATUS_URL)
+        # 120 s lifetime minus the 60 s refresh margin
+        with mock.patch.object(monnify_service.time, "monotonic", return_value=1061.0):
+            client.request("GET", STATUS_URL)
+        self.assertEqual(server.logins, 2)
+
+    def test_missing_expires_in_falls_back_to_default_ttl(self):
+        server = MonnifyServer(expires_in=None)
+        client = self.client(server)
+        for _ in range(3):
+            client.request("GET", STATUS_URL)
+        self.assertEqual(server.logins, 1)
+
+    def test_retries_transient_failures(self):
+        server = MonnifyServer(failures=[503, "drop", 429])
+        response = self.client(server).request("GET", STATUS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.calls, 4)
+        self.assertEqual(server.logins, 1)
+
+    def test_gives_up_after_max_retries(self):
+        server = MonnifyServer(failures=[502] * 10)
+        response = self.client(server).request("GET", STATUS_URL, max_retries=2)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(server.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        server = MonnifyServer(failures=[400])
+        response = self.client(server).request("POST", STATUS_URL, json={})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(server.calls, 1)
+
+    def test_rejected_token_is_replaced(self):
+        server = MonnifyServer(failures=[401])
+        response = self.client(server).request("GET", STATUS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.logins, 2)
+        self.assertEqual(server.tokens_seen, ["Bearer token-1", "Bearer token-2"])
+
+
+@mock.patch.object(monnify_service, "MONNIFY_RETRY_BASE_SECONDS", 0)
+class AsyncMonnifyClientTest(unittest.TestCase):
+    def run_calls(self, server: MonnifyServer, count: int) -> list:
+        async def calls():
+            client = AsyncMonnifyClient(transport=httpx.MockTransport(server.handle_async))
+            try:
+                return await asyncio.gather(*[client.verify_transaction(f"ref-{i}") for i in range(count)])
+            finally:
+                await client.aclose()
+        return asyncio.run(calls())
+
+    def test_concurrent_calls_share_one_login(self):
+        server = MonnifyServer()
+        results = self.run_calls(server, 20)
+        self.assertTrue(all(result["requestSuccessful"] for result in results))
+        self.assertEqual(server.logins, 1)
+
+    def test_retries_transient_failures(self):
+        server = MonnifyServer(failures=[500, "drop"])
+        results = self.run_calls(server, 1)
+        self.assertTrue(results[0]["requestSuccessful"])
+        self.assertEqual(server.calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
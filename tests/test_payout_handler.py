@@ -0,0 +1,215 @@
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import httpx
+
+from tests import requires_mongo, reset_database
+from db import transactions_collection, payout_batches_collection
+from handlers.ledger_handler import (
+    post_journal, get_account_balance, FUNDING_ACCOUNT, PAYOUTS_ACCOUNT, PAYOUTS_PENDING_ACCOUNT
+)
+from handlers.payout_handler import claim_payout_batch, run_payouts
+from handlers.wallet_handler import request_withdrawal, approve_withdrawal
+from services import monnify_service
+
+
+class DisbursementServer:
+    """Stands in for Monnify's bulk disbursement API behind an httpx.MockTransport.
+
+    Transfers succeed unless their reference is in `failed`. `submit_failures`
+    lists what the next batch submissions get: "lost" records the batch but
+    drops the connection before the response, and a status code rejects it
+    without recording it.
+    """
+
+    def __init__(self, failed=(), submit_failures=()):
+        self.failed = set(failed)
+        self.submit_failures = list(submit_failures)
+        self.batches = {}
+        self.submissions = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/auth/login"):
+            return httpx.Response(200, json={"requestSuccessful": True,
+                                             "responseBody": {"accessToken": "token", "expiresIn": 3600}})
+
+        if request.method == "POST" and path.endswith("/batch"):
+            self.submissions += 1
+            payload = json.loads(request.content)
+            reference = payload["batchReference"]
+            if reference in self.batches:
+                return httpx.Response(400, json={"requestSuccessful": False,
+                                                 "responseMessage": "Duplicate batch reference"})
+            failure = self.submit_failures.pop(0) if self.submit_failures else None
+            if failure == "lost":
+                self.batches[reference] = payload["transactionList"]
+                raise httpx.ConnectError("connection dropped", request=request)
+            if failure:
+                return httpx.Response(failure, json={"requestSuccessful": False})
+            self.batches[reference] = payload["transactionList"]
+            return httpx.Response(200, json={"requestSuccessful": True,
+                                             "responseBody": {"batchStatus": "AWAITING_PROCESSING"}})
+
+        if request.method == "GET" and path.endswith("/transactions"):
+            reference = path.split("/")[-2]
+            content = [
+                {"reference": transfer["reference"],
+                 "status": "FAILED" if transfer["reference"] in self.failed else "SUCCESS",
+                 "transactionReference": f"MFDS-{transfer['reference']}"}
+                for transfer in self.batches.get(reference, [])
+            ]
+            return httpx.Response(200, json={"requestSuccessful": True,
+                                             "responseBody": {"content": content, "last": True}})
+
+        return httpx.Response(404, json={"requestSuccessful": False})
+
+    def transfers_paid(self, reference: str) -> int:
+        return sum(transfer["reference"] == reference
+                   for transfers in self.batches.values() for transfer in transfers)
+
+
+class PayoutTestCase(unittest.TestCase):
+    def setUp(self):
+        reset_database()
+        self.server = DisbursementServer()
+        client = monnify_service.MonnifyClient(transport=httpx.MockTransport(lambda r: self.server.handle(r)))
+        self.addCleanup(client.close)
+        for patch in (mock.patch.object(monnify_service, "monnify_client", client),
+                      mock.patch.object(monnify_service, "MONNIFY_RETRY_BASE_SECONDS", 0)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def approved_withdrawal(self, provider_id: str, amount: float):
+        post_journal(f"fund:{provider_id}", [(provider_id, 100), (FUNDING_ACCOUNT, -100)])
+        request_withdrawal(provider_id, amount, {"bank_code": "058", "account_number": "0123456789"})
+        withdrawal = transactions_collection.find_one({"user_id": provider_id, "transaction_type": "withdrawal"})
+        self.assertEqual(approve_withdrawal(str(withdrawal["_id"])), {"message": "Withdrawal approved"})
+        return withdrawal["_id"]
+
+    def status(self, withdrawal_id) -> str:
+        return transactions_collection.find_one({"_id": withdrawal_id})["status"]
+
+    @staticmethod
+    def balance(account: str) -> float:
+        return get_account_balance(account)
+
+    def assert_settled(self, provider_id: str, withdrawal_id, amount: float):
+        self.assertEqual(self.status(withdrawal_id), "completed")
+        self.assertEqual(self.balance(provider_id), 100 - amount)
+        self.assertEqual(self.balance(PAYOUTS_PENDING_ACCOUNT), 0)
+        self.assertEqual(self.server.transfers_paid(str(withdrawal_id)), 1)
+
+
+@requires_mongo
+class PayoutPipelineTest(PayoutTestCase):
+    def test_claim_submit_reconcile(self):
+        paid = self.approved_withdrawal("provider-a", 40)
+        refused = self.approved_withdrawal("provider-b", 30)
+        self.server.failed.add(str(refused))
+        self.assertEqual(self.balance(PAYOUTS_PENDING_ACCOUNT), 70)
+
+        report = run_payouts()
+
+        self.assertEqual(report["submitted"][0]["submitted"], 2)
+        self.assertEqual((report["reconciled"][0]["settled"], report["reconciled"][0]["released"]), (1, 1))
+        self.assertEqual(self.server.submissions, 1)
+        self.assert_settled("provider-a", paid, 40)
+        self.assertEqual(self.status(refused), "failed")
+        self.assertEqual(self.balance("provider-b"), 100)
+        self.assertEqual(self.balance(PAYOUTS_ACCOUNT), 40)
+        self.assertEqual(run_payouts(), {"submitted": [], "reconciled": []})
+
+    def test_lost_submission_is_not_sent_twice(self):
+        withdrawal_id = self.approved_withdrawal("provider-a", 40)
+        self.server.submit_failures = ["lost"]
+
+        report = run_payouts()
+        self.assertIn("error", report["submitted"][0])
+        self.assertEqual(payout_batches_collection.find_one()["status"], "submit_failed")
+
+        # The retry probes Monnify, finds the batch and does not submit it again
+        run_payouts()
+        self.assertEqual(self.server.submissions, 2)
+        self.assertEqual(len(self.server.batches), 1)
+        self.assert_settled("provider-a", withdrawal_id, 40)
+
+    def test_rejected_submission_is_resubmitted(self):
+        withdrawal_id = self.approved_withdrawal("provider-a", 40)
+        self.server.submit_failures = [400]
+
+        self.assertIn("error", run_payouts()["submitted"][0])
+        self.assertEqual(self.status(withdrawal_id), "processing")
+        run_payouts()
+        self.assert_settled("provider-a", withdrawal_id, 40)
+
+
+@requires_mongo
+@mock.patch("handlers.payout_handler.PAYOUT_STALE_AFTER_MINUTES", -1)
+class PayoutCrashRecoveryTest(PayoutTestCase):
+    """Each test leaves state as a crash at one step would, then lets the next run recover it.
+
+    Work in progress counts as stale straight away, as if the crash were long ago.
+    """
+
+    def test_recovers_a_reservation(self):
+        post_journal("fund:provider-a", [("provider-a", 100), (FUNDING_ACCOUNT, -100)])
+        request_withdrawal("provider-a", 40, {"bank_code": "058", "account_number": "0123456789"})
+        withdrawal = transactions_collection.find_one({"transaction_type": "withdrawal"})
+        # Died after posting the reservation, before marking the withdrawal approved
+        transactions_collection.update_one({"_id": withdrawal["_id"]},
+                                           {"$set": {"status": "reserving", "reserving_at": datetime.utcnow()}})
+        post_journal(f"{withdrawal['_id']}:reserve",
+                     [("provider-a", -40), (PAYOUTS_PENDING_ACCOUNT, 40)], debit_account="provider-a")
+
+        run_payouts()
+        self.assert_settled("provider-a", withdrawal["_id"], 40)
+
+    def test_recovers_a_claiming_batch(self):
+        withdrawal_id = self.approved_withdrawal("provider-a", 40)
+        # Died after moving the withdrawal into the batch, before recording the batch's contents
+        payout_batches_collection.insert_one({"batch_reference": "PAYOUT_crashed", "withdrawal_ids": [],
+                                              "total_amount": 0, "status": "claiming",
+                                              "created_at": datetime.utcnow()})
+        transactions_collection.update_one({"_id": withdrawal_id},
+                                           {"$set": {"status": "processing", "payout_batch": "PAYOUT_crashed"}})
+
+        run_payouts()
+        self.assertEqual(list(self.server.batches), ["PAYOUT_crashed"])
+        self.assert_settled("provider-a", withdrawal_id, 40)
+
+    def test_recovers_a_claimed_batch_monnify_already_has(self):
+        withdrawal_id = self.approved_withdrawal("provider-a", 40)
+        # Died after Monnify accepted the batch, before marking it submitted
+        batch = claim_payout_batch()
+        monnify_service.initiate_bulk_disbursement(batch["batch_reference"], [{
+            "reference": str(withdrawal_id), "amount": 40, "narration": "payout",
+            "destinationBankCode": "058", "destinationAccountNumber": "0123456789"
+        }], "payout")
+
+        run_payouts()
+        self.assertEqual(self.server.submissions, 1)
+        self.assertEqual(payout_batches_collection.find_one()["status"], "reconciled")
+        self.assert_settled("provider-a", withdrawal_id, 40)
+
+    def test_recovers_settlement_and_release(self):
+        paid = self.approved_withdrawal("provider-a", 40)
+        refused = self.approved_withdrawal("provider-b", 30)
+        # Died after claiming the outcome of each withdrawal, before posting its journal
+        transactions_collection.update_one({"_id": paid}, {"$set": {"status": "settling",
+                                                                    "settling_at": datetime.utcnow()}})
+        transactions_collection.update_one({"_id": refused}, {"$set": {"status": "releasing",
+                                                                       "releasing_at": datetime.utcnow()}})
+
+        run_payouts()
+        self.assertEqual(self.status(paid), "completed")
+        self.assertEqual(self.status(refused), "failed")
+        self.assertEqual(self.balance("provider-a"), 60)
+        self.assertEqual(self.balance("provider-b"), 100)
+        self.assertEqual(self.balance(PAYOUTS_PENDING_ACCOUNT), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+from tests import requires_mongo_server, reset_database, FindRecorder, plan_stages
+from db import services_collection, ensure_indexes
+from handlers import service_handler
+from handlers.service_handler import search_services
+
+TRADES = ["Car Wash", "Carpentry", "Cleaning", "Plumbing", "Painting", "Tiling", "Roofing", "Gardening"]
+
+
+@requires_mongo_server
+class ServiceSearchPlanTest(unittest.TestCase):
+    """Each search_services filter is answered by an index scan, never a collection scan"""
+
+    @classmethod
+    def setUpClass(cls):
+        reset_database()
+        ensure_indexes()
+        names = [f"{TRADES[i % len(TRADES)]} {i}" for i in range(2000)]
+        services_collection.insert_many([
+            {"name": name, "name_lower": name.lower(), "description": f"Professional {name.lower()} service",
+             "price": 10 + i % 300}
+            for i, name in enumerate(names)
+        ])
+
+    def setUp(self):
+        self.recorder = FindRecorder(services_collection)
+        patch = mock.patch.object(service_handler, "services_collection", self.recorder)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def index_scans(self, **search) -> list:
+        services, _ = search_services(**search)
+        self.assertTrue(services)
+        stages = plan_stages(self.recorder.cursors[-1])
+        self.assertNotIn("COLLSCAN", [stage["stage"] for stage in stages])
+        scans = [stage for stage in stages if stage["stage"] == "IXSCAN"]
+        self.assertTrue(scans)
+        return scans
+
+    def test_text_search_uses_the_text_index(self):
+        scans = self.index_scans(q="plumbing")
+        self.assertEqual({scan["indexName"] for scan in scans}, {"service_text"})
+
+    def test_prefix_is_a_bounded_name_scan(self):
+        scan, = self.index_scans(prefix="Car W", limit=5)
+        self.assertEqual(scan["indexBounds"]["name_lower"], ['["car w", "car x")'])
+
+        # The next page seeks within the same bounds
+        _, cursor = search_services(prefix="Car W", limit=5)
+        for scan in self.index_scans(prefix="Car W", limit=5, cursor=cursor):
+            self.assertIn("name_lower", scan["keyPattern"])
+            self.assertNotIn("MinKey", str(scan["indexBounds"]["name_lower"]))
+
+    def test_price_range_is_a_bounded_price_scan(self):
+        scan, = self.index_scans(min_price=50, max_price=150, sort="price_asc")
+        self.assertEqual(scan["keyPattern"], {"price": 1, "_id": 1})
+        self.assertEqual(scan["indexBounds"]["price"], ["[50, 150]"])
+
+        scan, = self.index_scans(min_price=250, sort="price_desc")
+        self.assertEqual((scan["keyPattern"], scan["direction"]), ({"price": 1, "_id": 1}, "backward"))
+        self.assertNotIn("-inf", str(scan["indexBounds"]["price"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+from tests import requires_mongo_server, reset_database, FindRecorder, plan_stages
+from db import users_collection, ensure_indexes
+from handlers import admin_handler
+from handlers.admin_handler import search_users
+
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Linus", "Margaret", "Dennis"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Torvalds", "Hamilton", "Ritchie"]
+
+
+@requires_mongo_server
+class UserSearchPlanTest(unittest.TestCase):
+    """Each search field's anchored prefix becomes a tight range on that field's index.
+
+    The prefixes are run through re.escape, so these include the punctuation it
+    backslashes: Mongo must still read it as part of the literal prefix.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        reset_database()
+        ensure_indexes()
+        users = []
+        for i in range(3000):
+            first, last = FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]
+            email = f"{first}.{last}+{i}@example.com"
+            phone = f"+234 80{i % 10} {i:07d}"
+            users.append({
+                "name": f"{first} {last}", "name_lower": f"{first} {last}".lower(),
+                "email": email, "email_lower": email.lower(),
+                "phone_number": phone, "phone_digits": "".join(ch for ch in phone if ch.isdigit()),
+                "role": "provider" if i % 2 else "user"
+            })
+        users_collection.insert_many(users)
+
+    def setUp(self):
+        self.recorder = FindRecorder(users_collection)
+        patch = mock.patch.object(admin_handler, "users_collection", self.recorder)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def assert_bounded_scan(self, q: str, field: str, bounds: str, **options):
+        users, _ = search_users(q, limit=10, **options)
+        self.assertTrue(users)
+        stages = plan_stages(self.recorder.cursors[-1])
+        self.assertNotIn("COLLSCAN", [stage["stage"] for stage in stages])
+        scan, = [stage for stage in stages if stage["stage"] == "IXSCAN"]
+        self.assertEqual(scan["keyPattern"], {field: 1, "_id": 1})
+        self.assertEqual(scan["indexBounds"][field], [bounds])
+
+    def test_email_prefix(self):
+        self.assert_bounded_scan("Ada.Lovelace+", "email_lower", '["ada.lovelace+", "ada.lovelace,")', by="email")
+
+    def test_name_prefix(self):
+        self.assert_bounded_scan("  Ada Lov", "name_lower", '["ada lov", "ada low")')
+
+    def test_phone_prefix(self):
+        self.assert_bounded_scan("+234 803", "phone_digits", '["234803", "234804")')
+
+    def test_filters_do_not_replace_the_prefix_scan(self):
+        self.assert_bounded_scan("alan", "name_lower", '["alan", "alao")', role="provider")
+
+
+if __name__ == "__main__":
+    unittest.main()